@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Per-request SQL/graph/search/render timings: logs, Server-Timing, api/stats/
+    'airport.instrumentation.RouteInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +58,8 @@ ROOT_URLCONF = 'Flight_route_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times rendering for the instrumentation middleware
+        'BACKEND': 'airport.instrumentation.InstrumentedTemplates',
         # 👇 Add global templates directory
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
@@ -76,11 +79,116 @@ WSGI_APPLICATION = 'Flight_route_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Page cache, memory-mapped reads and fewer fsyncs for every connection.
+# synchronous=NORMAL is durable against application crashes in WAL mode; a
+# power loss can drop the last transactions. Check the effect with
+# `manage.py benchmark_concurrency`.
+SQLITE_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL; PRAGMA mmap_size=268435456; '
+    'PRAGMA cache_size=-65536; PRAGMA temp_store=MEMORY'
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Keep connections, with their page cache, between requests
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL lets readers carry on while a write commits
+            'init_command': 'PRAGMA journal_mode=WAL; ' + SQLITE_PRAGMAS,
+            # Writers take the lock when the transaction starts, so they
+            # queue for up to timeout seconds instead of failing mid-way
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    },
+    # The same file opened read-only, for the route and list views (see
+    # airport/routers.py); point it at a replica server to move reads off
+    # the primary.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': (BASE_DIR / 'db.sqlite3').as_uri() + '?mode=ro',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['airport.routers.ReadReplicaRouter']
+# Alias the read-only views read from; None reads everything from 'default'
+ROUTE_READ_DATABASE = 'replica'
+
+
+# Precomputed all-pairs route matrix, built with `manage.py build_route_matrix`.
+# When set, duration_between searches read distances from this file instead
+# of running Dijkstra; leave as None to always search the live graph.
+ROUTE_MATRIX_PATH = None
+
+# Binary snapshot of the route graph, rewritten after every airport edit and by
+# `manage.py write_route_snapshot`. Workers memory-map it instead of reading
+# the whole Airport table; leave as None to always build from the database.
+ROUTE_GRAPH_SNAPSHOT_PATH = None
+
+# Workers notice timetable edits, and route edits when there is no snapshot,
+# made by other processes through shared edit counts in the database (see
+# airport/versions.py), read at most once per this many seconds; 0 reads
+# them on every lookup.
+ROUTE_VERSION_CHECK_INTERVAL = 1
+
+# Memory budget (bytes) for the per-process LRU cache of shortest-path trees
+# used by shortest_path and duration_between searches.
+ROUTE_TREE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Processes searching routes for the async views under ASGI; None uses one
+# per CPU, 0 runs searches on Django's sync thread instead of a pool.
+ROUTE_WORKER_PROCESSES = None
+
+# Minimum minutes between arriving on one scheduled departure and leaving on
+# the next in earliest-arrival searches (see airport/schedules.py).
+SCHEDULE_MIN_TRANSFER = 0
+
+# Route results (shortest-path trees, durations) shared between workers, see
+# airport/route_cache.py. Local memory is per process; to share results point
+# the 'routes' cache at a file or Redis backend, e.g.
+#   {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#    'LOCATION': '/var/tmp/flight-routes'}
+#   {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#    'LOCATION': 'redis://127.0.0.1:6379'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'routes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'routes',
+    },
+}
+# Shortest-path trees are only stored in this cache when it is shared (not
+# local memory or dummy); a tree can take megabytes, so size a shared
+# backend for them. In local memory they would duplicate the per-process
+# tree cache without counting towards ROUTE_TREE_CACHE_BYTES.
+ROUTE_CACHE_ALIAS = 'routes'
+# Seconds a shared route result lives; edits make new keys immediately
+ROUTE_CACHE_TIMEOUT = 60 * 60
+
+# One JSON line per request with its SQL, graph, search and render metrics
+# (see airport/instrumentation.py) is logged at INFO; lower the level to
+# INFO to turn it on.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'airport.requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
 }
 
 
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AirportConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'airport'
+
+    def ready(self):
+        # Register the signal handlers that keep the route graph fresh
+        from . import signals  # noqa: F401
+
+        # Map the precomputed route matrix once per worker, if configured
+        from .matrix import load_matrix
+        load_matrix()
@@ -0,0 +1,157 @@
+"""
+Jump-pointer (binary lifting) index over the left and right airport chains.
+
+jumps[direction][k][i] is the airport reached from airport i after 2**k
+steps in that direction, so the nth node is found in O(log n) array reads
+instead of n ORM queries. Chains that loop are detected when the index is
+built, and steps past the entry of a loop wrap around it instead of being
+walked. The index is rebuilt lazily whenever the route graph version moves.
+"""
+import threading
+from array import array
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import FilteredRelation, Q
+
+from .graph import graph_version
+from .models import Airport
+
+
+DIRECTIONS = ('left', 'right')
+
+_lock = threading.Lock()
+_index = None
+
+
+def _analyse(successors):
+    """
+    For a successor array (-1 = end of chain) return (depth, tail, cycle):
+    depth[i] is how many steps exist from i before the chain ends, or -1
+    when the chain runs into a loop; tail[i] is the number of steps before
+    the loop and cycle[i] the loop length.
+    """
+    n = len(successors)
+    depth = array('q', [-1]) * n
+    tail = array('q', bytes(8 * n))
+    cycle = array('q', bytes(8 * n))
+    state = bytearray(n)    # 0 = new, 1 = on the current walk, 2 = done
+
+    for start in range(n):
+        if state[start]:
+            continue
+        path = []
+        node = start
+        while node != -1 and state[node] == 0:
+            state[node] = 1
+            path.append(node)
+            node = successors[node]
+
+        if node != -1 and state[node] == 1:
+            # The walk closed a new loop starting at node
+            loop_start = path.index(node)
+            length = len(path) - loop_start
+            for member in path[loop_start:]:
+                cycle[member] = length
+                state[member] = 2
+            path = path[:loop_start]
+
+        # Fill in the rest of the walk from its end backwards
+        for member in reversed(path):
+            following = successors[member]
+            if following == -1:
+                depth[member] = 0
+            elif depth[following] >= 0:
+                depth[member] = depth[following] + 1
+            else:
+                tail[member] = tail[following] + 1
+                cycle[member] = cycle[following]
+            state[member] = 2
+
+    return depth, tail, cycle
+
+
+class ChainIndex:
+    def __init__(self, rows):
+        """rows: (id, code, left_id, right_id) for every airport."""
+        rows = list(rows)
+        position = {pk: i for i, (pk, _, _, _) in enumerate(rows)}
+        self.codes = [code for _, code, _, _ in rows]
+        self.index = {}
+        for i, code in enumerate(self.codes):
+            self.index.setdefault(code.upper(), i)
+
+        n = len(rows)
+        levels = max(1, n.bit_length())
+        self.jumps = {}
+        self.depth = {}
+        self.tail = {}
+        self.cycle = {}
+        for column, direction in ((2, 'left'), (3, 'right')):
+            successors = array('i', [position.get(row[column], -1) for row in rows])
+            table = [successors]
+            for _ in range(1, levels):
+                previous = table[-1]
+                table.append(array('i', [
+                    previous[j] if j != -1 else -1 for j in previous
+                ]))
+            self.jumps[direction] = table
+            self.depth[direction], self.tail[direction], self.cycle[direction] = _analyse(successors)
+
+    def nth(self, code, direction, n):
+        """
+        Return (airport code, None) for the nth node in direction from code,
+        or (None, step) where step is the first step with no next airport.
+        Raises KeyError for an unknown code.
+        """
+        node = self.index[code.upper()]
+        depth = self.depth[direction][node]
+        if depth >= 0:
+            if n > depth:
+                return None, depth + 1
+        else:
+            # Past the loop entry every full lap returns to the same airport
+            tail, cycle = self.tail[direction][node], self.cycle[direction][node]
+            if n >= tail:
+                n = tail + (n - tail) % cycle
+
+        table = self.jumps[direction]
+        k = 0
+        while n:
+            if n & 1:
+                node = table[k][node]
+            n >>= 1
+            k += 1
+        return self.codes[node], None
+
+    def cycle_length(self, code, direction):
+        """Length of the loop the chain from code runs into, or 0 if it ends."""
+        node = self.index[code.upper()]
+        return self.cycle[direction][node] if self.depth[direction][node] < 0 else 0
+
+
+def build_chain_index():
+    # Each slot's route is joined on its own, so one query gives both links.
+    # Always read from the primary (see routers.py)
+    rows = (
+        Airport.objects.using(DEFAULT_DB_ALIAS)
+        .annotate(**{
+            f'{direction}_route': FilteredRelation('routes', condition=Q(routes__slot=direction))
+            for direction in DIRECTIONS
+        })
+        .order_by('pk')
+        .values_list('id', 'code', 'left_route__destination_id', 'right_route__destination_id')
+    )
+    return ChainIndex(rows.iterator(chunk_size=2000))
+
+
+def get_chain_index():
+    """Return the index for the current graph version, rebuilding if needed."""
+    global _index
+    version = graph_version()
+    index = _index
+    if index is None or index[0] != version:
+        with _lock:
+            if _index is None or _index[0] != version:
+                _index = (version, build_chain_index())
+            index = _index
+    return index[1]
@@ -0,0 +1,137 @@
+"""
+Connected components of the route network (union-find).
+
+Two airports in different components have no route between them, so
+find_duration_between can reject the pair in near O(1) instead of letting
+the search settle the whole source component first.
+
+The index is built from the route graph and tagged with its version. Saves
+that only add airports or links (add_next_airport filling an empty side,
+new airports) are merged into the index as they happen, and once they
+commit the index is carried over to the graph version they produce.
+Anything that may remove a link (deletes, replaced links, renames, bulk
+imports, another worker's snapshot) leaves the tag behind, so the index is
+rebuilt on next use.
+"""
+import threading
+
+from django.db import transaction
+
+from .graph import get_graph, graph_version
+
+
+# Component sizes listed on the admin dashboard
+TOP_COMPONENTS = 10
+
+_lock = threading.Lock()
+_index = None
+
+
+class ComponentIndex:
+    def __init__(self, codes=()):
+        self.version = None
+        self.ids = {}
+        self.parent = []
+        self.size = []
+        for code in codes:
+            self.add(code)
+
+    @classmethod
+    def from_graph(cls, graph):
+        index = cls(graph.codes)
+        offsets, targets = graph.offsets, graph.targets
+        for node in range(len(graph)):
+            for e in range(offsets[node], offsets[node + 1]):
+                if targets[e] > node:
+                    index._union(node, targets[e])
+        index.version = graph.version
+        return index
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, code):
+        # Codes are matched as the graph stores them, uppercased
+        code = code.upper()
+        if code not in self.ids:
+            self.ids[code] = len(self.parent)
+            self.parent.append(len(self.parent))
+            self.size.append(1)
+
+    def _find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            # Path halving keeps the trees flat
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def union(self, code, other):
+        self.add(code)
+        self.add(other)
+        self._union(self.ids[code.upper()], self.ids[other.upper()])
+
+    def connected(self, code, other):
+        """False only when no route can exist; unknown codes count as connected."""
+        try:
+            return self._find(self.ids[code.upper()]) == self._find(self.ids[other.upper()])
+        except KeyError:
+            return True
+
+    def stats(self, top=TOP_COMPONENTS):
+        sizes = sorted((self.size[i] for i in range(len(self)) if self.parent[i] == i),
+                       reverse=True)
+        return {
+            'airports': len(self),
+            'components': len(sizes),
+            'isolated': sum(1 for size in sizes if size == 1),
+            'largest': sizes[:top],
+        }
+
+
+def get_component_index():
+    """Return the index for the current graph, rebuilding it if needed."""
+    global _index
+    index = _index
+    if index is None or index.version != graph_version():
+        graph = get_graph()
+        with _lock:
+            if _index is None or _index.version != graph.version:
+                _index = ComponentIndex.from_graph(graph)
+            index = _index
+    return index
+
+
+def links_added(version, codes, links):
+    """
+    Merge a save that only added airports and links into the index.
+    version is the graph version before the save; codes are the airports
+    it created and links the (code, code) pairs it joined.
+    """
+    with _lock:
+        index = _index
+        if index is None or index.version != version:
+            return
+        # Extra unions from a save that is rolled back only cost a search
+        for code in codes:
+            index.add(code)
+        for code, other in links:
+            index.union(code, other)
+        expected = graph_version()
+
+    def carry_over():
+        # Follow the version bump graph_changed makes on commit
+        with _lock:
+            if _index is index and index.version == version and graph_version() - expected <= 1:
+                index.version = graph_version()
+
+    transaction.on_commit(carry_over)
@@ -0,0 +1,220 @@
+"""
+Streaming export of the route network as NDJSON, CSV or a columnar binary
+file, optionally gzipped on the fly.
+
+Rows are read in keyset chunks (WHERE pk > last ORDER BY pk LIMIT n), each
+an indexed range query, and every chunk is encoded and handed on before the
+next is read, so memory stays constant however large the network is. Rows
+written while an export runs may or may not be included.
+
+The columnar format is laid out like a minimal Parquet file, one row group
+per chunk:
+
+    b'FRSCOL1\\n'  uint32 schema length  schema JSON
+    per row group:  uint32 row count, then per column
+                    uint32 block length  block
+    uint32 0        end of file
+
+All integers are little-endian. A utf8 block holds n + 1 uint32 offsets
+followed by the UTF-8 data, f64 and i64 blocks hold n 8-byte values, and
+the block of a nullable column starts with n validity bytes (1 = present).
+read_columnar() reads it back.
+"""
+import csv
+import io
+import json
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+
+from .models import Airport, Departure, Route
+
+
+CHUNK_SIZE = 5000
+FORMATS = ('ndjson', 'csv', 'columnar')
+EXTENSIONS = {'ndjson': 'ndjson', 'csv': 'csv', 'columnar': 'frcol'}
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'columnar': 'application/octet-stream',
+}
+
+MAGIC = b'FRSCOL1\n'
+_LENGTH = struct.Struct('<I')
+
+# name, type ('utf8', 'f64' or 'i64') and whether the column may be null
+Column = namedtuple('Column', ['name', 'type', 'nullable'])
+# queryset() returns the rows ordered by pk; the first field of each row is
+# the pk, and convert() turns the remaining fields into the exported row
+ExportTable = namedtuple('ExportTable', ['queryset', 'columns', 'convert'])
+
+
+def _departure_row(origin, destination, reverse, departs):
+    return (destination, origin, departs) if reverse else (origin, destination, departs)
+
+
+TABLES = {
+    'airports': ExportTable(
+        lambda: Airport.objects.values_list('pk', 'code'),
+        [Column('code', 'utf8', False)],
+        None,
+    ),
+    'routes': ExportTable(
+        lambda: Route.objects.values_list('pk', 'origin__code', 'destination__code', 'duration', 'slot'),
+        [Column('origin', 'utf8', False), Column('destination', 'utf8', False),
+         Column('duration', 'f64', False), Column('slot', 'utf8', True)],
+        None,
+    ),
+    'departures': ExportTable(
+        lambda: Departure.objects.values_list(
+            'pk', 'route__origin__code', 'route__destination__code', 'reverse', 'departs'),
+        [Column('origin', 'utf8', False), Column('destination', 'utf8', False),
+         Column('departs', 'i64', False)],
+        _departure_row,
+    ),
+}
+
+
+def row_chunks(table, chunk_size=CHUNK_SIZE):
+    """Yield lists of up to chunk_size rows of a TABLES entry, in pk order."""
+    last = 0
+    while True:
+        rows = list(table.queryset().filter(pk__gt=last).order_by('pk')[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        if table.convert:
+            yield [table.convert(*row[1:]) for row in rows]
+        else:
+            yield [row[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+
+
+def ndjson_chunks(columns, chunks):
+    names = [column.name for column in columns]
+    # json.dumps with separators builds a new encoder on every call
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    for rows in chunks:
+        yield ''.join(encode(dict(zip(names, row))) + '\n' for row in rows).encode()
+
+
+def csv_chunks(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in columns])
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header, for an empty table
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _little_endian(values):
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_column(column, values):
+    block = b''
+    if column.nullable:
+        block = bytes(value is not None for value in values)
+    if column.type == 'utf8':
+        encoded = [(value or '').encode() for value in values]
+        offsets = array('I', [0])
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        block += _little_endian(offsets) + b''.join(encoded)
+    else:
+        block += _little_endian(array('d' if column.type == 'f64' else 'q',
+                                      [value or 0 for value in values]))
+    return _LENGTH.pack(len(block)) + block
+
+
+def columnar_chunks(columns, chunks, name=''):
+    schema = json.dumps({'table': name, 'columns': [column._asdict() for column in columns]}).encode()
+    yield MAGIC + _LENGTH.pack(len(schema)) + schema
+    for rows in chunks:
+        group = [_LENGTH.pack(len(rows))]
+        for i, column in enumerate(columns):
+            group.append(_encode_column(column, [row[i] for row in rows]))
+        yield b''.join(group)
+    yield _LENGTH.pack(0)
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of byte chunks on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(table_name, fmt, compress=False, chunk_size=CHUNK_SIZE, chunks=None):
+    """
+    Yield the table as bytes in fmt. chunks overrides where the row chunks
+    come from, e.g. to read them through another connection.
+    """
+    table = TABLES[table_name]
+    if chunks is None:
+        chunks = row_chunks(table, chunk_size)
+    if fmt == 'ndjson':
+        stream = ndjson_chunks(table.columns, chunks)
+    elif fmt == 'csv':
+        stream = csv_chunks(table.columns, chunks)
+    elif fmt == 'columnar':
+        stream = columnar_chunks(table.columns, chunks, table_name)
+    else:
+        raise ValueError(f"Format must be one of {', '.join(FORMATS)}")
+    return gzip_chunks(stream) if compress else stream
+
+
+def export_filename(table_name, fmt, compress=False):
+    return f"{table_name}.{EXTENSIONS[fmt]}" + ('.gz' if compress else '')
+
+
+def read_columnar(f):
+    """Return (columns, rows) for a columnar export read from binary file f."""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a columnar route export")
+    schema = json.loads(f.read(_LENGTH.unpack(f.read(4))[0]))
+    columns = [Column(**column) for column in schema['columns']]
+
+    def decode(column, block, n):
+        valid = None
+        if column.nullable:
+            valid, block = block[:n], block[n:]
+        if column.type == 'utf8':
+            offsets = array('I')
+            offsets.frombytes(block[:4 * (n + 1)])
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+            data = block[4 * (n + 1):]
+            values = [data[offsets[i]:offsets[i + 1]].decode() for i in range(n)]
+        else:
+            values = array('d' if column.type == 'f64' else 'q')
+            values.frombytes(block)
+            if sys.byteorder != 'little':
+                values.byteswap()
+            values = values.tolist()
+        if valid is not None:
+            values = [value if ok else None for value, ok in zip(values, valid)]
+        return values
+
+    def rows():
+        while True:
+            n = _LENGTH.unpack(f.read(4))[0]
+            if not n:
+                return
+            values = [decode(column, f.read(_LENGTH.unpack(f.read(4))[0]), n) for column in columns]
+            yield from zip(*values)
+
+    return columns, rows()
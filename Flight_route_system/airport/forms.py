@@ -1,19 +1,74 @@
 from django import forms
-from .models import Airport, add_next_airport
+from django.db import transaction
+from django.urls import reverse_lazy
+from .models import Airport, Route, add_next_airport, add_route
+
+
+def code_input():
+    """Text input that suggests airport codes as the user types (see base.html)."""
+    return forms.TextInput(attrs={
+        'list': 'airport-codes',
+        'autocomplete': 'off',
+        'data-autocomplete-url': reverse_lazy('airport_autocomplete'),
+    })
 
 class AirportForm(forms.ModelForm):
+    """The airport code plus the routes in its left and right slots."""
+    left = forms.ModelChoiceField(queryset=Airport.objects.all(), required=False)
+    right = forms.ModelChoiceField(queryset=Airport.objects.all(), required=False)
+    left_distance = forms.FloatField(required=False)
+    right_distance = forms.FloatField(required=False)
+
     class Meta:
         model = Airport
-        fields = ['code', 'left', 'right', 'left_distance', 'right_distance']
+        fields = ['code']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            for route in self.instance.routes.exclude(slot=None):
+                self.initial.setdefault(route.slot, route.destination_id)
+                self.initial.setdefault(f'{route.slot}_distance', route.duration or None)
+
+    def save(self, commit=True):
+        if not commit:
+            return super().save(commit)
+        # One transaction, so the route graph is rebuilt once for the edit
+        with transaction.atomic():
+            airport = super().save(commit)
+            self.save_routes()
+        return airport
+
+    def save_routes(self):
+        """Write the slot routes that changed; unchanged ones are left alone."""
+        current = {route.slot: route for route in self.instance.routes.exclude(slot=None)}
+        for slot, _ in Route.SLOTS:
+            linked = self.cleaned_data.get(slot)
+            route = current.get(slot)
+            if linked is None:
+                if route is not None:
+                    route.delete()
+                continue
+            # No distance keeps the link for find_nth_node without travelling it
+            duration = self.cleaned_data.get(f'{slot}_distance') or 0
+            if route is None:
+                Route.objects.create(origin=self.instance, slot=slot, destination=linked, duration=duration)
+            elif (route.destination_id, route.duration) != (linked.pk, duration):
+                route.destination = linked
+                route.duration = duration
+                route.save(update_fields=['destination', 'duration'])
 
 class AddNextAirportForm(forms.Form):
     parent_code = forms.CharField(max_length=10)
-    direction = forms.ChoiceField(choices=[('left', 'Left'), ('right', 'Right')])
+    direction = forms.ChoiceField(choices=[('left', 'Left'), ('right', 'Right'), ('route', 'Other route')])
     child_code = forms.CharField(max_length=10)
     distance = forms.FloatField()
 
     def save(self):
         data = self.cleaned_data
+        if data['direction'] == 'route':
+            # Routes outside the two slots, e.g. the many routes of a hub
+            return add_route(data['parent_code'], data['child_code'], data['distance']).destination
         return add_next_airport(
             parent_code=data['parent_code'],
             direction=data['direction'],
@@ -22,7 +77,11 @@ class AddNextAirportForm(forms.Form):
         )
 
 class ShortestPathForm(forms.Form):
-    start = forms.CharField(max_length=10)
+    start = forms.CharField(max_length=10, widget=code_input())
+
+class RouteImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or NDJSON with parent_code, direction, child_code, distance")
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')])
 
 
 
@@ -47,10 +106,38 @@ class ShortestPathForm(forms.Form):
 from django import forms
 
 class NthNodeForm(forms.Form):
-    start = forms.CharField(label="Start Airport Code")
+    start = forms.CharField(label="Start Airport Code", widget=code_input())
     direction = forms.ChoiceField(choices=[('left', 'Left'), ('right', 'Right')], label="Direction")
     n = forms.IntegerField(min_value=1, label="N (Step Count)")
 
 class DurationForm(forms.Form):
-    from_airport = forms.CharField(label="From Airport Code")
-    to_airport = forms.CharField(label="To Airport Code")
+    from_airport = forms.CharField(label="From Airport Code", widget=code_input())
+    to_airport = forms.CharField(label="To Airport Code", widget=code_input())
+
+class AlternativeRoutesForm(forms.Form):
+    from_airport = forms.CharField(label="From Airport Code", widget=code_input())
+    to_airport = forms.CharField(label="To Airport Code", widget=code_input())
+    k = forms.IntegerField(min_value=1, max_value=10, initial=3, label="Number of Routes")
+    max_hops = forms.IntegerField(min_value=1, required=False, label="Max Hops (optional)")
+
+class FewestHopsForm(forms.Form):
+    from_airport = forms.CharField(label="From Airport Code", widget=code_input())
+    to_airport = forms.CharField(label="To Airport Code", widget=code_input())
+    max_hops = forms.IntegerField(min_value=1, required=False, label="Max Hops (optional)")
+
+
+class EarliestArrivalForm(forms.Form):
+    from_airport = forms.CharField(label="From Airport Code", widget=code_input())
+    to_airport = forms.CharField(label="To Airport Code", widget=code_input())
+    depart_at = forms.TimeField(label="Leave At (HH:MM)")
+    latest_departure = forms.TimeField(
+        required=False, label="Latest Departure (optional)",
+        help_text="List every useful departure up to this time instead of only the first.",
+    )
+
+    def clean(self):
+        data = super().clean()
+        if data.get('latest_departure') and data.get('depart_at') \
+                and data['latest_departure'] < data['depart_at']:
+            self.add_error('latest_departure', "Must not be before the departure time.")
+        return data
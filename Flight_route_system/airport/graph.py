@@ -0,0 +1,482 @@
+"""
+Process-wide route graph shared by all route queries.
+
+The graph is built once from the Airport and Route tables (or mapped from
+the graph snapshot, see snapshot.py) and reused until one of their rows
+changes, at which point the signal handlers in signals.py invalidate it and
+the next query rebuilds it. Other processes notice the edit through the
+snapshot file when one is configured, and through the shared graph edit
+count (see versions.py) otherwise.
+
+Airport codes are interned to dense integer ids and the adjacency is kept in
+CSR form: the neighbors of node i are targets[offsets[i]:offsets[i + 1]]
+with the matching distances in weights.
+"""
+import bisect
+import hashlib
+import heapq
+import threading
+from array import array
+from collections import namedtuple
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import instrumentation, snapshot, versions
+from .models import Airport
+
+
+INF = float('inf')
+
+# Rows fetched per round trip while streaming the Airport and Route tables
+CHUNK_SIZE = 2000
+
+_lock = threading.Lock()
+_graph = None
+_version = 0
+# What the cached graph was loaded from: the snapshot file's identity, or
+# without a snapshot the graph edit count in the database when it was built
+_source = None
+# True while this process has edits the snapshot does not include yet
+_dirty = False
+
+# Outcome of a point-to-point search: distance is None when unreachable,
+# path lists the node ids from source to target, settled counts the nodes
+# popped from the search queues.
+SearchResult = namedtuple('SearchResult', ['distance', 'path', 'settled'])
+
+
+class SearchStats:
+    """Running totals of point-to-point searches, for monitoring."""
+
+    def __init__(self):
+        self.queries = 0
+        self.settled = 0
+
+    def record(self, result):
+        self.queries += 1
+        self.settled += result.settled
+        instrumentation.count('settled', result.settled)
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'settled': self.settled,
+            'settled_per_query': self.settled / self.queries if self.queries else 0,
+        }
+
+
+search_stats = SearchStats()
+
+
+class RouteGraph:
+    """Compact, read-only bidirectional route graph."""
+
+    def __init__(self, codes, offsets, targets, weights):
+        self.codes = codes
+        self.index = {code: i for i, code in enumerate(codes)}
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # Set by get_graph; keys caches derived from this graph
+        self.version = None
+        # Shared graph edit count the graph was built at, set by get_graph
+        # when no snapshot is configured and no edit is uncommitted (see
+        # route_cache.graph_key)
+        self.edit_count = None
+        self._sorted_codes = None
+        self._fingerprint = None
+
+    @classmethod
+    def from_routes(cls, routes):
+        """
+        Build the graph from (code, other_code, duration) rows, with other_code
+        None for an airport without routes. Every route is added in both
+        directions; airports joined by several routes get one link with the
+        shortest duration.
+        """
+        codes = []
+        index = {}
+        edges = {}
+
+        def intern(code):
+            code = code.upper()
+            i = index.get(code)
+            if i is None:
+                i = index[code] = len(codes)
+                codes.append(code)
+            return i
+
+        for code, other_code, duration in routes:
+            node = intern(code)
+            if other_code and duration:
+                other = intern(other_code)
+                if duration < edges.get((node, other), INF):
+                    edges[node, other] = edges[other, node] = duration
+
+        # Counting sort of the edge list into CSR arrays
+        n = len(codes)
+        offsets = array('q', bytes(8 * (n + 1)))
+        for node, _ in edges:
+            offsets[node + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+
+        fill = offsets[:-1]
+        targets = array('i', bytes(4 * len(edges)))
+        weights = array('d', bytes(8 * len(edges)))
+        for (node, other), d in edges.items():
+            pos = fill[node]
+            targets[pos] = other
+            weights[pos] = d
+            fill[node] = pos + 1
+
+        return cls(codes, offsets, targets, weights)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def fingerprint(self):
+        """SHA-1 digest of the codes and edges, independent of node ids."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            codes = self.codes
+            for code in sorted(codes):
+                digest.update(code.encode() + b'\0')
+                neighbors = sorted((codes[j], d) for j, d in self.neighbors(self.index[code]))
+                for neighbor, d in neighbors:
+                    digest.update(f'{neighbor}:{d!r};'.encode())
+                digest.update(b'\n')
+            self._fingerprint = digest.digest()
+        return self._fingerprint
+
+    def codes_with_prefix(self, prefix, limit):
+        """Up to limit codes starting with prefix, in sorted order."""
+        if self._sorted_codes is None:
+            self._sorted_codes = sorted(self.codes)
+        codes = self._sorted_codes
+        start = bisect.bisect_left(codes, prefix)
+        matches = []
+        for code in codes[start:start + limit]:
+            if not code.startswith(prefix):
+                break
+            matches.append(code)
+        return matches
+
+    def neighbors(self, node):
+        """(neighbor id, distance) pairs for a node id."""
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return zip(self.targets[start:end], self.weights[start:end])
+
+    def edge_weight(self, node, neighbor):
+        """Distance of the direct link between two node ids, or None."""
+        for e in range(self.offsets[node], self.offsets[node + 1]):
+            if self.targets[e] == neighbor:
+                return self.weights[e]
+        return None
+
+    def shortest_paths(self, source):
+        """
+        Dijkstra from node id source over the whole graph.
+
+        Returns (distances, predecessors, order): distances is inf and
+        predecessors -1 for unreachable nodes, and order lists the reached
+        node ids from nearest to farthest.
+        """
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        n = len(self.codes)
+        distances = array('d', [INF]) * n
+        predecessors = array('i', [-1]) * n
+        visited = bytearray(n)
+        order = []
+        distances[source] = 0
+        queue = [(0, source)]
+
+        while queue:
+            dist, node = heapq.heappop(queue)
+            if visited[node]:
+                continue
+            visited[node] = 1
+            order.append(node)
+
+            for e in range(offsets[node], offsets[node + 1]):
+                neighbor = targets[e]
+                new_dist = dist + weights[e]
+                if new_dist < distances[neighbor]:
+                    distances[neighbor] = new_dist
+                    predecessors[neighbor] = node
+                    heapq.heappush(queue, (new_dist, neighbor))
+
+        return distances, predecessors, order
+
+    def bidirectional_search(self, source, target):
+        """
+        Point-to-point Dijkstra run from both ends at once; the graph is
+        symmetric, so the backward search uses the same adjacency. It stops
+        once the two frontiers together cannot beat the best meeting point,
+        which usually settles far fewer nodes than a one-sided search.
+
+        The returned distance is re-summed from source to target along the
+        path, so it matches a one-sided search along the same path.
+        """
+        if source == target:
+            return SearchResult(0, [source], 1)
+
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        distances = ({source: 0}, {target: 0})
+        parents = ({source: None}, {target: None})
+        visited = (set(), set())
+        queues = ([(0, source)], [(0, target)])
+        best, meeting = INF, None
+        settled = 0
+
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best:
+                break
+            # Advance whichever frontier is closer to its origin
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            dist, node = heapq.heappop(queues[side])
+            if node in visited[side]:
+                continue
+            visited[side].add(node)
+            settled += 1
+
+            own, other = distances[side], distances[1 - side]
+            for e in range(offsets[node], offsets[node + 1]):
+                neighbor = targets[e]
+                new_dist = dist + weights[e]
+                if new_dist < own.get(neighbor, INF):
+                    own[neighbor] = new_dist
+                    parents[side][neighbor] = (node, weights[e])
+                    heapq.heappush(queues[side], (new_dist, neighbor))
+                if neighbor in other and new_dist + other[neighbor] < best:
+                    best = new_dist + other[neighbor]
+                    meeting = (side, node, neighbor, weights[e])
+
+        if meeting is None:
+            return SearchResult(None, [], settled)
+
+        side, node, neighbor, weight = meeting
+        if side == 1:
+            node, neighbor = neighbor, node
+
+        # Walk back from the meeting edge to both ends
+        steps = []
+        current = node
+        while parents[0][current] is not None:
+            previous, d = parents[0][current]
+            steps.append((current, d))
+            current = previous
+        steps.reverse()
+        steps.append((neighbor, weight))
+        current = neighbor
+        while parents[1][current] is not None:
+            following, d = parents[1][current]
+            steps.append((following, d))
+            current = following
+
+        distance = 0
+        for _, d in steps:
+            distance += d
+        return SearchResult(distance, [source] + [n for n, _ in steps], settled)
+
+
+def iter_routes():
+    """
+    Stream (code, other_code, duration) for every route, plus (code, None,
+    None) for airports without one, in one flat query without loading
+    model instances. Always read from the primary (see routers.py).
+    """
+    return (
+        Airport.objects.using(DEFAULT_DB_ALIAS)
+        .order_by('pk', 'routes__pk')
+        .values_list('code', 'routes__destination__code', 'routes__duration')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def _current_source(path):
+    return snapshot.file_stat(path) if path else versions.stamps()[0]
+
+
+def build_graph():
+    """Build the route graph from the Route table."""
+    return RouteGraph.from_routes(iter_routes())
+
+
+def get_graph():
+    """
+    Return the cached route graph. It is loaded from the graph snapshot when
+    one is configured and current, and built from the database otherwise.
+    """
+    global _graph, _version, _source
+    path = snapshot.snapshot_path()
+    source = _current_source(path)
+    graph = _graph
+    # A changed snapshot or edit count means another process made an edit
+    if graph is not None and source == _source:
+        instrumentation.note('graph', 'hit', replace=False)
+        return graph
+
+    with _lock, instrumentation.timed('graph'):
+        if _graph is not None:
+            if source == _source:
+                instrumentation.note('graph', 'hit', replace=False)
+                return _graph
+            _version += 1
+
+        graph = None
+        if path and source is not None and not _dirty:
+            graph = snapshot.read_snapshot(path, RouteGraph)
+        _source = source
+        if graph is None:
+            graph = build_graph()
+            if path and not _dirty:
+                # Missing or unreadable snapshot: leave a good one behind
+                _write_snapshot(graph, path)
+            instrumentation.note('graph', 'built')
+        else:
+            instrumentation.note('graph', 'snapshot')
+        graph.version = _version
+        graph.edit_count = None if path or _edits_pending() else source
+        _graph = graph
+    return graph
+
+
+def _write_snapshot(graph, path):
+    """Write the snapshot and remember it as the graph's source."""
+    global _source
+    try:
+        snapshot.write_snapshot(graph, path)
+    except OSError:
+        return False
+    _source = snapshot.file_stat(path)
+    return True
+
+
+def invalidate_graph():
+    """Drop the cached graph so the next query rebuilds it."""
+    global _graph, _version
+    with _lock:
+        _graph = None
+        _version += 1
+    # Also pick up the edit count as it is now
+    versions.expire()
+
+
+def publish_graph():
+    """
+    Rebuild the graph from the database and, if a snapshot is configured,
+    write it so other workers reload without querying the database.
+    """
+    global _graph, _version, _source, _dirty
+    path = snapshot.snapshot_path()
+    if not path:
+        versions.expire()
+        source = versions.stamps()[0]
+    graph = build_graph()
+    with _lock:
+        _version += 1
+        graph.version = _version
+        _graph = graph
+        if not path:
+            graph.edit_count = _source = source
+        elif _write_snapshot(graph, path):
+            _dirty = False
+    return graph
+
+
+def on_commit_once(func):
+    """
+    Run func when the current transaction commits, unless it is already
+    queued for it. A cascading delete or a form saving several routes
+    changes many rows, and one rebuild on commit covers them all. A rolled
+    back transaction drops its queue, so nothing is left behind.
+
+    Returns whether func was queued.
+    """
+    connection = transaction.get_connection()
+    for _, queued, _ in connection.run_on_commit:
+        if getattr(queued, 'func', None) is func and not queued.done:
+            return False
+
+    def run():
+        run.done = True
+        func()
+    run.func, run.done = func, False
+    transaction.on_commit(run)
+    return True
+
+
+def _edits_pending():
+    """
+    Whether this connection's open transaction has changed the graph. The
+    edit count moves once per transaction, so graphs built before it commits
+    are not named by it.
+    """
+    connection = transaction.get_connection()
+    return any(
+        getattr(queued, 'func', None) in (invalidate_graph, publish_graph) and not queued.done
+        for _, queued, _ in connection.run_on_commit
+    )
+
+
+def graph_changed():
+    """
+    Call after Airport or Route rows change. The cached graph is dropped at
+    once, and again when the transaction commits so a graph rebuilt from
+    pre-commit data is not kept; with a snapshot configured the new graph
+    is published on commit instead.
+    """
+    global _dirty
+    invalidate_graph()
+    if snapshot.snapshot_path():
+        # Until the new snapshot is written the old one is stale here
+        _dirty = True
+        queued = on_commit_once(publish_graph)
+    else:
+        queued = on_commit_once(invalidate_graph)
+    if queued:
+        # Once per transaction, committed together with the edit
+        versions.bump('graph')
+
+
+def graph_version():
+    """
+    Counter bumped whenever the graph changes, in this process or, once
+    noticed, in another; use it to key derived caches.
+    """
+    global _graph, _version, _source
+    source = _current_source(snapshot.snapshot_path())
+    if source != _source:
+        with _lock:
+            if source != _source:
+                _graph = None
+                _version += 1
+                _source = source
+    return _version
+
+
+def graph_source():
+    """
+    What the current graph was loaded from: the snapshot file's identity,
+    or the shared graph edit count without a snapshot. Like
+    graph_fingerprint it is the same in every process that has seen the
+    same edits, and it costs no more than a cache hit.
+    """
+    get_graph()
+    return _source
+
+
+def graph_fingerprint():
+    """
+    SHA-1 digest of the current graph's edges. Unlike graph_version it is
+    the same in every process, so it identifies precomputed data on disk.
+    """
+    return get_graph().fingerprint()
@@ -0,0 +1,162 @@
+"""
+Bulk import of airport links from CSV or NDJSON.
+
+Each row has the same fields as AddNextAirportForm: parent_code, direction
+('left' or 'right'), child_code and distance. The whole file is validated
+in one pass before anything is written; the links are then applied with
+bulk_create upserts in chunked transactions. The end result is the same
+as calling add_next_airport for every row in file order.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+
+from .graph import graph_changed
+from .models import Airport, Route
+
+
+FIELDS = ('parent_code', 'direction', 'child_code', 'distance')
+CHUNK_SIZE = 1000
+# Errors listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+_code_length = Airport._meta.get_field('code').max_length
+
+
+class RouteImportError(ValueError):
+    """Raised when the file fails validation; nothing has been written."""
+
+    def __init__(self, errors, error_count):
+        self.errors = errors
+        self.error_count = error_count
+        super().__init__(f"{error_count} invalid row(s)")
+
+
+def read_rows(lines, fmt):
+    """Yield (line number, row dict) from an iterable of text lines."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else {}
+    else:
+        raise ValueError("Format must be 'csv' or 'ndjson'")
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def parse_links(rows):
+    """
+    Validate every row and return {(parent, direction): (child, distance)}
+    with later rows overriding earlier ones, like repeated add_next_airport
+    calls. Raises RouteImportError listing the bad rows.
+    """
+    links = {}
+    errors = []
+    error_count = 0
+    # Parents must exist in the DB or be created as a child by an earlier row
+    created = set()
+    unresolved = {}
+
+    def error(line_no, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(f"Line {line_no}: {message}")
+
+    for line_no, row in rows:
+        values = [str(row.get(field) or '').strip() for field in FIELDS]
+        parent, direction, child, distance = values
+        if not all(values):
+            error(line_no, f"expected {', '.join(FIELDS)}")
+            continue
+        if len(parent) > _code_length or len(child) > _code_length:
+            error(line_no, f"airport codes are limited to {_code_length} characters")
+            continue
+        if direction not in ('left', 'right'):
+            error(line_no, "direction must be 'left' or 'right'")
+            continue
+        try:
+            distance = float(distance)
+        except ValueError:
+            error(line_no, f"distance '{distance}' is not a number")
+            continue
+
+        if parent not in created:
+            unresolved.setdefault(parent, line_no)
+        created.add(child)
+        links[parent, direction] = (child, distance)
+
+    for chunk in _chunks(unresolved, CHUNK_SIZE):
+        existing = set(Airport.objects.filter(code__in=chunk).values_list('code', flat=True))
+        for parent in chunk:
+            if parent not in existing:
+                error(unresolved[parent], f"parent airport '{parent}' not found")
+
+    if error_count:
+        raise RouteImportError(errors, error_count)
+    return links
+
+
+def apply_links(links, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Write parsed links to the database. Returns (airports added, links set).
+
+    Airports are added with ignore_conflicts, which does not report which
+    rows were inserted, so the first count is of the codes missing when
+    their chunk was written; an import running alongside may have added
+    some of them itself.
+    """
+    codes = {parent for parent, _ in links} | {child for child, _ in links.values()}
+
+    ids = {}
+    added = 0
+    for chunk in _chunks(codes, chunk_size):
+        with transaction.atomic():
+            ids.update(Airport.objects.filter(code__in=chunk).values_list('code', 'id'))
+            missing = [Airport(code=code) for code in chunk if code not in ids]
+            Airport.objects.bulk_create(missing, ignore_conflicts=True)
+            if missing:
+                ids.update(Airport.objects.filter(code__in=[a.code for a in missing])
+                           .values_list('code', 'id'))
+        added += len(missing)
+
+    done = 0
+    for chunk in _chunks(links.items(), chunk_size):
+        # Upsert on the (origin, slot) constraint replaces each slot's route
+        routes = [
+            Route(origin_id=ids[parent], slot=direction, destination_id=ids[child], duration=distance)
+            for (parent, direction), (child, distance) in chunk
+        ]
+        with transaction.atomic():
+            Route.objects.bulk_create(
+                routes, update_conflicts=True,
+                unique_fields=['origin', 'slot'], update_fields=['destination', 'duration'],
+            )
+        done += len(routes)
+        if progress:
+            progress(done, len(links))
+
+    # Bulk writes bypass the post_save signal
+    graph_changed()
+    return added, len(links)
+
+
+def import_routes(lines, fmt, chunk_size=CHUNK_SIZE, progress=None):
+    """Validate and import links from text lines; see apply_links."""
+    links = parse_links(read_rows(lines, fmt))
+    return apply_links(links, chunk_size=chunk_size, progress=progress)
@@ -0,0 +1,258 @@
+"""
+Per-request instrumentation of the route views.
+
+RouteInstrumentationMiddleware opens a RequestMetrics for every request and
+the hot paths add to it through the functions below:
+
+    timed(name)        context manager adding elapsed time under name
+    count(name, n)     adds n to a counter
+    note(name, value)  sets a label, e.g. note('graph', 'built'); with
+                       replace=False an earlier label is kept
+
+SQL queries are timed by a database execute wrapper and template rendering
+by InstrumentedTemplates. When the request finishes the metrics are logged
+as one JSON line on the 'airport.requests' logger (at INFO, off unless
+the settings enable it), sent back in a Server-Timing header and folded
+into the per-view histograms served by route_stats_view. Outside a request all of these are no-ops costing one
+context variable lookup.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger('airport.requests')
+
+# Upper bounds (ms) of the latency histogram buckets; the last is open
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_current = ContextVar('route_request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.times = {}
+        self.counts = {}
+        self.notes = {}
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0) + seconds
+
+    def add_count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def as_dict(self):
+        return {
+            'ms': {name: round(seconds * 1000, 3) for name, seconds in self.times.items()},
+            **self.counts,
+            **self.notes,
+        }
+
+
+@contextmanager
+def timed(name):
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - started)
+
+
+def count(name, n=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_count(name, n)
+
+
+def note(name, value, replace=True):
+    metrics = _current.get()
+    if metrics is not None:
+        if replace:
+            metrics.notes[name] = value
+        else:
+            metrics.notes.setdefault(name, value)
+
+
+def _time_queries(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_time('db', time.perf_counter() - started)
+        metrics.add_count('queries', 1)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Installed on every connection, so queries made from sync_to_async
+    # threads are counted for the request that awaits them
+    if _time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_queries)
+
+
+class _TimedTemplate:
+    """Wraps a backend template so rendering is timed as 'render'."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('render'):
+            return self.template.render(context, request)
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """DjangoTemplates backend that reports render time to the request metrics."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+class ViewHistograms:
+    """Request counts, totals and latency histograms per URL name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, elapsed_ms, metrics):
+        with self._lock:
+            entry = self._views.get(view)
+            if entry is None:
+                entry = self._views[view] = {
+                    'requests': 0, 'ms_sum': 0.0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'totals': {},
+                }
+            entry['requests'] += 1
+            entry['ms_sum'] += elapsed_ms
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed_ms <= bound:
+                    break
+            else:
+                i = len(LATENCY_BUCKETS)
+            entry['buckets'][i] += 1
+            totals = entry['totals']
+            for name, value in metrics.counts.items():
+                totals[name] = totals.get(name, 0) + value
+            for name, seconds in metrics.times.items():
+                key = f'{name}_ms'
+                totals[key] = totals.get(key, 0) + seconds * 1000
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                view: {
+                    'requests': entry['requests'],
+                    'ms_sum': round(entry['ms_sum'], 3),
+                    # Cumulative, like Prometheus histogram buckets
+                    'ms_buckets': dict(zip(
+                        [str(b) for b in LATENCY_BUCKETS] + ['+Inf'],
+                        _cumulative(entry['buckets']),
+                    )),
+                    'totals': {k: round(v, 3) for k, v in entry['totals'].items()},
+                }
+                for view, entry in self._views.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+def _cumulative(counts):
+    total = 0
+    result = []
+    for n in counts:
+        total += n
+        result.append(total)
+    return result
+
+
+view_histograms = ViewHistograms()
+
+
+def server_timing(metrics, total_ms):
+    """Server-Timing header value for one request."""
+    parts = []
+    for name, seconds in metrics.times.items():
+        desc = ''
+        if name == 'db':
+            desc = f';desc="{metrics.counts.get("queries", 0)} queries"'
+        elif name == 'graph' and 'graph' in metrics.notes:
+            desc = f';desc="{metrics.notes["graph"]}"'
+        elif name == 'search' and 'settled' in metrics.counts:
+            desc = f';desc="{metrics.counts["settled"]} settled"'
+        parts.append(f'{name};dur={seconds * 1000:.2f}{desc}')
+    parts.append(f'total;dur={total_ms:.2f}')
+    return ', '.join(parts)
+
+
+class RouteInstrumentationMiddleware:
+    """Collect RequestMetrics for each request; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unresolved'
+
+        response['Server-Timing'] = server_timing(metrics, total_ms)
+        view_histograms.record(view, total_ms, metrics)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'view': view,
+                'method': request.method,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 3),
+                **metrics.as_dict(),
+            }))
+        return response
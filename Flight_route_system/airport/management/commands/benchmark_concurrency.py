@@ -0,0 +1,196 @@
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import F
+
+from airport.management.commands.benchmark_routes import percentile, synthetic_network
+from airport.models import Airport, Departure, Route
+
+
+def configurations(path):
+    """
+    (name, write settings, read settings or None) for every compared setup:
+    stock Django SQLite settings with one connection for everything, and
+    the configured default and replica settings.
+    """
+    default = settings.DATABASES['default']
+    replica = settings.DATABASES.get('replica')
+    tuned_read = None
+    if replica:
+        tuned_read = {**replica, 'NAME': Path(path).as_uri() + '?mode=ro', 'TEST': {}}
+    return [
+        ('legacy', {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}, None),
+        ('tuned', {**default, 'NAME': path, 'TEST': {}}, tuned_read),
+    ]
+
+
+def register(alias, config):
+    """Add a database alias at runtime, with Django's defaults filled in."""
+    connections.settings[alias] = connections.configure_settings(
+        {**settings.DATABASES, alias: dict(config)}
+    )[alias]
+
+
+def unregister(alias):
+    if alias in connections.settings:
+        connections[alias].close()
+        del connections.settings[alias]
+
+
+def load_network(alias, size, rng):
+    """Create the route tables in alias and fill them with a hub network."""
+    connection = connections[alias]
+    with connection.schema_editor() as editor:
+        for model in (Airport, Route, Departure):
+            editor.create_model(model)
+    links = synthetic_network('hub', size, rng)
+    codes = {parent for parent, _ in links} | {child for child, _ in links.values()}
+    Airport.objects.using(alias).bulk_create([Airport(code=code) for code in sorted(codes)], batch_size=1000)
+    ids = dict(Airport.objects.using(alias).values_list('code', 'id'))
+    Route.objects.using(alias).bulk_create([
+        Route(origin_id=ids[parent], slot=direction, destination_id=ids[child], duration=distance)
+        for (parent, direction), (child, distance) in links.items()
+    ], batch_size=1000)
+    return sorted(codes), list(Route.objects.using(alias).values_list('pk', flat=True))
+
+
+def read_once(alias, codes, rng):
+    """One read as the list and route views make them."""
+    kind = rng.randrange(3)
+    routes = Route.objects.using(alias)
+    if kind == 0:
+        prefix = rng.choice(codes)[:3]
+        list(Airport.objects.using(alias).filter(code__startswith=prefix).order_by('code')[:50])
+    elif kind == 1:
+        list(routes.exclude(duration=0).order_by('-duration', 'pk')
+             .values_list('origin__code', 'destination__code', 'duration')[:10])
+    else:
+        list(routes.filter(origin__code=rng.choice(codes)).values_list('destination__code', 'duration'))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure read latency of the list/route queries while a writer keeps "
+        "committing, with the stock SQLite settings and with the configured "
+        "WAL/pragma/replica settings, on a throwaway database file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--airports', type=int, default=100000,
+                            help="Large enough that a write chunk spills SQLite's page cache.")
+        parser.add_argument('--readers', type=int, default=4, help="Reader threads.")
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--write-rows', type=int, default=1000,
+                            help="Routes updated per write transaction, like one import chunk; "
+                                 "0 measures reads without a writer.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if options['readers'] < 1:
+            raise CommandError("--readers must be at least 1")
+        rows = []
+        directory = tempfile.mkdtemp(prefix='route-concurrency-')
+        try:
+            for name, write_config, read_config in configurations(str(Path(directory) / 'routes.sqlite3')):
+                rows.append(self.run_setup(name, write_config, read_config, options))
+                for suffix in ('', '-wal', '-shm'):
+                    Path(write_config['NAME'] + suffix).unlink(missing_ok=True)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.stdout.write(
+            f"{'setup':>8} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+            f"{'errors':>7} {'writes/s':>9} {'write p50 ms':>13}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['setup']:>8} {row['reads_per_second']:>9.1f} {row['read_p50_ms'] or 0:>8.2f} "
+                f"{row['read_p99_ms'] or 0:>8.2f} {row['read_max_ms'] or 0:>8.2f} {row['read_errors']:>7} "
+                f"{row['writes_per_second']:>9.1f} {row['write_p50_ms'] or 0:>13.2f}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {k: options[k] for k in ('airports', 'readers', 'seconds', 'write_rows', 'seed')},
+                           'results': rows}, f, indent=2)
+
+    def run_setup(self, name, write_config, read_config, options):
+        write_alias, read_alias = f'concurrency_{name}', f'concurrency_{name}_read'
+        register(write_alias, write_config)
+        if read_config:
+            register(read_alias, read_config)
+        else:
+            read_alias = write_alias
+        try:
+            rng = random.Random(options['seed'])
+            codes, route_ids = load_network(write_alias, options['airports'], rng)
+            connections[write_alias].close()
+            return {'setup': name, **self.measure(write_alias, read_alias, codes, route_ids, options)}
+        finally:
+            unregister(write_alias)
+            unregister(read_alias)
+
+    def measure(self, write_alias, read_alias, codes, route_ids, options):
+        stop = threading.Event()
+        read_times, write_times = [], []
+        errors = []
+
+        def reader(seed):
+            rng = random.Random(seed)
+            times = []
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        read_once(read_alias, codes, rng)
+                    except Exception as e:
+                        errors.append(repr(e))
+                        continue
+                    times.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections[read_alias].close()
+                read_times.extend(times)
+
+        def writer():
+            rng = random.Random(options['seed'])
+            try:
+                while not stop.is_set():
+                    batch = rng.sample(route_ids, min(options['write_rows'], len(route_ids)))
+                    started = time.perf_counter()
+                    with transaction.atomic(using=write_alias):
+                        Route.objects.using(write_alias).filter(pk__in=batch).update(duration=F('duration') + 1)
+                    write_times.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections[write_alias].close()
+
+        threads = [
+            threading.Thread(target=reader, args=(options['seed'] + i,)) for i in range(options['readers'])
+        ]
+        if options['write_rows']:
+            threads.append(threading.Thread(target=writer))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'reads_per_second': round(len(read_times) / elapsed, 1),
+            'read_p50_ms': round(percentile(read_times, 50), 3) if read_times else None,
+            'read_p99_ms': round(percentile(read_times, 99), 3) if read_times else None,
+            'read_max_ms': round(max(read_times), 3) if read_times else None,
+            'read_errors': len(errors),
+            'writes_per_second': round(len(write_times) / elapsed, 1),
+            'write_p50_ms': round(percentile(write_times, 50), 3) if write_times else None,
+        }
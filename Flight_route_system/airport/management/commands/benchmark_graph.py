@@ -0,0 +1,174 @@
+import heapq
+import json
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from airport.graph import RouteGraph
+
+
+def synthetic_links(size, seed):
+    """Random network where every airport links left and right to another one."""
+    rng = random.Random(seed)
+    for i in range(size):
+        yield (
+            f'A{i}',
+            f'A{rng.randrange(size)}', f'A{rng.randrange(size)}',
+            rng.uniform(1, 1000), rng.uniform(1, 1000),
+        )
+
+
+def link_routes(links):
+    """
+    (code, other_code, duration) rows for RouteGraph.from_routes from
+    (code, left_code, right_code, left_distance, right_distance) links, the
+    shape the airport links had before routes got their own table.
+    """
+    for code, left_code, right_code, left_distance, right_distance in links:
+        yield code, left_code, left_distance
+        yield code, right_code, right_distance
+
+
+def dict_graph(links):
+    """The nested-dict graph the route views used before RouteGraph."""
+    graph = {}
+    for code, left_code, right_code, left_distance, right_distance in links:
+        code = code.upper()
+        graph.setdefault(code, {})
+        if left_code and left_distance:
+            left_code = left_code.upper()
+            graph[code][left_code] = left_distance
+            graph.setdefault(left_code, {})[code] = left_distance
+        if right_code and right_distance:
+            right_code = right_code.upper()
+            graph[code][right_code] = right_distance
+            graph.setdefault(right_code, {})[code] = right_distance
+    return graph
+
+
+def dict_distance(graph, start_code, end_code):
+    """The nested-dict Dijkstra the route views used before RouteGraph."""
+    queue = [(0, start_code)]
+    distances = {start_code: 0}
+    visited = set()
+    while queue:
+        dist, node = heapq.heappop(queue)
+        if node == end_code:
+            return dist
+        if node in visited:
+            continue
+        visited.add(node)
+        for neighbor, d in graph[node].items():
+            new_dist = dist + d
+            if neighbor not in distances or new_dist < distances[neighbor]:
+                distances[neighbor] = new_dist
+                heapq.heappush(queue, (new_dist, neighbor))
+    return None
+
+
+def csr_distance(graph, source, target):
+    """
+    One-sided Dijkstra over a RouteGraph from node id source that stops as
+    soon as target is settled; None when target is unreachable.
+    """
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    distances = {source: 0}
+    visited = set()
+    queue = [(0, source)]
+    while queue:
+        dist, node = heapq.heappop(queue)
+        if node == target:
+            return dist
+        if node in visited:
+            continue
+        visited.add(node)
+        for e in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[e]
+            new_dist = dist + weights[e]
+            if neighbor not in distances or new_dist < distances[neighbor]:
+                distances[neighbor] = new_dist
+                heapq.heappush(queue, (new_dist, neighbor))
+    return None
+
+
+def retained_bytes(build):
+    """Memory still allocated by the object build() returns."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    graph = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return graph, after - before
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare memory per edge and query throughput of the dict and CSR "
+        "route graphs, and of one-sided versus bidirectional search."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help="Comma separated airport counts.")
+        parser.add_argument('--queries', type=int, default=20,
+                            help="Point-to-point queries per size.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', action='store_true',
+                            help="Print one JSON object per size instead of a table.")
+
+    def handle(self, *args, **options):
+        if not options['json']:
+            self.stdout.write(
+                f"{'airports':>10} {'edges':>10} {'impl':>5} "
+                f"{'build s':>8} {'B/edge':>7} {'queries/s':>10}"
+            )
+
+        for size in [int(s) for s in options['sizes'].split(',')]:
+            links = list(synthetic_links(size, options['seed']))
+            rng = random.Random(options['seed'])
+            pairs = [(f'A{rng.randrange(size)}', f'A{rng.randrange(size)}')
+                     for _ in range(options['queries'])]
+
+            started = time.perf_counter()
+            legacy = dict_graph(links)
+            legacy_build = time.perf_counter() - started
+            started = time.perf_counter()
+            csr = RouteGraph.from_routes(link_routes(links))
+            csr_build = time.perf_counter() - started
+            edges = csr.edge_count
+
+            started = time.perf_counter()
+            legacy_results = [dict_distance(legacy, a, b) for a, b in pairs]
+            legacy_qps = len(pairs) / (time.perf_counter() - started)
+            started = time.perf_counter()
+            csr_results = [csr_distance(csr, csr.index[a], csr.index[b]) for a, b in pairs]
+            csr_qps = len(pairs) / (time.perf_counter() - started)
+            started = time.perf_counter()
+            bidi = [csr.bidirectional_search(csr.index[a], csr.index[b]) for a, b in pairs]
+            bidi_qps = len(pairs) / (time.perf_counter() - started)
+            assert legacy_results == csr_results == [r.distance for r in bidi]
+
+            del legacy, csr
+            _, legacy_bytes = retained_bytes(lambda: dict_graph(links))
+            _, csr_bytes = retained_bytes(lambda: RouteGraph.from_routes(link_routes(links)))
+
+            rows = [
+                ('dict', legacy_build, legacy_bytes / edges, legacy_qps),
+                ('csr', csr_build, csr_bytes / edges, csr_qps),
+                ('bidi', csr_build, csr_bytes / edges, bidi_qps),
+            ]
+            for impl, build, per_edge, qps in rows:
+                if options['json']:
+                    self.stdout.write(json.dumps({
+                        'airports': size, 'edges': edges, 'impl': impl,
+                        'build_seconds': round(build, 4),
+                        'bytes_per_edge': round(per_edge, 1),
+                        'queries_per_second': round(qps, 2),
+                    }))
+                else:
+                    self.stdout.write(
+                        f"{size:>10} {edges:>10} {impl:>5} "
+                        f"{build:>8.2f} {per_edge:>7.1f} {qps:>10.2f}"
+                    )
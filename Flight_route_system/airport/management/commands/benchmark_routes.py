@@ -0,0 +1,247 @@
+import json
+import logging
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from airport import route_cache
+from airport.graph import get_graph, invalidate_graph
+from airport.importer import apply_links
+from airport.trees import tree_cache
+from airport.views import (
+    find_duration_between, find_longest_route, find_nth_node, find_shortest_path,
+)
+
+
+TOPOLOGIES = ('random', 'hub', 'chain')
+# Graph rebuilds are slow at large sizes, so they get fewer samples
+BUILD_REQUESTS = 5
+BENCHMARK_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+    'routes': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-routes'},
+}
+
+
+def benchmark_settings():
+    """
+    Settings that keep the benchmark on its test database: no snapshot,
+    matrix or shared caches, and no reads sent to the replica, which is not
+    part of the test database and would not be counted.
+    """
+    return override_settings(ROUTE_GRAPH_SNAPSHOT_PATH=None, ROUTE_MATRIX_PATH=None,
+                             ROUTE_READ_DATABASE=None, CACHES=BENCHMARK_CACHES)
+
+
+def synthetic_network(topology, size, rng):
+    """
+    Links for size airports A0..A{size-1} in the shape parse_links returns,
+    {(parent, direction): (child, distance)}.
+
+    random: every airport links left, and half link right, to a random one.
+    hub:    one airport in 50 is a hub; hubs form a ring of right links and
+            every other airport links left to a random hub.
+    chain:  one long left chain A0 -> A1 -> ..., with right shortcuts from
+            one airport in 100.
+    """
+    codes = [f'A{i}' for i in range(size)]
+    links = {}
+
+    def link(parent, direction, child):
+        links[parent, direction] = (child, round(rng.uniform(1, 1000), 1))
+
+    if topology == 'random':
+        for code in codes:
+            link(code, 'left', rng.choice(codes))
+            if rng.random() < 0.5:
+                link(code, 'right', rng.choice(codes))
+    elif topology == 'hub':
+        hubs = codes[:max(2, size // 50)]
+        for i, hub in enumerate(hubs):
+            link(hub, 'right', hubs[(i + 1) % len(hubs)])
+        for code in codes[len(hubs):]:
+            link(code, 'left', rng.choice(hubs))
+    elif topology == 'chain':
+        for code, following in zip(codes, codes[1:]):
+            link(code, 'left', following)
+        for code in rng.sample(codes, size // 100):
+            link(code, 'right', rng.choice(codes))
+    else:
+        raise ValueError(f"Unknown topology '{topology}'")
+    return links
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+
+def measure(call, requests):
+    """
+    Run call(*args) for every args in requests and return latency
+    percentiles (ms), SQL queries per request and the peak bytes allocated
+    by one more call with the first args.
+    """
+    latencies = []
+    queries = 0
+    for args in requests:
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            call(*args)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries += len(captured)
+
+    tracemalloc.start()
+    call(*requests[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'requests': len(requests),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries_per_request': round(queries / len(requests), 2),
+        'peak_bytes': peak,
+    }
+
+
+def benchmark_network(codes, queries, rng, client):
+    """Measure every route operation against the airports now in the database."""
+
+    def rebuild_graph():
+        invalidate_graph()
+        get_graph()
+
+    def list_page(prefix):
+        response = client.get(reverse('airport_list'), {'q': prefix})
+        if response.status_code != 200:
+            raise CommandError(f"airport_list returned {response.status_code}")
+
+    operations = [
+        ('graph_build', rebuild_graph, [()] * min(queries, BUILD_REQUESTS)),
+        ('shortest_path', find_shortest_path,
+         [(rng.choice(codes),) for _ in range(queries)]),
+        ('duration_between', find_duration_between,
+         [(rng.choice(codes), rng.choice(codes)) for _ in range(queries)]),
+        ('nth_node', find_nth_node,
+         [(rng.choice(codes), rng.choice(('left', 'right')), rng.randint(1, 100))
+          for _ in range(queries)]),
+        ('longest_route', find_longest_route, [()] * queries),
+        ('airport_list', list_page,
+         [(rng.choice(codes)[:rng.randint(1, 3)],) for _ in range(queries)]),
+    ]
+
+    results = {}
+    for name, call, requests in operations:
+        # Every operation starts from a built graph and cold result caches
+        get_graph()
+        tree_cache.clear()
+        route_cache.route_cache().clear()
+        results[name] = measure(call, requests)
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Load synthetic airport networks into a throwaway test database and "
+        "measure latency, queries and memory of the route operations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topologies', default=','.join(TOPOLOGIES),
+                            help="Comma separated topologies: random, hub, chain.")
+        parser.add_argument('--sizes', default='1000,10000',
+                            help="Comma separated airport counts.")
+        parser.add_argument('--queries', type=int, default=50,
+                            help="Requests per operation.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--label', default='',
+                            help="Stored with the results, e.g. the commit being measured.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare',
+                            help="JSON results of an earlier run to print p50 ratios against.")
+
+    def handle(self, *args, **options):
+        topologies = options['topologies'].split(',')
+        for topology in topologies:
+            if topology not in TOPOLOGIES:
+                raise CommandError(f"Unknown topology '{topology}'")
+        sizes = [int(s) for s in options['sizes'].split(',')]
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                for row in json.load(f)['results']:
+                    baseline[row['topology'], row['airports'], row['operation']] = row
+
+        rows = []
+        # One log line per benchmark request would drown the results
+        request_log = logging.getLogger('airport.requests')
+        log_level = request_log.level
+        request_log.setLevel(logging.WARNING)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with benchmark_settings():
+                for topology in topologies:
+                    for size in sizes:
+                        rows += self.run_network(topology, size, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            request_log.setLevel(log_level)
+            invalidate_graph()
+            tree_cache.clear()
+
+        self.stdout.write(
+            f"{'topology':>8} {'airports':>9} {'operation':>16} {'p50 ms':>9} "
+            f"{'p99 ms':>9} {'queries':>8} {'peak KiB':>9}" + (f" {'p50 vs base':>11}" if baseline else "")
+        )
+        for row in rows:
+            line = (
+                f"{row['topology']:>8} {row['airports']:>9} {row['operation']:>16} "
+                f"{row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+                f"{row['queries_per_request']:>8.2f} {row['peak_bytes'] / 1024:>9.1f}"
+            )
+            base = baseline.get((row['topology'], row['airports'], row['operation']))
+            if base and base['p50_ms']:
+                line += f" {row['p50_ms'] / base['p50_ms']:>10.2f}x"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'label': options['label'],
+                    'seed': options['seed'],
+                    'queries': options['queries'],
+                    'results': rows,
+                }, f, indent=2)
+
+    def run_network(self, topology, size, options):
+        call_command('flush', interactive=False, verbosity=0)
+        rng = random.Random(options['seed'])
+        links = synthetic_network(topology, size, rng)
+
+        started = time.perf_counter()
+        apply_links(links)
+        load_seconds = time.perf_counter() - started
+
+        user = get_user_model().objects.create_user('benchmark', password='benchmark')
+        client = Client()
+        client.force_login(user)
+
+        codes = [f'A{i}' for i in range(size)]
+        results = benchmark_network(codes, options['queries'], rng, client)
+        self.stderr.write(f"{topology} {size}: loaded {len(links)} links in {load_seconds:.2f}s")
+        return [
+            {'topology': topology, 'airports': size, 'links': len(links),
+             'load_seconds': round(load_seconds, 3), 'operation': name, **stats}
+            for name, stats in results.items()
+        ]
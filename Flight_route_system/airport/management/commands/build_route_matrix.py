@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from airport.matrix import write_matrix
+
+
+class Command(BaseCommand):
+    help = "Precompute the all-pairs route matrix used by duration_between searches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help="Output file (defaults to the ROUTE_MATRIX_PATH setting).",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'ROUTE_MATRIX_PATH', None)
+        if not path:
+            raise CommandError("Set ROUTE_MATRIX_PATH or pass --path.")
+
+        def progress(done, total):
+            if done % 500 == 0 or done == total:
+                self.stdout.write(f"  {done}/{total} airports")
+
+        n = write_matrix(path, progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote route matrix for {n} airports to {path}"
+        ))
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from airport.graph import get_graph
+from airport.models import Airport, AirportStats
+from airport.reachability import compute_stats
+
+
+def save_stats(stats, computed_at):
+    """Replace the stored stats with stats, skipping airports deleted meanwhile."""
+    ids = {code.upper(): pk for code, pk in Airport.objects.values_list('code', 'pk')}
+    rows = [
+        AirportStats(
+            airport_id=ids[row.code],
+            reachable=row.reachable,
+            average_duration=row.average,
+            max_duration=row.eccentricity,
+            closeness=row.closeness,
+            betweenness=row.betweenness,
+            computed_at=computed_at,
+        )
+        for row in stats if row.code in ids
+    ]
+    with transaction.atomic():
+        AirportStats.objects.all().delete()
+        AirportStats.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute reachability, average and longest shortest duration, closeness "
+        "and betweenness for every airport, with one search per airport spread "
+        "over a process pool, and store them for the admin dashboard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            help="Pool processes (defaults to the number of cores; 1 runs in-process).")
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        graph = get_graph()
+        computed_at = timezone.now()
+
+        def progress(done, total):
+            self.stdout.write(f"  {done}/{total} parts")
+
+        started = time.perf_counter()
+        stats = compute_stats(graph, options['workers'], progress=progress)
+        elapsed = time.perf_counter() - started
+
+        n = save_stats(stats, computed_at)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored stats for {n} airports ({elapsed:.1f}s of searches)"
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from airport.exporter import CHUNK_SIZE, EXTENSIONS, FORMATS, TABLES, export
+
+
+class Command(BaseCommand):
+    help = "Export the airports, routes or departures table as NDJSON, CSV or columnar, optionally gzipped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--table', choices=list(TABLES), default='routes')
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Defaults to the file extension, else ndjson.")
+        parser.add_argument('--gzip', action='store_true',
+                            help="Compress the output; implied by a .gz path.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        compress = options['gzip'] or path.endswith('.gz')
+        fmt = options['format']
+        if fmt is None:
+            stem = path[:-3] if path.endswith('.gz') else path
+            fmt = next((f for f, ext in EXTENSIONS.items() if stem.endswith('.' + ext)), 'ndjson')
+
+        started = time.monotonic()
+        written = 0
+        with open(path, 'wb') as f:
+            for chunk in export(options['table'], fmt, compress, options['chunk_size']):
+                f.write(chunk)
+                written += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {options['table']} as {fmt}{' (gzip)' if compress else ''}: "
+            f"{written} bytes in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,69 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from airport.models import Departure, Route
+from airport.schedules import parse_clock, schedule_changed
+
+
+FIELDS = ('origin', 'destination', 'departs')
+
+
+class Command(BaseCommand):
+    help = "Import scheduled departures (origin, destination, departs as HH:MM) from CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--replace', action='store_true',
+                            help="Delete every existing departure first.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"File '{path}' not found")
+
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            rows = []
+            for row in reader:
+                values = [str(row.get(field) or '').strip() for field in FIELDS]
+                if not all(values):
+                    raise CommandError(f"Line {reader.line_num}: expected {', '.join(FIELDS)}")
+                try:
+                    values[2] = parse_clock(values[2])
+                except ValueError as e:
+                    raise CommandError(f"Line {reader.line_num}: {e}")
+                rows.append((reader.line_num, *values))
+
+        # The shortest travelled route between each pair, in either direction
+        codes = {code for _, origin, destination, _ in rows for code in (origin, destination)}
+        routes = {}
+        candidates = (
+            Route.objects
+            .filter(Q(origin__code__in=codes) & Q(destination__code__in=codes))
+            .exclude(duration=0)
+            .order_by('-duration', '-pk')
+            .values_list('pk', 'origin__code', 'destination__code')
+        )
+        for pk, origin, destination in candidates.iterator(chunk_size=2000):
+            routes[origin, destination] = (pk, False)
+            routes[destination, origin] = (pk, True)
+
+        departures = []
+        for line_no, origin, destination, departs in rows:
+            if (origin, destination) not in routes:
+                raise CommandError(f"Line {line_no}: no route between '{origin}' and '{destination}'")
+            pk, reverse = routes[origin, destination]
+            departures.append(Departure(route_id=pk, reverse=reverse, departs=departs))
+
+        with transaction.atomic():
+            if options['replace']:
+                Departure.objects.all().delete()
+            Departure.objects.bulk_create(departures, batch_size=1000)
+            # Bulk writes bypass the post_save signal
+            schedule_changed()
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {len(departures)} departures"))
@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from airport.importer import CHUNK_SIZE, RouteImportError, import_routes
+
+
+class Command(BaseCommand):
+    help = "Import airport links (parent_code, direction, child_code, distance) from CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if not os.path.exists(path):
+            raise CommandError(f"File '{path}' not found")
+
+        started = time.monotonic()
+
+        def progress(done, total):
+            if done % (options['chunk_size'] * 10) == 0 or done == total:
+                self.stdout.write(f"  updated {done}/{total} airports")
+
+        with open(path, newline='', encoding='utf-8') as f:
+            try:
+                added, linked = import_routes(
+                    f, fmt, chunk_size=options['chunk_size'], progress=progress
+                )
+            except RouteImportError as e:
+                for message in e.errors:
+                    self.stderr.write(message)
+                raise CommandError(f"{e.error_count} invalid row(s); nothing was imported")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {linked} links, added {added} airports "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from airport import route_cache
+from airport.graph import get_graph
+from airport.trees import compute_tree
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the shortest-path trees of the most queried origins into "
+        "the shared route cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20,
+                            help="Number of most queried origins to warm.")
+        parser.add_argument('--origins',
+                            help="Comma separated codes to warm instead of the most queried ones.")
+        parser.add_argument('--refresh', action='store_true',
+                            help="Recompute trees that are already cached.")
+
+    def handle(self, *args, **options):
+        if not route_cache.is_shared():
+            raise CommandError(
+                "The route cache keeps trees in each process's own memory, so warming it "
+                "from here has no effect; point ROUTE_CACHE_ALIAS at a shared backend."
+            )
+        if options['origins']:
+            origins = [code.strip().upper() for code in options['origins'].split(',') if code.strip()]
+        else:
+            origins = route_cache.top_origins(options['top'])
+        if not origins:
+            raise CommandError("No origins to warm; none have been queried yet.")
+
+        graph = get_graph()
+        cache = route_cache.route_cache()
+        started = time.perf_counter()
+        warmed = 0
+        for code in origins:
+            if code not in graph:
+                self.stderr.write(f"Skipping unknown airport '{code}'")
+                continue
+            key = route_cache.result_key(graph, 'tree', code)
+            if options['refresh']:
+                cache.delete(key)
+            route_cache.cached(key, lambda: compute_tree(graph, graph.index[code]))
+            warmed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {warmed} origins in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from airport.graph import publish_graph
+from airport.snapshot import read_version, snapshot_path
+
+
+class Command(BaseCommand):
+    help = "Rebuild the route graph from the database and write the graph snapshot."
+
+    def handle(self, *args, **options):
+        path = snapshot_path()
+        if not path:
+            raise CommandError("Set ROUTE_GRAPH_SNAPSHOT_PATH to enable graph snapshots.")
+
+        graph = publish_graph()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote snapshot version {read_version(path)} with {len(graph)} airports "
+            f"and {graph.edge_count} edges to {path}"
+        ))
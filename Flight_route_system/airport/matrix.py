@@ -0,0 +1,130 @@
+"""
+Optional precomputed all-pairs distance matrix for duration_between queries.
+
+The matrix is written by ``manage.py build_route_matrix`` to the file named
+by the ROUTE_MATRIX_PATH setting and memory-mapped by every worker, so all
+workers share one copy through the page cache and a lookup is a single
+array read.
+
+File layout (little endian):
+
+    header       MAGIC, format version, n, graph fingerprint (20 bytes)
+    codes        n airport codes joined by newlines, padded to 8 bytes
+    distances    n * n float64, row = source, inf when unreachable
+"""
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+from .graph import get_graph, graph_fingerprint
+
+
+MAGIC = b'RTMATRIX'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sII20s')
+
+_lock = threading.Lock()
+_matrix = None
+_stat = None
+
+
+def _padded(length):
+    return (length + 7) // 8 * 8
+
+
+class DistanceMatrix:
+    """Read-only view over a memory-mapped matrix file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n, fingerprint = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"'{path}' is not a route matrix file")
+
+        offset = HEADER.size
+        codes_length = struct.unpack_from('<Q', self._mmap, offset)[0]
+        offset += 8
+        codes = bytes(self._mmap[offset:offset + codes_length]).decode()
+        offset += _padded(codes_length)
+
+        self.n = n
+        self.fingerprint = fingerprint
+        self.codes = codes.split('\n') if n else []
+        self.index = {code: i for i, code in enumerate(self.codes)}
+
+        self.distances = memoryview(self._mmap)[offset:offset + n * n * 8].cast('d')
+
+    def distance(self, start_code, end_code):
+        """Shortest distance between two codes, inf when unreachable."""
+        return self.distances[self.index[start_code] * self.n + self.index[end_code]]
+
+
+def write_matrix(path, progress=None):
+    """
+    Run Dijkstra from every airport of the current graph and write the
+    result to path. The file is replaced atomically so running workers
+    never map a half-written matrix. Returns the number of airports.
+    """
+    graph = get_graph()
+    n = len(graph)
+    encoded = '\n'.join(graph.codes).encode()
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, n, graph_fingerprint()))
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded.ljust(_padded(len(encoded)), b'\0'))
+
+        # Rows are written as they are computed, so only one is held in memory
+        for source in range(n):
+            distances, _, _ = graph.shortest_paths(source)
+            distances.tofile(f)
+            if progress:
+                progress(source + 1, n)
+
+    os.replace(tmp_path, path)
+    return n
+
+
+def load_matrix():
+    """
+    Map the file named by ROUTE_MATRIX_PATH, remapping it when it has been
+    rebuilt on disk. Called at worker startup and before every lookup.
+    """
+    global _matrix, _stat
+    path = getattr(settings, 'ROUTE_MATRIX_PATH', None)
+    if not path:
+        return None
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    with _lock:
+        if stat != _stat:
+            # The old mapping is released once no query is reading it
+            _stat = stat
+            try:
+                _matrix = DistanceMatrix(path)
+            except (OSError, ValueError, struct.error):
+                _matrix = None
+        return _matrix
+
+
+def get_matrix():
+    """
+    Return the mapped matrix if it was built from the current graph,
+    otherwise None so callers fall back to a live search.
+    """
+    matrix = load_matrix()
+    if matrix is None or matrix.fingerprint != graph_fingerprint():
+        return None
+    return matrix
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='airport',
+            name='left_distance',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='airport',
+            name='right_distance',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+    ]
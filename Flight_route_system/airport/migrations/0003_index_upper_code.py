@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:38
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0002_index_route_distances'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airport',
+            index=models.Index(django.db.models.functions.text.Upper('code'), models.F('code'), name='airport_code_upper_idx'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Rows written per bulk query, and held in memory at once
+CHUNK = 1000
+
+
+def copy_links_to_routes(apps, schema_editor):
+    """One Route per left/right link, in airport then left/right order."""
+    Airport = apps.get_model('airport', 'Airport')
+    Route = apps.get_model('airport', 'Route')
+    db_alias = schema_editor.connection.alias
+    routes = []
+    rows = Airport.objects.using(db_alias).order_by('pk').values_list(
+        'pk', 'left_id', 'left_distance', 'right_id', 'right_distance',
+    )
+    for pk, left_id, left_distance, right_id, right_distance in rows.iterator(chunk_size=2000):
+        for slot, linked_id, distance in (('left', left_id, left_distance), ('right', right_id, right_distance)):
+            if linked_id is not None:
+                # A link without a distance was never travelled; 0 keeps it that way
+                routes.append(Route(origin_id=pk, destination_id=linked_id,
+                                    duration=distance or 0, slot=slot))
+        if len(routes) >= CHUNK:
+            Route.objects.using(db_alias).bulk_create(routes)
+            routes = []
+    Route.objects.using(db_alias).bulk_create(routes)
+
+
+def copy_routes_to_links(apps, schema_editor):
+    """Restore the left/right columns; routes outside the slots are dropped."""
+    Airport = apps.get_model('airport', 'Airport')
+    Route = apps.get_model('airport', 'Route')
+    db_alias = schema_editor.connection.alias
+    fields = ['left', 'left_distance', 'right', 'right_distance']
+    airports = {}
+    # Both slots of an airport are read together, so a chunk ends between airports
+    routes = Route.objects.using(db_alias).exclude(slot=None).order_by('origin', 'slot')
+    for route in routes.iterator(chunk_size=2000):
+        if route.origin_id not in airports and len(airports) >= CHUNK:
+            Airport.objects.using(db_alias).bulk_update(list(airports.values()), fields)
+            airports = {}
+        airport = airports.setdefault(route.origin_id, Airport(pk=route.origin_id))
+        setattr(airport, f'{route.slot}_id', route.destination_id)
+        setattr(airport, f'{route.slot}_distance', route.duration)
+    Airport.objects.using(db_alias).bulk_update(list(airports.values()), fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0003_index_upper_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Route',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('duration', models.FloatField()),
+                ('slot', models.CharField(blank=True, choices=[('left', 'Left'), ('right', 'Right')], max_length=5, null=True)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incoming_routes', to='airport.airport')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='routes', to='airport.airport')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['duration'], name='route_duration_idx')],
+                'constraints': [models.UniqueConstraint(fields=('origin', 'slot'), name='route_origin_slot_unique')],
+            },
+        ),
+        migrations.RunPython(copy_links_to_routes, copy_routes_to_links),
+        migrations.RemoveField(
+            model_name='airport',
+            name='left',
+        ),
+        migrations.RemoveField(
+            model_name='airport',
+            name='left_distance',
+        ),
+        migrations.RemoveField(
+            model_name='airport',
+            name='right',
+        ),
+        migrations.RemoveField(
+            model_name='airport',
+            name='right_distance',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0004_route'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Departure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reverse', models.BooleanField(default=False)),
+                ('departs', models.PositiveIntegerField()),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='departures', to='airport.route')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['departs'], name='departure_time_idx'), models.Index(fields=['route', 'reverse', 'departs'], name='departure_link_idx')],
+            },
+        ),
+    ]
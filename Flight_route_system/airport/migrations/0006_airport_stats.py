@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0005_departure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AirportStats',
+            fields=[
+                ('airport', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='airport.airport')),
+                ('reachable', models.PositiveIntegerField()),
+                ('average_duration', models.FloatField(null=True)),
+                ('max_duration', models.FloatField(null=True)),
+                ('closeness', models.FloatField()),
+                ('betweenness', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-betweenness'], name='airport_stats_hub_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0006_airport_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['origin', 'destination'], name='route_pair_idx'),
+        ),
+    ]
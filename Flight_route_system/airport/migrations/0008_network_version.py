@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+def create_row(apps, schema_editor):
+    NetworkVersion = apps.get_model('airport', 'NetworkVersion')
+    NetworkVersion.objects.using(schema_editor.connection.alias).get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0007_route_pair_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graph', models.PositiveBigIntegerField(default=0)),
+                ('schedule', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_row, migrations.RunPython.noop),
+    ]
@@ -2,23 +2,145 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
 
 class Airport(models.Model):
     code = models.CharField(max_length=10, unique=True)
-    left = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='left_airport')
-    right = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='right_airport')
-    left_distance = models.FloatField(null=True, blank=True)
-    right_distance = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Case-insensitive prefix search and keyset pagination in airport_list
+            models.Index(Upper('code'), 'code', name='airport_code_upper_idx'),
+        ]
     
     def __str__(self):
         return self.code
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_code()
+        return instance
+
+    def remember_code(self):
+        """Note the code as stored, so signals can tell whether a save renamed it."""
+        self._stored_code = self.__dict__.get('code')
+
+    def slot_route(self, slot):
+        """The route in the 'left' or 'right' slot, or None."""
+        return self.routes.filter(slot=slot).select_related('destination').first()
+
+
+class Route(models.Model):
+    """
+    A direct route between two airports, usable in both directions.
+
+    An airport has any number of routes; at most one of them fills each of
+    its 'left' and 'right' slots, the chains find_nth_node walks. Routes
+    with a duration of 0 are kept for the chains but are not travelled.
+    """
+    SLOTS = [('left', 'Left'), ('right', 'Right')]
+
+    origin = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='routes')
+    destination = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='incoming_routes')
+    duration = models.FloatField()
+    # NULL for routes outside the two slots, so any number of them can exist
+    slot = models.CharField(max_length=5, choices=SLOTS, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['origin', 'slot'], name='route_origin_slot_unique'),
+        ]
+        indexes = [
+            # Longest and shortest direct routes; ties are ordered by the implicit pk
+            models.Index(fields=['duration'], name='route_duration_idx'),
+            # Parallel routes between two airports
+            models.Index(fields=['origin', 'destination'], name='route_pair_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.origin} -> {self.destination}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_route()
+        return instance
+
+    def remember_route(self):
+        """Note the ends and duration as stored, so signals can tell what a save removed."""
+        self._stored_route = (
+            self.__dict__.get('origin_id'), self.__dict__.get('destination_id'), self.__dict__.get('duration'),
+        )
+
+
+class Departure(models.Model):
+    """
+    A scheduled departure over a route, in minutes after midnight of the
+    service day; times past 24:00 run into the next day. Reverse departures
+    fly from the route's destination to its origin. The flight arrives the
+    shortest route duration between the two airports later.
+    """
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='departures')
+    reverse = models.BooleanField(default=False)
+    departs = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # The timetable is loaded in departure order
+            models.Index(fields=['departs'], name='departure_time_idx'),
+            # One sorted run of departures per direction of a route
+            models.Index(fields=['route', 'reverse', 'departs'], name='departure_link_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.route} at {self.departs}"
+
+
+class NetworkVersion(models.Model):
+    """
+    Edit counts of the route graph and the timetable, in a single row that
+    every process can read (see versions.py).
+    """
+    graph = models.PositiveBigIntegerField(default=0)
+    schedule = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"graph {self.graph}, schedule {self.schedule}"
+
+
+class AirportStats(models.Model):
+    """
+    Reachability and centrality of an airport, written for all airports at
+    once by the compute_airport_stats command (see reachability.py).
+    Durations are None for an airport without routes.
+    """
+    airport = models.OneToOneField(Airport, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    reachable = models.PositiveIntegerField()
+    average_duration = models.FloatField(null=True)
+    max_duration = models.FloatField(null=True)
+    closeness = models.FloatField()
+    betweenness = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Top hubs on the admin dashboard
+            models.Index(fields=['-betweenness'], name='airport_stats_hub_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.airport} stats"
+
 
 def add_next_airport(parent_code, direction, child_code, distance):
     """
     Adds a left or right child to a parent airport.
     direction -> 'left' or 'right'
     """
+    if direction not in ('left', 'right'):
+        raise ValueError("Direction must be 'left' or 'right'")
     try:
         parent = Airport.objects.get(code=parent_code)
     except Airport.DoesNotExist:
@@ -26,15 +148,47 @@ def add_next_airport(parent_code, direction, child_code, distance):
 
     child, _ = Airport.objects.get_or_create(code=child_code)
 
-    if direction == 'left':
-        parent.left = child
-        parent.left_distance = distance
-    elif direction == 'right':
-        parent.right = child
-        parent.right_distance = distance
-    else:
-        raise ValueError("Direction must be 'left' or 'right'")
-
-    parent.save()
+    # The slot's route is replaced, like the old left/right columns
+    Route.objects.update_or_create(
+        origin=parent, slot=direction,
+        defaults={'destination': child, 'duration': distance},
+    )
     print(f"Added {direction} node '{child_code}' to '{parent_code}'")
     return child
+
+
+def add_route(origin_code, destination_code, duration):
+    """
+    Adds a route outside the left/right slots, or updates the duration of
+    an existing one between the same airports.
+    """
+    try:
+        origin = Airport.objects.get(code=origin_code)
+    except Airport.DoesNotExist:
+        raise ValueError(f"Origin airport '{origin_code}' not found")
+
+    destination, _ = Airport.objects.get_or_create(code=destination_code)
+    route, _ = Route.objects.update_or_create(
+        origin=origin, destination=destination, slot=None,
+        defaults={'duration': duration},
+    )
+    return route
+
+
+def add_departure(origin_code, destination_code, departs):
+    """
+    Schedules a departure from origin to destination at departs (minutes
+    after midnight) on the shortest travelled route between them.
+    """
+    route = (
+        Route.objects
+        .filter(Q(origin__code=origin_code, destination__code=destination_code)
+                | Q(origin__code=destination_code, destination__code=origin_code))
+        .exclude(duration=0)
+        .select_related('origin')
+        .order_by('duration', 'pk')
+        .first()
+    )
+    if route is None:
+        raise ValueError(f"No route between '{origin_code}' and '{destination_code}'")
+    return Departure.objects.create(route=route, reverse=route.origin.code != origin_code, departs=departs)
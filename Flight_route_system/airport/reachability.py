@@ -0,0 +1,188 @@
+"""
+All-origins reachability and centrality of the route network.
+
+For every airport, one single-source Dijkstra over the route graph gives:
+
+    reachable     airports reachable from it
+    average       mean shortest duration to them
+    eccentricity  longest shortest duration to any of them
+    closeness     reachable / total duration, scaled by the share of the
+                  network reached (Wasserman-Faust), so airports in small
+                  components do not rank as hubs
+    betweenness   share of all shortest routes between other airports
+                  that pass through it (Brandes' dependency accumulation,
+                  run on the same search)
+
+The searches are independent, so they run in a multiprocessing pool. With
+the fork start method the pool processes inherit the graph's CSR arrays
+copy-on-write and nothing is sent to them but a part number; with spawn
+the arrays are pickled once per process. Each process returns the rows of
+its sources and one betweenness array for all of them.
+
+This module only handles the arrays and does not import Django, so spawned
+processes can load it without setting Django up.
+"""
+import gc
+import heapq
+import multiprocessing
+import os
+from array import array
+from collections import namedtuple
+from functools import partial
+
+
+INF = float('inf')
+# Parts per process: enough to even out uneven parts, few enough that
+# returning one betweenness array per part stays cheap
+PARTS_PER_WORKER = 4
+
+# average and eccentricity are None for an airport without routes
+OriginStats = namedtuple(
+    'OriginStats', ['code', 'reachable', 'average', 'eccentricity', 'closeness', 'betweenness']
+)
+
+# (offsets, targets, weights) of the graph, set in the parent before the
+# pool forks or by the pool initializer
+_csr = None
+
+
+def _share(csr):
+    global _csr
+    _csr = csr
+
+
+def search(offsets, targets, weights, source, betweenness):
+    """
+    Dijkstra from source that also counts shortest paths, then adds each
+    node's dependency on source to betweenness.
+
+    Returns (reachable, total duration, eccentricity).
+    """
+    n = len(offsets) - 1
+    distances = array('d', [INF]) * n
+    paths = array('d', bytes(8 * n))
+    predecessors = {}
+    visited = bytearray(n)
+    order = []
+    distances[source] = 0
+    paths[source] = 1
+    queue = [(0, source)]
+
+    while queue:
+        dist, node = heapq.heappop(queue)
+        if visited[node]:
+            continue
+        visited[node] = 1
+        order.append(node)
+
+        for e in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[e]
+            new_dist = dist + weights[e]
+            if new_dist < distances[neighbor]:
+                distances[neighbor] = new_dist
+                paths[neighbor] = paths[node]
+                predecessors[neighbor] = [node]
+                heapq.heappush(queue, (new_dist, neighbor))
+            elif new_dist == distances[neighbor]:
+                paths[neighbor] += paths[node]
+                predecessors[neighbor].append(node)
+
+    # Farthest first, so every node's dependency is complete before it is
+    # passed on to its predecessors
+    dependency = array('d', bytes(8 * n))
+    for node in reversed(order):
+        share = (1 + dependency[node]) / paths[node]
+        for previous in predecessors.get(node, ()):
+            dependency[previous] += paths[previous] * share
+        if node != source:
+            betweenness[node] += dependency[node]
+
+    total = 0
+    for node in order:
+        total += distances[node]
+    return len(order) - 1, total, distances[order[-1]]
+
+
+def _run_part(part, parts):
+    """Search from every parts-th source starting at part."""
+    offsets, targets, weights = _csr
+    betweenness = array('d', bytes(8 * (len(offsets) - 1)))
+    rows = []
+    for source in range(part, len(offsets) - 1, parts):
+        rows.append((source, *search(offsets, targets, weights, source, betweenness)))
+    return rows, betweenness
+
+
+def compute_stats(graph, workers=None, progress=None):
+    """
+    OriginStats for every airport of graph, in node id order, searched in
+    workers processes (all cores by default; 1 runs in this process).
+    progress(done, total) is called as parts of the sources finish.
+    """
+    n = len(graph)
+    workers = max(1, min(workers or os.cpu_count() or 1, n))
+    parts = 1 if workers == 1 else workers * PARTS_PER_WORKER
+    csr = (graph.offsets, graph.targets, graph.weights)
+
+    results = []
+    if workers == 1:
+        _share(csr)
+        try:
+            results.append(_run_part(0, 1))
+        finally:
+            _share(None)
+        if progress:
+            progress(1, 1)
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        if 'fork' in methods:
+            context = multiprocessing.get_context('fork')
+            _share(csr)
+            initializer, initargs = None, ()
+            # Keep the collector in the pool processes away from the
+            # inherited objects, so their pages stay shared
+            gc.freeze()
+        else:
+            context = multiprocessing.get_context('spawn')
+            initializer, initargs = _share, (csr,)
+        try:
+            # Pool processes never touch the database connections they inherit
+            with context.Pool(workers, initializer, initargs) as pool:
+                run = partial(_run_part, parts=parts)
+                for done, result in enumerate(pool.imap_unordered(run, range(parts)), 1):
+                    results.append(result)
+                    if progress:
+                        progress(done, parts)
+        finally:
+            if 'fork' in methods:
+                gc.unfreeze()
+                _share(None)
+
+    return _combine(graph.codes, results)
+
+
+def _combine(codes, results):
+    n = len(codes)
+    betweenness = array('d', bytes(8 * n))
+    rows = [None] * n
+    for part_rows, part_betweenness in results:
+        for i, value in enumerate(part_betweenness):
+            betweenness[i] += value
+        for source, reachable, total, eccentricity in part_rows:
+            rows[source] = (reachable, total, eccentricity)
+
+    # The searches count every pair from both ends, so normalize by the
+    # ordered pairs of other airports
+    pairs = (n - 1) * (n - 2) if n > 2 else 1
+    stats = []
+    for node, (reachable, total, eccentricity) in enumerate(rows):
+        closeness = reachable / total * reachable / (n - 1) if reachable else 0.0
+        stats.append(OriginStats(
+            codes[node],
+            reachable,
+            total / reachable if reachable else None,
+            eccentricity if reachable else None,
+            closeness,
+            betweenness[node] / pairs,
+        ))
+    return stats
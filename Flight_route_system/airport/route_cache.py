@@ -0,0 +1,202 @@
+"""
+Route results shared by all worker processes through Django's cache
+framework.
+
+Shortest-path trees and point-to-point durations are stored in the cache
+named by the ROUTE_CACHE_ALIAS setting, so a result computed by one worker
+serves the others. Keys start with graph_key(graph), which is the same in
+every process holding the same graph, so edits move every worker to fresh
+keys and stale entries simply age out.
+
+cached() protects expensive computations against stampedes: the first
+caller takes a short lock and computes while the others wait for its result,
+and entries are refreshed a little before they expire with a probability
+that rises as expiry nears (probabilistic early recomputation), so a popular
+key never expires for everyone at once.
+
+Origins are counted as they are queried; warm_route_cache precomputes the
+trees of the most queried ones. Trees are only stored here when the cache
+is shared between processes: in a per-process backend such as local
+memory they would be a second, unbudgeted copy of the tree cache.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+DEFAULT_TIMEOUT = 60 * 60
+# Seconds a computing caller holds the lock, and others wait for its result
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 10
+POLL_INTERVAL = 0.05
+# Higher values refresh earlier; 1 is the usual choice
+EARLY_REFRESH_BETA = 1.0
+
+ORIGIN_COUNTS_KEY = 'route:origins'
+# Local origin counts are merged into the shared ones every FLUSH_EVERY queries
+FLUSH_EVERY = 100
+MAX_TRACKED_ORIGINS = 1000
+# Backends whose entries live in the memory of the process that wrote them
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.early_refreshes = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+stats = CacheStats()
+
+_origins_lock = threading.Lock()
+_origins = Counter()
+_pending = 0
+
+
+def route_cache():
+    return caches[getattr(settings, 'ROUTE_CACHE_ALIAS', 'default')]
+
+
+def is_shared():
+    """Whether other processes see what this one stores in the route cache."""
+    alias = getattr(settings, 'ROUTE_CACHE_ALIAS', 'default')
+    return settings.CACHES[alias]['BACKEND'] not in LOCAL_BACKENDS
+
+
+def default_timeout():
+    return getattr(settings, 'ROUTE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def graph_key(graph):
+    """
+    Digest identifying graph and its node ids in every process. The graph
+    is named by the shared edit count it was built at or, with a snapshot,
+    by the fingerprint stored in it, so the edges are not hashed on the
+    request path; only graphs from neither, such as one built before an
+    edit commits, are hashed here.
+    """
+    key = getattr(graph, '_cache_key', None)
+    if key is None:
+        digest = hashlib.sha1('\n'.join(graph.codes).encode())
+        if graph.edit_count is not None:
+            digest.update(f'\0{graph.edit_count}'.encode())
+        else:
+            digest.update(graph.fingerprint())
+        key = graph._cache_key = digest.hexdigest()[:24]
+    return key
+
+
+def result_key(graph, kind, *parts):
+    return ':'.join(['route', graph_key(graph), kind, *(quote(part, safe='') for part in parts)])
+
+
+def peek(key):
+    """The cached value for key, or None without computing anything."""
+    entry = route_cache().get(key)
+    if entry is None:
+        return None
+    stats.hits += 1
+    return entry[0]
+
+
+def cached(key, compute, timeout=None):
+    """Return the cached value for key, computing and storing it if needed."""
+    cache = route_cache()
+    timeout = timeout or default_timeout()
+    lock = f'{key}:lock'
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, cost = entry
+        # -log(u) is usually small but occasionally large, so one caller
+        # refreshes early at random, more often as expiry approaches
+        if time.time() - cost * EARLY_REFRESH_BETA * math.log(1 - random.random()) < expires:
+            stats.hits += 1
+            return value
+        if not cache.add(lock, 1, LOCK_TIMEOUT):
+            # Someone is already refreshing it
+            stats.hits += 1
+            return value
+        stats.early_refreshes += 1
+        return _compute(cache, key, lock, compute, timeout)
+
+    stats.misses += 1
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        return _compute(cache, key, lock, compute, timeout)
+
+    # Another process is computing this key: wait for its result
+    stats.waits += 1
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+def _compute(cache, key, lock, compute, timeout):
+    try:
+        started = time.time()
+        value = compute()
+        cost = time.time() - started
+        cache.set(key, (value, time.time() + timeout, cost), timeout)
+        return value
+    finally:
+        cache.delete(lock)
+
+
+def record_origin(code):
+    """Count a query from code towards the warm-up ranking."""
+    global _pending
+    with _origins_lock:
+        _origins[code] += 1
+        _pending += 1
+        if _pending < FLUSH_EVERY:
+            return
+        local = _origins.copy()
+        _origins.clear()
+        _pending = 0
+    flush_origins(local)
+
+
+def flush_origins(local=None):
+    """
+    Merge local origin counts into the shared ones. Concurrent flushes from
+    different workers can drop each other's counts, which only blurs the
+    ranking.
+    """
+    global _pending
+    if local is None:
+        with _origins_lock:
+            local = _origins.copy()
+            _origins.clear()
+            _pending = 0
+    if not local:
+        return
+    cache = route_cache()
+    counts = Counter(cache.get(ORIGIN_COUNTS_KEY) or {})
+    counts.update(local)
+    cache.set(ORIGIN_COUNTS_KEY, dict(counts.most_common(MAX_TRACKED_ORIGINS)), None)
+
+
+def top_origins(n):
+    """The n most queried origin codes, most queried first."""
+    flush_origins()
+    counts = route_cache().get(ORIGIN_COUNTS_KEY) or {}
+    return [code for code, _ in Counter(counts).most_common(n)]
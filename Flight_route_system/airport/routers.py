@@ -0,0 +1,97 @@
+"""
+Database router sending the reads of the route and list views to a
+read-only connection.
+
+Views wrapped in read_replica (or code inside reading_from_replica()) read
+through the database alias named by the ROUTE_READ_DATABASE setting; every
+other read and all writes use 'default'. With SQLite the replica is the same
+file opened read-only: in WAL mode its readers never wait for a writer, and
+a bug in a read path cannot write. A real replica (another server) works the
+same way, only with replication lag.
+
+The process-wide structures those views use (route graph, chain index,
+timetable) are always built from 'default', and keyed on edit counts read
+from it (see versions.py). Built from a lagging replica they would keep
+old data under the new version until the next edit.
+
+When the replica names the same database as 'default', as the test runner's
+mirror does, reads stay on 'default'.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_reading = ContextVar('route_read_replica', default=False)
+
+
+def replica_alias():
+    """The alias reads can be sent to, or None to read from 'default'."""
+    alias = getattr(settings, 'ROUTE_READ_DATABASE', None)
+    if not alias or alias == DEFAULT_DB_ALIAS or alias not in settings.DATABASES:
+        return None
+    if connections[alias].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        return None
+    return alias
+
+
+@contextmanager
+def reading_from_replica():
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def iterate_from_replica(iterable):
+    """
+    Iterate with every step reading from the replica, for generators that
+    run while a response streams, after the view itself has returned.
+    """
+    iterator = iter(iterable)
+    while True:
+        with reading_from_replica():
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def read_replica(view_func):
+    """Run a read-only view with its queries sent to the replica."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(*args, **kwargs):
+            with reading_from_replica():
+                return await view_func(*args, **kwargs)
+    else:
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            with reading_from_replica():
+                return view_func(*args, **kwargs)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reading.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == getattr(settings, 'ROUTE_READ_DATABASE', None) and db != DEFAULT_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,199 @@
+"""
+Route planning on the cached graph: the actual airport sequence of the
+shortest route, the k shortest loopless alternatives (Yen's algorithm) and
+the route with the fewest hops, each optionally limited to a hop count.
+
+The searches use A* with the exact distances to the destination as the
+heuristic, read from the destination's shortest-path tree (see trees.py).
+That bound stays valid when Yen's algorithm removes nodes and links, so each
+spur search heads straight for the destination instead of flooding the
+graph, and spur searches that cannot beat the routes already found are
+skipped.
+"""
+import heapq
+from collections import deque, namedtuple
+
+
+INF = float('inf')
+
+# distance is the total duration, hops the number of links, path the node ids
+Route = namedtuple('Route', ['distance', 'hops', 'path'])
+
+
+def path_distance(graph, path):
+    """Total distance of a node path, summed from its first airport."""
+    distance = 0
+    for node, following in zip(path, path[1:]):
+        distance += graph.edge_weight(node, following)
+    return distance
+
+
+def hops_to(graph, target):
+    """Fewest links from every node id to target (BFS), -1 if unreachable."""
+    hops = [-1] * len(graph)
+    hops[target] = 0
+    queue = deque([target])
+    offsets, targets = graph.offsets, graph.targets
+    while queue:
+        node = queue.popleft()
+        for e in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[e]
+            if hops[neighbor] < 0:
+                hops[neighbor] = hops[node] + 1
+                queue.append(neighbor)
+    return hops
+
+
+def constrained_search(graph, source, target, potential, banned_nodes=frozenset(),
+                       banned_edges=frozenset(), max_hops=None, hop_bound=None, limit=INF):
+    """
+    A* from source to target avoiding banned nodes and (from, to) links,
+    using at most max_hops links and never exceeding limit. potential[v] must
+    not overestimate the distance from v to target; hop_bound[v] must not
+    overestimate the links from v to target. Returns the node path or None.
+    """
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    # Without a hop limit every label has hops 0, which is plain A*
+    step = 0 if max_hops is None else 1
+
+    labels = [(source, None)]                   # (node, parent label)
+    best = {(source, 0): 0}
+    queue = [(potential[source], 0, 0, 0)]      # (estimate, distance, hops, label)
+    # Fewest hops among the labels settled at each node; a later label there
+    # is longer, so it is only useful if it uses fewer hops
+    settled_hops = {}
+
+    while queue:
+        _, dist, hops, label = heapq.heappop(queue)
+        node = labels[label][0]
+        if settled_hops.get(node, INF) <= hops:
+            continue
+        settled_hops[node] = hops
+
+        if node == target:
+            path = []
+            while label is not None:
+                node, label = labels[label]
+                path.append(node)
+            path.reverse()
+            return path
+
+        next_hops = hops + step
+        if max_hops is not None and next_hops > max_hops:
+            continue
+        for e in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[e]
+            if neighbor in banned_nodes or (node, neighbor) in banned_edges:
+                continue
+            if settled_hops.get(neighbor, INF) <= next_hops:
+                continue
+            if hop_bound is not None and next_hops + hop_bound[neighbor] > max_hops:
+                continue
+            new_dist = dist + weights[e]
+            estimate = new_dist + potential[neighbor]
+            if estimate > limit:
+                continue
+            key = (neighbor, next_hops)
+            if new_dist < best.get(key, INF):
+                best[key] = new_dist
+                labels.append((neighbor, label))
+                heapq.heappush(queue, (estimate, new_dist, next_hops, len(labels) - 1))
+
+    return None
+
+
+def k_shortest_routes(graph, source, target, k, potential, max_hops=None):
+    """
+    Up to k loopless routes from source to target in order of distance,
+    each using at most max_hops links (Yen's algorithm).
+    """
+    if potential[source] == INF:
+        return []
+    hop_bound = None
+    if max_hops is not None:
+        hop_bound = [h if h >= 0 else max_hops + 1 for h in hops_to(graph, target)]
+
+    first = constrained_search(graph, source, target, potential,
+                               max_hops=max_hops, hop_bound=hop_bound)
+    if first is None:
+        return []
+
+    routes = [Route(path_distance(graph, first), len(first) - 1, first)]
+    candidates = []
+    seen = {tuple(first)}
+
+    while len(routes) < k:
+        previous = routes[-1].path
+        needed = k - len(routes)
+        root_distance = 0
+        for i in range(len(previous) - 1):
+            spur, root = previous[i], previous[:i + 1]
+            if i:
+                root_distance += graph.edge_weight(previous[i - 1], spur)
+
+            # Skip spurs that cannot produce one of the routes still needed
+            limit = INF
+            if len(candidates) >= needed:
+                limit = heapq.nsmallest(needed, candidates)[-1][0] - root_distance
+                if potential[spur] > limit:
+                    continue
+
+            banned_edges = {
+                (route.path[i], route.path[i + 1])
+                for route in routes if route.path[:i + 1] == root
+            }
+            spur_path = constrained_search(
+                graph, spur, target, potential,
+                banned_nodes=frozenset(root[:-1]),
+                banned_edges=banned_edges,
+                max_hops=None if max_hops is None else max_hops - i,
+                hop_bound=hop_bound,
+                limit=limit,
+            )
+            if spur_path is None:
+                continue
+            path = root[:-1] + spur_path
+            if tuple(path) not in seen:
+                seen.add(tuple(path))
+                heapq.heappush(candidates, (path_distance(graph, path), len(path) - 1, path))
+
+        if not candidates:
+            break
+        routes.append(Route(*heapq.heappop(candidates)))
+
+    return routes
+
+
+def fewest_hops_route(graph, source, target, max_hops=None):
+    """
+    Route with the fewest links, preferring the shortest distance among
+    routes with equally few links, or None.
+    """
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    best = {source: (0, 0)}
+    parents = {source: None}
+    queue = [(0, 0, source)]
+    visited = set()
+
+    while queue:
+        hops, dist, node = heapq.heappop(queue)
+        if node in visited:
+            continue
+        visited.add(node)
+        if node == target:
+            path = [node]
+            while parents[path[-1]] is not None:
+                path.append(parents[path[-1]])
+            path.reverse()
+            return Route(path_distance(graph, path), hops, path)
+        if max_hops is not None and hops >= max_hops:
+            continue
+        for e in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[e]
+            key = (hops + 1, dist + weights[e])
+            if key < best.get(neighbor, (INF, INF)):
+                best[neighbor] = key
+                parents[neighbor] = node
+                heapq.heappush(queue, (*key, neighbor))
+
+    return None
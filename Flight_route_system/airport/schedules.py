@@ -0,0 +1,235 @@
+"""
+Timetable of scheduled departures and time-dependent route searches.
+
+Every Departure becomes one connection (from, to, departs, arrives) and the
+timetable keeps them as four flat arrays sorted by departure time, with
+airports numbered as in the route graph. Searches use the Connection Scan
+Algorithm, a single linear scan over those arrays:
+
+    earliest_arrival  scans forward from the departure time and stops as
+                      soon as no later connection can arrive earlier
+    profile           scans backwards once and yields every useful
+                      departure in a time window with its earliest arrival,
+                      instead of one search per departure time
+
+A change of connection at an airport needs at least the SCHEDULE_MIN_TRANSFER
+setting (minutes). The timetable is rebuilt lazily when the route graph or
+any departure changes, in this process or, through the shared edit counts
+(see versions.py), in another one.
+"""
+import bisect
+import threading
+from array import array
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from . import versions
+from .graph import get_graph, on_commit_once
+from .models import Departure
+
+
+INF = float('inf')
+# Rows fetched per round trip while loading the timetable
+CHUNK_SIZE = 2000
+
+# legs are connection ids, first to last
+Journey = namedtuple('Journey', ['departs', 'arrives', 'legs'])
+
+_lock = threading.Lock()
+_timetable = None
+_version = 0
+
+
+class Timetable:
+    def __init__(self, graph, departs, arrives, sources, targets):
+        self.graph = graph
+        self.departs = departs
+        self.arrives = arrives
+        self.sources = sources
+        self.targets = targets
+
+    @classmethod
+    def from_departures(cls, graph, rows):
+        """
+        rows: (origin_code, destination_code, reverse, departs) in departure
+        order. A departure takes the graph's duration between its airports,
+        the shortest of their routes; departures between airports the graph
+        does not link are skipped.
+        """
+        departs, arrives = array('d'), array('d')
+        sources, targets = array('i'), array('i')
+        index = graph.index
+        durations = {}
+        for origin, destination, reverse, time in rows:
+            u, v = index.get(origin.upper()), index.get(destination.upper())
+            if u is None or v is None:
+                continue
+            if reverse:
+                u, v = v, u
+            if (u, v) not in durations:
+                durations[u, v] = graph.edge_weight(u, v)
+            duration = durations[u, v]
+            if duration is None:
+                continue
+            departs.append(time)
+            arrives.append(time + duration)
+            sources.append(u)
+            targets.append(v)
+        return cls(graph, departs, arrives, sources, targets)
+
+    def __len__(self):
+        return len(self.departs)
+
+    def leg(self, c):
+        """(from code, to code, departs, arrives) of connection c."""
+        codes = self.graph.codes
+        return codes[self.sources[c]], codes[self.targets[c]], self.departs[c], self.arrives[c]
+
+    def earliest_arrival(self, source, target, depart_at, transfer=0):
+        """The Journey arriving first at target leaving source at depart_at or later, or None."""
+        departs, arrives, sources, targets = self.departs, self.arrives, self.sources, self.targets
+        arrival = array('d', [INF]) * len(self.graph)
+        via = array('i', [-1]) * len(self.graph)
+        arrival[source] = depart_at
+
+        for c in range(bisect.bisect_left(departs, depart_at), len(departs)):
+            dep = departs[c]
+            if dep >= arrival[target]:
+                break
+            u = sources[c]
+            ready = arrival[u] if u == source else arrival[u] + transfer
+            v = targets[c]
+            if ready <= dep and arrives[c] < arrival[v]:
+                arrival[v] = arrives[c]
+                via[v] = c
+
+        if target == source or arrival[target] == INF:
+            return None
+        legs = []
+        node = target
+        while node != source:
+            c = via[node]
+            legs.append(c)
+            node = sources[c]
+        legs.reverse()
+        return Journey(departs[legs[0]], arrival[target], legs)
+
+    def profile(self, source, target, start, end, transfer=0):
+        """
+        Every Pareto-optimal Journey from source to target leaving between
+        start and end, earliest departure first: each one leaves later or
+        arrives earlier than the others.
+        """
+        departs, arrives, sources, targets = self.departs, self.arrives, self.sources, self.targets
+        # Per airport, the journeys to target found so far, latest departure
+        # first: negated departure times (ascending, for bisect), arrival
+        # times (descending) and the first connection of each
+        profiles = {}
+
+        def best(node, time):
+            """Index in profiles[node] of the earliest arrival leaving at time or later."""
+            entry = profiles.get(node)
+            if entry is None:
+                return None, -1
+            i = bisect.bisect_right(entry[0], -time) - 1
+            return entry, i
+
+        for c in range(len(departs) - 1, bisect.bisect_left(departs, start) - 1, -1):
+            u, v = sources[c], targets[c]
+            if u == target:
+                continue
+            if v == target:
+                arrival = arrives[c]
+            else:
+                entry, i = best(v, arrives[c] + transfer)
+                if i < 0:
+                    continue
+                arrival = entry[1][i]
+            entry = profiles.get(u)
+            if entry is None:
+                entry = profiles[u] = ([], [], [])
+            elif arrival >= entry[1][-1]:
+                # A later departure arrives as early
+                continue
+            entry[0].append(-departs[c])
+            entry[1].append(arrival)
+            entry[2].append(c)
+
+        journeys = []
+        entry = profiles.get(source, ([], [], []))
+        for neg_depart, arrival, c in zip(*entry):
+            if -neg_depart > end:
+                continue
+            legs = [c]
+            while targets[legs[-1]] != target:
+                following, i = best(targets[legs[-1]], arrives[legs[-1]] + transfer)
+                legs.append(following[2][i])
+            journeys.append(Journey(-neg_depart, arrival, legs))
+        journeys.reverse()
+        return journeys
+
+
+def min_transfer():
+    return getattr(settings, 'SCHEDULE_MIN_TRANSFER', 0)
+
+
+def build_timetable(graph):
+    # Always read from the primary (see routers.py)
+    rows = (
+        Departure.objects.using(DEFAULT_DB_ALIAS)
+        .exclude(route__duration=0)
+        .order_by('departs', 'pk')
+        .values_list('route__origin__code', 'route__destination__code', 'reverse', 'departs')
+    )
+    return Timetable.from_departures(graph, rows.iterator(chunk_size=CHUNK_SIZE))
+
+
+def get_timetable():
+    """Return the timetable for the current graph and departures, rebuilding if needed."""
+    global _timetable
+    graph = get_graph()
+    key = (graph.version, versions.stamps()[1], _version)
+    timetable = _timetable
+    if timetable is None or timetable[0] != key:
+        with _lock:
+            if _timetable is None or _timetable[0] != key:
+                _timetable = (key, build_timetable(graph))
+            timetable = _timetable
+    return timetable[1]
+
+
+def _bump():
+    global _version
+    with _lock:
+        _version += 1
+    versions.expire()
+
+
+def schedule_changed():
+    """
+    Call after Departure rows change. Like graph_changed, the timetable is
+    dropped at once and again on commit.
+    """
+    _bump()
+    if on_commit_once(_bump):
+        # Once per transaction, committed together with the edit
+        versions.bump('schedule')
+
+
+def parse_clock(text):
+    """Minutes after midnight for 'HH:MM'; hours past 23 run into the next day."""
+    hours, _, minutes = text.strip().partition(':')
+    hours, minutes = int(hours), int(minutes)
+    if hours < 0 or not 0 <= minutes < 60:
+        raise ValueError(f"'{text}' is not a time of day")
+    return hours * 60 + minutes
+
+
+def clock(minutes):
+    """'HH:MM' for minutes after midnight, with '+Nd' for later days."""
+    minutes = round(minutes)
+    days, minutes = divmod(minutes, 24 * 60)
+    text = f"{minutes // 60:02}:{minutes % 60:02}"
+    return f"{text} +{days}d" if days else text
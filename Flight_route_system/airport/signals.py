@@ -0,0 +1,71 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .components import links_added
+from .graph import graph_changed, graph_version
+from .models import Airport, Departure, Route
+from .schedules import schedule_changed
+
+
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+def airport_changed(sender, instance, signal, created=False, **kwargs):
+    """
+    New, renamed and deleted airports change the route graph, so drop the
+    cached copy. Saves that keep the code leave the graph as it is.
+    """
+    if signal is post_save and not created and getattr(instance, '_stored_code', None) == instance.code:
+        return
+    version = graph_version()
+    graph_changed()
+
+    if signal is post_save:
+        instance.remember_code()
+        if created:
+            # A new airport has no routes yet: the component index only grows
+            links_added(version, [instance.code], [])
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def route_changed(sender, instance, signal, created=False, **kwargs):
+    """
+    Any create, edit or delete of a route, including add_next_airport
+    filling or replacing a slot, changes the route graph.
+    """
+    version = graph_version()
+    graph_changed()
+
+    if signal is post_save:
+        added = added_links(instance, created)
+        instance.remember_route()
+        if added is not None:
+            # Only additions: the component index can be updated in place
+            links_added(version, [], added)
+
+
+def added_links(route, created):
+    """
+    The (code, code) links a route save added, or None if it may also
+    have removed something.
+    """
+    if not created:
+        stored = getattr(route, '_stored_route', None)
+        # A new duration on the same travelled route keeps every link; a
+        # moved end removes the old link
+        if stored is not None and stored[:2] == (route.origin_id, route.destination_id) \
+                and stored[2] and route.duration:
+            return []
+        return None
+    if not route.duration:
+        return []
+    if not (Route.origin.is_cached(route) and Route.destination.is_cached(route)):
+        return None
+    return [(route.origin.code, route.destination.code)]
+
+
+@receiver(post_save, sender=Departure)
+@receiver(post_delete, sender=Departure)
+def departure_changed(sender, instance, **kwargs):
+    """Departures only change the timetable, not the route graph."""
+    schedule_changed()
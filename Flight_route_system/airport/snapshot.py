@@ -0,0 +1,125 @@
+"""
+Binary snapshot of the route graph for fast worker startup.
+
+When the ROUTE_GRAPH_SNAPSHOT_PATH setting is set, the process that edits
+airports rewrites the snapshot after the edit commits and every other worker
+memory-maps it instead of pulling the whole Airport table. The CSR arrays
+are used straight from the mapping, so loading costs one checksum pass and
+building the code index.
+
+File layout (little endian):
+
+    header    MAGIC, format version, airport count n, edge count m,
+              graph version, graph fingerprint (20 bytes), CRC-32 of the rest
+    codes     byte length, then n codes joined by newlines, padded to 8 bytes
+    offsets   (n + 1) int64
+    targets   m int32, padded to 8 bytes
+    weights   m float64
+"""
+import mmap
+import os
+import struct
+import zlib
+from array import array
+
+from django.conf import settings
+
+
+MAGIC = b'RTGRAPH\0'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIIQQ20sI')
+
+
+def snapshot_path():
+    return getattr(settings, 'ROUTE_GRAPH_SNAPSHOT_PATH', None)
+
+
+def file_stat(path):
+    """Identity of the file at path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _pad(length):
+    return b'\0' * (-length % 8)
+
+
+def read_version(path):
+    """Graph version stored in the snapshot at path, or 0."""
+    try:
+        with open(path, 'rb') as f:
+            magic, _, _, _, version, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return version if magic == MAGIC else 0
+
+
+def write_snapshot(graph, path):
+    """
+    Write graph to path, replacing any previous snapshot atomically.
+    Returns the graph version stored in the file.
+    """
+    version = read_version(path) + 1
+    codes = '\n'.join(graph.codes).encode()
+    targets = array('i', graph.targets)
+
+    body = [
+        struct.pack('<Q', len(codes)), codes, _pad(len(codes)),
+        array('q', graph.offsets).tobytes(),
+        targets.tobytes(), _pad(len(targets) * 4),
+        array('d', graph.weights).tobytes(),
+    ]
+    checksum = 0
+    for part in body:
+        checksum = zlib.crc32(part, checksum)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(graph), graph.edge_count,
+                            version, graph.fingerprint(), checksum))
+        for part in body:
+            f.write(part)
+    os.replace(tmp_path, path)
+    return version
+
+
+def read_snapshot(path, graph_class):
+    """
+    Map the snapshot at path and return a graph_class instance over it, or
+    None if the file is missing, truncated, corrupt or of another format.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, fmt, n, m, _, fingerprint, checksum = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            return None
+        view = memoryview(mapping)
+        if zlib.crc32(view[HEADER.size:]) != checksum:
+            return None
+
+        offset = HEADER.size
+        codes_length = struct.unpack_from('<Q', mapping, offset)[0]
+        offset += 8
+        codes = bytes(view[offset:offset + codes_length]).decode()
+        offset += codes_length + (-codes_length % 8)
+        offsets = view[offset:offset + 8 * (n + 1)].cast('q')
+        offset += 8 * (n + 1)
+        targets = view[offset:offset + 4 * m].cast('i')
+        offset += 4 * m + (-(4 * m) % 8)
+        weights = view[offset:offset + 8 * m].cast('d')
+        if offset + 8 * m != len(mapping):
+            return None
+    except (struct.error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+    graph = graph_class(codes.split('\n') if n else [], offsets, targets, weights)
+    graph._fingerprint = fingerprint
+    return graph
@@ -1,3 +1,1236 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+from array import array
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import chains, components, schedules
+from .chains import get_chain_index
+from .components import get_component_index
+from .graph import (
+    RouteGraph, build_graph, get_graph, graph_source, graph_version, invalidate_graph, search_stats,
+)
+from .instrumentation import view_histograms
+from .importer import RouteImportError, apply_links, import_routes
+from .exporter import TABLES, read_columnar, row_chunks
+from .management.commands.benchmark_graph import csr_distance, link_routes
+from .management.commands.benchmark_routes import benchmark_network, benchmark_settings, synthetic_network
+from .matrix import get_matrix
+from .models import Airport, AirportStats, Departure, Route, add_departure, add_next_airport, add_route
+from .reachability import compute_stats
+from .routers import ReadReplicaRouter, reading_from_replica
+from .routing import fewest_hops_route, k_shortest_routes
+from .schedules import get_timetable
+from .snapshot import read_version
+from .trees import compute_tree, diff_graphs, repair_tree, tree_cache
+from . import route_cache, versions, workers
+from .views import (
+    find_alternative_routes, find_duration_between, find_earliest_arrival, find_fewest_hops,
+    find_longest_route,
+    find_nth_node, find_shortest_path, top_direct_routes,
+)
+
+
+def reset_route_state():
+    """
+    Drop the process-wide structures built from the database, which the
+    rollback after each test does not undo.
+    """
+    invalidate_graph()
+    versions.expire()
+    chains._index = None
+    components._index = None
+    schedules._timetable = None
+    tree_cache.clear()
+    route_cache.flush_origins()
+    route_cache.route_cache().clear()
+    cache.clear()
+
+
+# Edits in tests come from this process; tests of edits made elsewhere
+# check the shared edit count on every lookup
+@override_settings(ROUTE_VERSION_CHECK_INTERVAL=3600)
+class RouteTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_route_state()
+
+    def tearDown(self):
+        reset_route_state()
+        super().tearDown()
+
+
+class RouteGraphCacheTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('BBB', 'right', 'CCC', 7)
+
+    def test_graph_is_reused_between_queries(self):
+        get_graph()
+        with self.assertNumQueries(0):
+            find_shortest_path('AAA')
+            find_duration_between('AAA', 'CCC')
+
+    def test_link_change_invalidates_graph(self):
+        self.assertEqual(find_duration_between('AAA', 'CCC'),
+                         'Shortest duration from AAA to CCC is 12.0.')
+        version = graph_version()
+        add_next_airport('AAA', 'right', 'CCC', 3)
+        self.assertGreater(graph_version(), version)
+        self.assertEqual(find_duration_between('AAA', 'CCC'),
+                         'Shortest duration from AAA to CCC is 3.0.')
+
+    @override_settings(ROUTE_VERSION_CHECK_INTERVAL=0)
+    def test_edits_in_other_processes_invalidate_graph(self):
+        ddd = Airport.objects.create(code='DDD')
+        self.assertEqual(find_duration_between('AAA', 'CCC'), 'Shortest duration from AAA to CCC is 12.0.')
+        self.assertEqual(find_nth_node('AAA', 'left', 1), 'The 1th left node from AAA is BBB.')
+        # Written without this process's signals, as another worker's edit
+        Route.objects.filter(origin__code='AAA', slot='left').update(destination=ddd)
+        self.assertEqual(find_nth_node('AAA', 'left', 1), 'The 1th left node from AAA is BBB.')
+        versions.bump('graph')
+        self.assertEqual(find_nth_node('AAA', 'left', 1), 'The 1th left node from AAA is DDD.')
+        self.assertEqual(find_duration_between('AAA', 'DDD'), 'Shortest duration from AAA to DDD is 5.0.')
+
+    def test_delete_invalidates_graph(self):
+        find_shortest_path('AAA')
+        Airport.objects.get(code='BBB').delete()
+        self.assertEqual(find_duration_between('AAA', 'CCC'),
+                         'No route found between AAA and CCC.')
+        self.assertEqual(find_duration_between('AAA', 'BBB'),
+                         'Invalid airport code.')
+
+
+class QueryCountTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('viewer', password='pw')
+        self.client.force_login(self.user)
+
+    def add_chain(self, size):
+        Airport.objects.create(code='C0')
+        for i in range(1, size):
+            add_next_airport(f'C{i - 1}', 'left' if i % 2 else 'right', f'C{i}', i)
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        return len(ctx)
+
+    def measure(self, func):
+        """Query count for func() on a small table and on a ten times larger one."""
+        self.add_chain(5)
+        small = self.count_queries(func)
+        Airport.objects.all().delete()
+        self.add_chain(50)
+        large = self.count_queries(func)
+        return small, large
+
+    def test_graph_build_query_count_is_constant(self):
+        small, large = self.measure(build_graph)
+        self.assertEqual(small, 1)
+        self.assertEqual(large, 1)
+
+    def test_longest_route_query_count_is_constant(self):
+        small, large = self.measure(find_longest_route)
+        self.assertEqual(small, large)
+
+    def test_airport_list_query_count_is_constant(self):
+        small, large = self.measure(lambda: self.client.get(reverse('airport_list')))
+        self.assertEqual(small, large)
+        response = self.client.get(reverse('airport_list'))
+        self.assertContains(response, '<td>C1</td>', count=2)
+
+
+class RouteMatrixTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('AAA', 'right', 'CCC', 20)
+        add_next_airport('BBB', 'right', 'CCC', 7)
+        add_next_airport('CCC', 'left', 'DDD', 1.5)
+        Airport.objects.create(code='ZZZ')
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'matrix.bin')
+        settings = override_settings(ROUTE_MATRIX_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_matrix_matches_live_search(self):
+        codes = ['AAA', 'BBB', 'CCC', 'DDD', 'ZZZ']
+        expected = {(a, b): find_duration_between(a, b) for a in codes for b in codes}
+        call_command('build_route_matrix', stdout=open(os.devnull, 'w'))
+
+        matrix = get_matrix()
+        self.assertIsNotNone(matrix)
+        for (a, b), result in expected.items():
+            self.assertEqual(find_duration_between(a, b), result)
+
+    def test_stale_matrix_is_ignored(self):
+        call_command('build_route_matrix', stdout=open(os.devnull, 'w'))
+        add_next_airport('AAA', 'left', 'DDD', 1)
+        self.assertIsNone(get_matrix())
+        self.assertEqual(find_duration_between('AAA', 'DDD'),
+                         'Shortest duration from AAA to DDD is 1.0.')
+
+
+class BidirectionalSearchTests(RouteTestCase):
+    def test_matches_one_sided_dijkstra(self):
+        rng = random.Random(7)
+        size = 300
+        links = [
+            (f'A{i}',
+             f'A{rng.randrange(size)}' if rng.random() < 0.7 else None,
+             f'A{rng.randrange(size)}' if rng.random() < 0.3 else None,
+             rng.uniform(1, 100), rng.choice([rng.uniform(1, 100), None]))
+            for i in range(size)
+        ]
+        graph = RouteGraph.from_routes(link_routes(links))
+
+        for _ in range(200):
+            source, target = rng.randrange(size), rng.randrange(size)
+            result = graph.bidirectional_search(source, target)
+            self.assertEqual(result.distance, csr_distance(graph, source, target))
+            if result.distance is not None:
+                self.assertEqual(result.path[0], source)
+                self.assertEqual(result.path[-1], target)
+                self.assertGreaterEqual(result.settled, 1)
+
+
+class BatchRouteApiTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('BBB', 'right', 'CCC', 7)
+        Airport.objects.create(code='ZZZ')
+        user = get_user_model().objects.create_user('pricing', password='pw')
+        self.client.force_login(user)
+
+    def post(self, payload):
+        response = self.client.post(reverse('batch_routes'), json.dumps(payload),
+                                    content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_pairs(self):
+        lines = self.post({'pairs': [['aaa', 'CCC'], ['AAA', 'BBB'], ['BBB', 'ZZZ'], ['XXX', 'AAA']]})
+        by_index = {line['index']: line for line in lines}
+        self.assertEqual(by_index[0]['duration'], 12.0)
+        self.assertEqual(by_index[1]['duration'], 5.0)
+        self.assertIsNone(by_index[2]['duration'])
+        self.assertEqual(by_index[3]['error'], 'Invalid airport code.')
+
+    def test_origins(self):
+        lines = self.post({'origins': ['CCC']})
+        self.assertEqual(lines, [{'from': 'CCC', 'durations': {'BBB': 7.0, 'AAA': 12.0}}])
+
+    def test_bad_payload(self):
+        response = self.client.post(reverse('batch_routes'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RouteImportTests(RouteTestCase):
+    CSV = (
+        "parent_code,direction,child_code,distance\n"
+        "AAA,left,BBB,5\n"
+        "BBB,right,CCC,7\n"
+        "AAA,right,CCC,30\n"
+        "AAA,right,DDD,2\n"
+    )
+
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+
+    def test_import_matches_add_next_airport(self):
+        progress = []
+        added, linked = import_routes(self.CSV.splitlines(keepends=True), 'csv', chunk_size=2,
+                                      progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual((added, linked), (3, 3))
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+        aaa = Airport.objects.get(code='AAA')
+        left, right = aaa.slot_route('left'), aaa.slot_route('right')
+        self.assertEqual((left.destination.code, left.duration), ('BBB', 5))
+        self.assertEqual((right.destination.code, right.duration), ('DDD', 2))
+        self.assertEqual(Airport.objects.get(code='BBB').slot_route('right').destination.code, 'CCC')
+        self.assertEqual(find_duration_between('AAA', 'CCC'),
+                         'Shortest duration from AAA to CCC is 12.0.')
+
+    def test_invalid_rows_abort_the_import(self):
+        lines = [
+            '{"parent_code": "AAA", "direction": "left", "child_code": "BBB", "distance": 5}\n',
+            '{"parent_code": "XXX", "direction": "left", "child_code": "YYY", "distance": 1}\n',
+            '{"parent_code": "AAA", "direction": "up", "child_code": "BBB", "distance": 1}\n',
+        ]
+        with self.assertRaises(RouteImportError) as ctx:
+            import_routes(lines, 'ndjson')
+        self.assertEqual(ctx.exception.error_count, 2)
+        self.assertEqual(Airport.objects.count(), 1)
+
+    def test_admin_upload(self):
+        admin = get_user_model().objects.create_user('ops', password='pw', is_admin=True)
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile('links.csv', self.CSV.encode())
+        response = self.client.post(reverse('import_routes'), {'file': upload, 'format': 'csv'})
+        self.assertContains(response, 'Imported 3 links and added 3 airports.')
+
+
+class TreeCacheTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='HUB')
+        add_next_airport('HUB', 'left', 'AAA', 1.1)
+        add_next_airport('AAA', 'left', 'BBB', 2.2)
+        add_next_airport('BBB', 'left', 'CCC', 3.3)
+
+    def test_duration_from_cached_hub_needs_no_search(self):
+        pairs = [('HUB', 'CCC'), ('BBB', 'HUB'), ('HUB', 'HUB')]
+        expected = {pair: find_duration_between(*pair) for pair in pairs}
+
+        find_shortest_path('HUB')
+        for pair, result in expected.items():
+            hits = tree_cache.hits
+            self.assertEqual(find_duration_between(*pair), result)
+            self.assertEqual(tree_cache.hits, hits + 1)
+
+    @override_settings(ROUTE_TREE_CACHE_BYTES=100)
+    def test_budget_evicts_least_recently_used(self):
+        find_shortest_path('HUB')
+        find_shortest_path('AAA')
+        find_shortest_path('BBB')
+        self.assertLessEqual(tree_cache.bytes, 100)
+        self.assertGreater(tree_cache.evictions, 0)
+        self.assertIsNone(tree_cache.peek(get_graph(), 'HUB'))
+
+
+class ChainIndexTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 1)
+        add_next_airport('BBB', 'left', 'CCC', 1)
+        add_next_airport('CCC', 'left', 'DDD', 1)
+        # DDD -> BBB closes a loop of three on the right
+        add_next_airport('AAA', 'right', 'BBB', 1)
+        add_next_airport('BBB', 'right', 'CCC', 1)
+        add_next_airport('CCC', 'right', 'DDD', 1)
+        add_next_airport('DDD', 'right', 'BBB', 1)
+
+    def walk(self, start, direction, n):
+        """The step-by-step walk find_nth_node used to do."""
+        current = Airport.objects.get(code__iexact=start)
+        for i in range(n):
+            route = current.slot_route(direction)
+            current = route and route.destination
+            if current is None:
+                return f"No {direction} node found at step {i + 1} from {start}."
+        return f"The {n}th {direction} node from {start} is {current.code}."
+
+    def test_matches_step_by_step_walk(self):
+        find_nth_node('AAA', 'left', 1)
+        for start in ['AAA', 'BBB', 'DDD']:
+            for direction in ['left', 'right']:
+                for n in range(1, 12):
+                    with self.assertNumQueries(0):
+                        result = find_nth_node(start, direction, n)
+                    self.assertEqual(result, self.walk(start, direction, n))
+
+    def test_large_n_on_a_loop(self):
+        self.assertEqual(find_nth_node('AAA', 'right', 10 ** 12),
+                         'The 1000000000000th right node from AAA is BBB.')
+
+    def test_index_follows_link_changes(self):
+        find_nth_node('AAA', 'left', 1)
+        add_next_airport('AAA', 'left', 'DDD', 1)
+        self.assertEqual(find_nth_node('AAA', 'left', 1), 'The 1th left node from AAA is DDD.')
+        self.assertEqual(find_nth_node('XXX', 'left', 1), "Airport 'XXX' not found.")
+
+
+class TopDirectRoutesTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('AAA', 'right', 'CCC', 9)
+        add_next_airport('BBB', 'left', 'DDD', 9)
+        add_next_airport('CCC', 'right', 'EEE', 1)
+        add_next_airport('DDD', 'right', 'FFF', 0)
+
+    def test_longest_and_shortest(self):
+        self.assertEqual(top_direct_routes(3), [
+            ('AAA', 'CCC', 9), ('BBB', 'DDD', 9), ('AAA', 'BBB', 5),
+        ])
+        self.assertEqual(top_direct_routes(2, offset=2, longest=False), [
+            ('AAA', 'CCC', 9), ('BBB', 'DDD', 9),
+        ])
+        self.assertEqual(find_longest_route(),
+                         'The longest route is between AAA and CCC with duration 9.0.')
+
+    def test_paginated_page(self):
+        user = get_user_model().objects.create_user('viewer', password='pw')
+        self.client.force_login(user)
+        response = self.client.get(reverse('airport_route'), {'type': 'longest_route', 'page': 2})
+        self.assertContains(response, 'No routes on this page.', count=2)
+
+
+class AirportListTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.bulk_create(
+            [Airport(code=f'AB{i:03}') for i in range(120)] + [Airport(code='xyz')]
+        )
+        # Bulk writes bypass the post_save signal that drops the cached graph
+        invalidate_graph()
+        user = get_user_model().objects.create_user('viewer', password='pw')
+        self.client.force_login(user)
+
+    def test_keyset_pages(self):
+        seen = []
+        after = ''
+        while True:
+            response = self.client.get(reverse('airport_list'), {'q': 'ab', 'after': after})
+            seen += [a['code'] for a in response.context['airports']]
+            after = response.context['next_after']
+            if not after:
+                break
+        self.assertEqual(seen, [f'AB{i:03}' for i in range(120)])
+
+    def test_prefix_is_case_insensitive(self):
+        response = self.client.get(reverse('airport_list'), {'q': 'X'})
+        self.assertEqual([a['code'] for a in response.context['airports']], ['xyz'])
+
+    def test_autocomplete(self):
+        response = self.client.get(reverse('airport_autocomplete'), {'q': 'ab01'})
+        self.assertEqual(response.json(), {'codes': [f'AB01{i}' for i in range(10)]})
+
+
+@override_settings(ROUTE_WORKER_PROCESSES=0)
+class AsyncRouteViewTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('BBB', 'right', 'CCC', 7)
+        self.user = get_user_model().objects.create_user('viewer', password='pw')
+
+    async def test_async_views_match_sync_views(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            reverse('airport_route_async') + '?type=duration_between',
+            {'from_airport': 'aaa', 'to_airport': 'ccc'},
+        )
+        self.assertContains(response, 'Shortest duration from AAA to CCC is 12.0.')
+        response = await self.async_client.post(reverse('shortest_path_async'), {'start': 'CCC'})
+        self.assertEqual(response.context['result']['airports'], [('BBB', 7.0), ('AAA', 12.0)])
+
+    async def test_identical_searches_are_coalesced(self):
+        with mock.patch.object(workers, '_run_search', wraps=workers._run_search) as run:
+            results = await asyncio.gather(*[
+                workers.run_search('duration_between', 'AAA', 'CCC') for _ in range(5)
+            ])
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(set(results), {'Shortest duration from AAA to CCC is 12.0.'})
+
+    def test_workers_refuse_searches_on_another_graph(self):
+        with self.assertRaises(workers.StaleGraph):
+            workers._run_search('duration_between', ('AAA', 'CCC'), 'elsewhere')
+        self.assertEqual(workers._run_search('duration_between', ('AAA', 'CCC'), graph_source()),
+                         'Shortest duration from AAA to CCC is 12.0.')
+
+    async def test_stale_searches_are_retried_once(self):
+        await self.async_client.aforce_login(self.user)
+        stale = workers.StaleGraph('moved')
+        with mock.patch.object(workers, '_run_search', side_effect=[stale, 'done']):
+            self.assertEqual(await workers.run_search('duration_between', 'AAA', 'CCC'), 'done')
+        with mock.patch.object(workers, '_run_search', side_effect=[stale, stale]) as run:
+            response = await self.async_client.post(
+                reverse('airport_route_async') + '?type=duration_between',
+                {'from_airport': 'AAA', 'to_airport': 'CCC'},
+            )
+        self.assertEqual(run.call_count, 2)
+        self.assertEqual(response.status_code, 503)
+
+
+class GraphSnapshotTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'graph.bin')
+        settings = override_settings(ROUTE_GRAPH_SNAPSHOT_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.create(code='AAA')
+            add_next_airport('AAA', 'left', 'BBB', 5)
+            add_next_airport('BBB', 'right', 'CCC', 7)
+
+    def test_workers_load_the_snapshot_without_queries(self):
+        expected = get_graph().fingerprint()
+        invalidate_graph()
+        with self.assertNumQueries(0):
+            graph = get_graph()
+            self.assertEqual(find_duration_between('AAA', 'CCC'),
+                             'Shortest duration from AAA to CCC is 12.0.')
+        self.assertIsInstance(graph.targets, memoryview)
+        self.assertEqual(graph.fingerprint(), expected)
+
+    def test_edits_publish_a_new_version(self):
+        version = read_version(self.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_next_airport('AAA', 'right', 'CCC', 1)
+        self.assertGreater(read_version(self.path), version)
+        invalidate_graph()
+        self.assertEqual(find_duration_between('AAA', 'CCC'),
+                         'Shortest duration from AAA to CCC is 1.0.')
+
+    def test_corrupt_snapshot_falls_back_to_database(self):
+        with open(self.path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'x')
+        invalidate_graph()
+        self.assertEqual(find_duration_between('AAA', 'CCC'),
+                         'Shortest duration from AAA to CCC is 12.0.')
+        self.assertIsInstance(get_graph().targets, array)
+
+
+class RoutingTests(RouteTestCase):
+    def simple_paths(self, graph, source, target):
+        """Every loopless path from source to target, by brute force."""
+        paths = []
+        stack = [[source]]
+        while stack:
+            path = stack.pop()
+            if path[-1] == target:
+                paths.append(path)
+                continue
+            for neighbor, _ in graph.neighbors(path[-1]):
+                if neighbor not in path:
+                    stack.append(path + [neighbor])
+        return paths
+
+    def test_k_shortest_matches_brute_force(self):
+        rng = random.Random(11)
+        size = 9
+        links = [
+            (f'A{i}', f'A{rng.randrange(size)}', f'A{rng.randrange(size)}',
+             float(rng.randint(1, 20)), float(rng.randint(1, 20)))
+            for i in range(size)
+        ]
+        graph = RouteGraph.from_routes(link_routes(links))
+
+        for _ in range(30):
+            source, target = rng.sample(range(size), 2)
+            potential = graph.shortest_paths(target)[0]
+            for max_hops in (None, 2, 3):
+                paths = [p for p in self.simple_paths(graph, source, target)
+                         if max_hops is None or len(p) - 1 <= max_hops]
+                expected = sorted(sum(graph.edge_weight(a, b) for a, b in zip(p, p[1:]))
+                                  for p in paths)[:4]
+                routes = k_shortest_routes(graph, source, target, 4, potential, max_hops)
+                self.assertEqual([r.distance for r in routes], expected)
+                self.assertEqual(len({tuple(r.path) for r in routes}), len(routes))
+                for route in routes:
+                    self.assertEqual(len(set(route.path)), len(route.path))
+                    self.assertTrue(max_hops is None or route.hops <= max_hops)
+
+                fewest = fewest_hops_route(graph, source, target, max_hops)
+                if paths:
+                    self.assertEqual(fewest.hops, min(len(p) - 1 for p in paths))
+                else:
+                    self.assertIsNone(fewest)
+
+    def test_route_views_return_airport_sequences(self):
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 1)
+        add_next_airport('BBB', 'left', 'CCC', 1)
+        add_next_airport('AAA', 'right', 'CCC', 5)
+
+        result = find_alternative_routes('AAA', 'CCC', 3)
+        self.assertEqual([r['codes'] for r in result['routes']],
+                         [['AAA', 'BBB', 'CCC'], ['AAA', 'CCC']])
+        self.assertEqual(find_fewest_hops('AAA', 'CCC')['routes'][0]['codes'], ['AAA', 'CCC'])
+        self.assertEqual(find_alternative_routes('AAA', 'CCC', 3, max_hops=1)['routes'][0]['distance'], 5.0)
+        self.assertEqual(find_alternative_routes('AAA', 'XXX', 3), 'Invalid airport code.')
+
+
+class ComponentIndexTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        # Committed, so the edits in each test get their own commit callbacks
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.create(code='AAA')
+            add_next_airport('AAA', 'left', 'BBB', 5)
+            Airport.objects.create(code='XXX')
+            add_next_airport('XXX', 'left', 'YYY', 2)
+
+    def test_unreachable_pairs_skip_the_search(self):
+        self.assertEqual(get_component_index().stats()['components'], 2)
+        queries = search_stats.queries
+        self.assertEqual(find_duration_between('AAA', 'YYY'), 'No route found between AAA and YYY.')
+        self.assertEqual(search_stats.queries, queries)
+
+    def test_added_links_update_the_index_in_place(self):
+        index = get_component_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            add_next_airport('BBB', 'right', 'XXX', 1)
+        self.assertIs(get_component_index(), index)
+        self.assertTrue(index.connected('AAA', 'YYY'))
+        self.assertEqual(find_duration_between('AAA', 'YYY'), 'Shortest duration from AAA to YYY is 8.0.')
+
+    def test_removed_links_rebuild_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            add_next_airport('BBB', 'right', 'XXX', 1)
+        index = get_component_index()
+        self.assertTrue(index.connected('AAA', 'YYY'))
+        # Replacing a link may split the network
+        with self.captureOnCommitCallbacks(execute=True):
+            add_next_airport('BBB', 'right', 'ZZZ', 1)
+        self.assertIsNot(get_component_index(), index)
+        self.assertFalse(get_component_index().connected('AAA', 'YYY'))
+        self.assertTrue(get_component_index().connected('AAA', 'ZZZ'))
+        Airport.objects.get(code='BBB').delete()
+        self.assertFalse(get_component_index().connected('AAA', 'ZZZ'))
+
+    def test_lowercase_codes_join_the_graph_airports(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.create(code='pune')
+        # The index built from the graph knows the airport as PUNE
+        index = get_component_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            add_next_airport('pune', 'left', 'AAA', 3)
+        self.assertIs(get_component_index(), index)
+        self.assertEqual(index.stats(), {'airports': 5, 'components': 2, 'isolated': 0, 'largest': [3, 2]})
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.create(code='goa')
+        self.assertIs(get_component_index(), index)
+        self.assertEqual(index.stats()['airports'], 6)
+        self.assertEqual(find_duration_between('PUNE', 'AAA'), 'Shortest duration from PUNE to AAA is 3.0.')
+
+    def test_moved_origin_rebuilds_the_index(self):
+        index = get_component_index()
+        self.assertTrue(index.connected('AAA', 'BBB'))
+        route = Route.objects.get(origin__code='AAA', slot='left')
+        route.origin = Airport.objects.get(code='YYY')
+        with self.captureOnCommitCallbacks(execute=True):
+            route.save()
+        self.assertIsNot(get_component_index(), index)
+        self.assertFalse(get_component_index().connected('AAA', 'BBB'))
+        self.assertTrue(get_component_index().connected('XXX', 'BBB'))
+
+    def test_dashboard_lists_components(self):
+        admin = get_user_model().objects.create_user('ops', password='pw', is_admin=True)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['network']['components'], 2)
+        self.assertEqual(response.context['network']['largest'], [2, 2])
+
+
+class TreeRepairTests(RouteTestCase):
+    def random_links(self, rng, codes):
+        return [
+            [code,
+             rng.choice(codes) if rng.random() < 0.8 else None,
+             rng.choice(codes) if rng.random() < 0.5 else None,
+             float(rng.randint(1, 30)), float(rng.randint(1, 30))]
+            for code in codes
+        ]
+
+    def test_repaired_trees_match_fresh_searches(self):
+        rng = random.Random(5)
+        codes = [f'A{i}' for i in range(60)]
+        links = self.random_links(rng, codes)
+        for _ in range(60):
+            old = RouteGraph.from_routes(link_routes(links))
+            links = [list(row) for row in links]
+            for _ in range(rng.randint(1, 3)):
+                row = rng.choice(links)
+                edit = rng.random()
+                if edit < 0.3:
+                    row[3] = float(rng.randint(1, 30))
+                elif edit < 0.5:
+                    row[1] = None
+                elif edit < 0.7:
+                    row[2] = rng.choice(codes)
+                elif edit < 0.85:
+                    # A new airport, or the removal of one
+                    code = f'N{rng.randrange(1000)}'
+                    codes.append(code)
+                    links.append([code, rng.choice(codes), None, float(rng.randint(1, 30)), None])
+                else:
+                    code = links.pop(rng.randrange(len(links)))[0]
+                    codes.remove(code)
+                    links = [[c, l if l != code else None, r if r != code else None, ld, rd]
+                             for c, l, r, ld, rd in links]
+            new = RouteGraph.from_routes(link_routes(links))
+
+            diff = diff_graphs(old, new)
+            for source in rng.sample(range(len(old)), 5):
+                repaired = repair_tree(compute_tree(old, source), new, diff)
+                if old.codes[source] not in new:
+                    self.assertIsNone(repaired)
+                    continue
+                fresh = compute_tree(new, new.index[old.codes[source]])
+                self.assertEqual(list(repaired.distances), list(fresh.distances))
+                self.assertEqual(sorted(repaired.order), sorted(fresh.order))
+                for node in repaired.order:
+                    if node != repaired.source:
+                        previous = repaired.predecessors[node]
+                        self.assertEqual(repaired.distances[previous] + new.edge_weight(previous, node),
+                                         repaired.distances[node])
+
+    def test_link_edits_repair_cached_trees(self):
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('BBB', 'left', 'CCC', 5)
+        tree_cache.clear()
+        find_shortest_path('AAA')
+        repairs = tree_cache.repairs
+
+        add_next_airport('AAA', 'right', 'CCC', 3)
+        self.assertEqual(find_shortest_path('AAA', cached_only=True)['airports'],
+                         [('CCC', 3.0), ('BBB', 5.0)])
+        add_next_airport('AAA', 'right', 'DDD', 1)
+        self.assertEqual(find_shortest_path('AAA', cached_only=True)['airports'],
+                         [('DDD', 1.0), ('BBB', 5.0), ('CCC', 10.0)])
+        self.assertGreater(tree_cache.repairs, repairs)
+
+    def test_trees_are_repaired_when_looked_up(self):
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('BBB', 'left', 'CCC', 5)
+        find_shortest_path('AAA')
+        find_shortest_path('CCC')
+        repairs = tree_cache.repairs
+
+        add_next_airport('AAA', 'right', 'CCC', 3)
+        self.assertEqual(find_shortest_path('AAA', cached_only=True)['airports'],
+                         [('CCC', 3.0), ('BBB', 5.0)])
+        self.assertEqual(tree_cache.repairs, repairs + 1)
+        self.assertEqual(tree_cache.stats()['entries'], 2)
+        # CCC's tree was not looked up before the next edit
+        add_next_airport('AAA', 'right', 'DDD', 1)
+        self.assertIsNotNone(find_shortest_path('AAA', cached_only=True))
+        self.assertIsNone(find_shortest_path('CCC', cached_only=True))
+        self.assertEqual(tree_cache.repairs, repairs + 2)
+
+
+class RouteBenchmarkTests(RouteTestCase):
+    def test_topologies(self):
+        rng = random.Random(3)
+        chain = synthetic_network('chain', 300, rng)
+        self.assertEqual(chain['A0', 'left'][0], 'A1')
+        self.assertEqual(len(chain), 299 + 3)
+        hub = synthetic_network('hub', 300, rng)
+        self.assertTrue(all(child in {'A0', 'A1', 'A2', 'A3', 'A4', 'A5'}
+                            for (_, direction), (child, _) in hub.items() if direction == 'left'))
+
+    def test_measures_every_operation(self):
+        rng = random.Random(3)
+        apply_links(synthetic_network('random', 50, rng))
+        user = get_user_model().objects.create_user('bench', password='pw')
+        self.client.force_login(user)
+        # A replica outside the test database, which this test may not query
+        with mock.patch.dict(connections['replica'].settings_dict, NAME='file:replica?mode=ro'):
+            with benchmark_settings():
+                results = benchmark_network([f'A{i}' for i in range(50)], 3, rng, self.client)
+        self.assertEqual(set(results), {'graph_build', 'shortest_path', 'duration_between',
+                                        'nth_node', 'longest_route', 'airport_list'})
+        # The shared edit count, then the routes
+        self.assertEqual(results['graph_build']['queries_per_request'], 2)
+        self.assertEqual(results['shortest_path']['queries_per_request'], 0)
+        self.assertGreater(results['airport_list']['queries_per_request'], 0)
+        self.assertLessEqual(results['airport_list']['p50_ms'], results['airport_list']['p99_ms'])
+
+
+class InstrumentationTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('BBB', 'right', 'CCC', 7)
+        self.admin = get_user_model().objects.create_user('ops', password='pw', is_admin=True)
+        self.client.force_login(self.admin)
+        view_histograms.clear()
+
+    def test_route_requests_report_their_metrics(self):
+        with self.assertLogs('airport.requests', 'INFO') as logs:
+            response = self.client.post(reverse('airport_route') + '?type=duration_between',
+                                        {'from_airport': 'AAA', 'to_airport': 'CCC'})
+        timing = response['Server-Timing']
+        for part in ('db;dur=', 'graph;dur=', 'render;dur=', 'settled"', 'total;dur='):
+            self.assertIn(part, timing)
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'airport_route')
+        self.assertEqual(record['graph'], 'built')
+        self.assertGreater(record['settled'], 0)
+        self.assertGreater(record['queries'], 0)
+        self.assertIn('render', record['ms'])
+
+        stats = self.client.get(reverse('route_stats')).json()['views']['airport_route']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['ms_buckets']['+Inf'], 1)
+        self.assertEqual(stats['totals']['settled'], record['settled'])
+
+    @override_settings(ROUTE_WORKER_PROCESSES=0)
+    async def test_async_views_are_instrumented(self):
+        await self.async_client.aforce_login(self.admin)
+        with self.assertLogs('airport.requests', 'INFO') as logs:
+            response = await self.async_client.post(reverse('shortest_path_async'), {'start': 'AAA'})
+        self.assertIn('render;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'shortest_path_async')
+        self.assertEqual(record['settled'], 3)
+
+
+@override_settings(ROUTE_WORKER_PROCESSES=0)
+class ShortestPathPageTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        hub = Airport.objects.create(code='HUB')
+        for i in range(150):
+            Route.objects.create(origin=Airport.objects.create(code=f'S{i:03}'), destination=hub,
+                                 duration=i + 1, slot='left')
+        self.client.force_login(get_user_model().objects.create_user('viewer', password='pw'))
+
+    def test_results_are_paginated_and_cached(self):
+        response = self.client.post(reverse('shortest_path'), {'start': 'hub'})
+        self.assertEqual(len(response.context['result']['airports']), 100)
+        self.assertEqual(response.context['result']['total'], 150)
+        self.assertTrue(response.context['has_next'])
+        key = make_template_fragment_key(
+            'shortest_path_rows', [response.context['graph_key'], 'HUB', 1])
+        self.assertIsNotNone(cache.get(key))
+
+        response = self.client.get(reverse('shortest_path'), {'start': 'HUB', 'page': 2})
+        self.assertEqual(response.context['result']['airports'][0], ('S100', 101.0))
+        self.assertFalse(response.context['has_next'])
+        self.assertContains(response, 'S149')
+
+    async def test_async_view_is_paginated(self):
+        await self.async_client.aforce_login(await get_user_model().objects.aget(username='viewer'))
+        response = await self.async_client.get(reverse('shortest_path_async'), {'start': 'HUB', 'page': 2})
+        self.assertEqual(len(response.context['result']['airports']), 50)
+
+    def test_distance_table_downloads(self):
+        response = self.client.get(reverse('shortest_path_download'), {'start': 'HUB'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[:2], ['airport,distance', 'S000,1.0'])
+        self.assertEqual(len(lines), 151)
+
+        # Small chunks so the JSON is assembled from several of them
+        with mock.patch('airport.views.DOWNLOAD_CHUNK_ROWS', 7):
+            response = self.client.get(reverse('shortest_path_download'),
+                                       {'start': 'S000', 'format': 'json'})
+            table = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(table['airports'][:2], [['HUB', 1.0], ['S001', 3.0]])
+        self.assertEqual(len(table['airports']), 150)
+
+        response = self.client.get(reverse('shortest_path_download'), {'start': 'XXX'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SharedRouteCacheTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        # Committed, so graphs are named by the shared edit count
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.create(code='AAA')
+            add_next_airport('AAA', 'left', 'BBB', 5)
+            add_next_airport('BBB', 'right', 'CCC', 7)
+
+    def shared_cache(self):
+        """Settings pointing the route cache at a file backend, as across processes."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'routes': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                       'LOCATION': tmp.name},
+        })
+
+    def test_trees_are_shared_between_processes(self):
+        with self.shared_cache():
+            find_shortest_path('AAA')
+            # A second worker starts with an empty tree cache
+            tree_cache.clear()
+            with mock.patch('airport.trees.compute_tree') as compute:
+                self.assertEqual(find_shortest_path('AAA')['airports'], [('BBB', 5.0), ('CCC', 12.0)])
+            compute.assert_not_called()
+
+    def test_local_memory_keeps_no_second_copy_of_trees(self):
+        find_shortest_path('AAA')
+        self.assertIsNotNone(tree_cache.peek(get_graph(), 'AAA'))
+        self.assertIsNone(route_cache.peek(route_cache.result_key(get_graph(), 'tree', 'AAA')))
+        with self.assertRaises(CommandError):
+            call_command('warm_route_cache', origins='AAA', stdout=io.StringIO())
+
+    def test_edits_move_to_new_keys(self):
+        self.assertEqual(find_duration_between('AAA', 'CCC'), 'Shortest duration from AAA to CCC is 12.0.')
+        add_next_airport('AAA', 'right', 'CCC', 1)
+        tree_cache.clear()
+        self.assertEqual(find_duration_between('AAA', 'CCC'), 'Shortest duration from AAA to CCC is 1.0.')
+
+    def test_keys_name_the_graph_without_hashing_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            add_next_airport('CCC', 'left', 'DDD', 2)
+        graph = get_graph()
+        find_duration_between('AAA', 'CCC')
+        key = route_cache.graph_key(graph)
+        self.assertIsNone(graph._fingerprint)
+        # Another worker building the same graph uses the same key
+        invalidate_graph()
+        self.assertIsNot(get_graph(), graph)
+        self.assertEqual(route_cache.graph_key(get_graph()), key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_next_airport('CCC', 'left', 'DDD', 3)
+            # Uncommitted edits do not share the edit count's key
+            self.assertIsNone(get_graph().edit_count)
+        self.assertNotEqual(route_cache.graph_key(get_graph()), key)
+        self.assertIsNone(get_graph()._fingerprint)
+
+    def test_waiters_share_the_locked_computation(self):
+        cache = route_cache.route_cache()
+        cache.add('route:test:lock', 1)
+        compute = mock.Mock(return_value='fresh')
+
+        def finish_elsewhere(seconds):
+            cache.set('route:test', ('shared', 1e12, 0))
+        with mock.patch('airport.route_cache.time.sleep', side_effect=finish_elsewhere):
+            self.assertEqual(route_cache.cached('route:test', compute), 'shared')
+        compute.assert_not_called()
+
+        # Entries close to expiry are refreshed early by one caller
+        cache.delete('route:test:lock')
+        cache.set('route:test', ('old', 0, 1.0))
+        self.assertEqual(route_cache.cached('route:test', compute), 'fresh')
+        self.assertEqual(route_cache.cached('route:test', compute), 'fresh')
+        compute.assert_called_once()
+
+    def test_file_backend_and_warm_up(self):
+        # Counts from earlier queries go to the default route cache
+        route_cache.flush_origins()
+        with self.shared_cache():
+            for code in ('CCC', 'CCC', 'AAA'):
+                route_cache.record_origin(code)
+            self.assertEqual(route_cache.top_origins(1), ['CCC'])
+            call_command('warm_route_cache', top=2, stdout=io.StringIO())
+            graph = get_graph()
+            self.assertIsNotNone(route_cache.peek(route_cache.result_key(graph, 'tree', 'CCC')))
+            self.assertIsNotNone(route_cache.peek(route_cache.result_key(graph, 'tree', 'AAA')))
+
+
+class CommitCallbackTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.create(code='AAA')
+            add_next_airport('AAA', 'left', 'BBB', 5)
+            add_next_airport('AAA', 'right', 'CCC', 7)
+            add_next_airport('BBB', 'left', 'CCC', 1)
+
+    def test_one_rebuild_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            # Deletes the airport and, by cascade, three routes
+            Airport.objects.get(code='CCC').delete()
+        self.assertEqual([callback.func for callback in callbacks if hasattr(callback, 'func')],
+                         [invalidate_graph])
+
+    def test_unchanged_slots_are_not_rewritten(self):
+        self.client.force_login(get_user_model().objects.create_user('ops', password='pw', is_admin=True))
+        aaa = Airport.objects.get(code='AAA')
+        data = {'code': 'AAA', 'left': Airport.objects.get(code='BBB').pk, 'left_distance': 5,
+                'right': Airport.objects.get(code='CCC').pk, 'right_distance': 7}
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('airport_update', args=[aaa.pk]), data)
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('airport_update', args=[aaa.pk]), {**data, 'right_distance': 2})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(aaa.slot_route('right').duration, 2)
+
+
+class RouteTableTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='HUB')
+        for i in range(300):
+            add_route('HUB', f'S{i:03}', i + 1)
+        add_next_airport('HUB', 'left', 'S000', 50)
+        self.admin = get_user_model().objects.create_user('ops', password='pw', is_admin=True)
+        self.client.force_login(self.admin)
+
+    def test_hub_routes_are_travelled(self):
+        with self.assertNumQueries(1):
+            graph = build_graph()
+        self.assertEqual(len(list(graph.neighbors(graph.index['HUB']))), 300)
+        self.assertEqual(find_duration_between('S001', 'S299'),
+                         'Shortest duration from S001 to S299 is 302.0.')
+        # The slot route to S000 is a second, longer route between the same airports
+        self.assertEqual(find_duration_between('HUB', 'S000'),
+                         'Shortest duration from HUB to S000 is 1.0.')
+        add_route('S299', 'HUB', 400)
+        self.assertEqual(top_direct_routes(1), [('HUB', 'S299', 300)])
+        self.assertEqual(top_direct_routes(2, longest=False), [('HUB', 'S000', 1), ('HUB', 'S001', 2)])
+        self.assertEqual(find_nth_node('HUB', 'left', 1), 'The 1th left node from HUB is S000.')
+        self.assertEqual(find_nth_node('HUB', 'right', 1), 'No right node found at step 1 from HUB.')
+
+    def test_airport_list_counts_routes(self):
+        response = self.client.get(reverse('airport_list'), {'q': 'HUB'})
+        [hub] = response.context['airports']
+        self.assertEqual((hub['left_code'], hub['left_distance'], hub['route_count']), ('S000', 50, 301))
+
+    def test_airport_form_edits_slot_routes(self):
+        hub = Airport.objects.get(code='HUB')
+        s001 = Airport.objects.get(code='S001')
+        response = self.client.get(reverse('airport_update', args=[hub.pk]))
+        self.assertEqual(response.context['form'].initial['left_distance'], 50)
+        self.client.post(reverse('airport_update', args=[hub.pk]), {
+            'code': 'HUB', 'right': s001.pk, 'right_distance': 0.5,
+        })
+        self.assertIsNone(hub.slot_route('left'))
+        self.assertEqual(hub.slot_route('right').destination, s001)
+        self.assertEqual(hub.routes.count(), 301)
+        self.assertEqual(find_nth_node('HUB', 'right', 2), 'No right node found at step 2 from HUB.')
+        self.assertEqual(find_duration_between('HUB', 'S001'), 'Shortest duration from HUB to S001 is 0.5.')
+
+
+class ScheduleTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 60)
+        add_next_airport('BBB', 'left', 'CCC', 30)
+        add_route('AAA', 'CCC', 200)
+        add_departure('AAA', 'BBB', 8 * 60)
+        add_departure('BBB', 'CCC', 10 * 60)
+        add_departure('AAA', 'CCC', 11 * 60 + 40)
+        # Flown backwards over the BBB -> CCC route
+        add_departure('CCC', 'BBB', 7 * 60)
+
+    def brute_force(self, timetable, source, target, depart_at):
+        """Earliest arrival by relaxing every connection until nothing improves."""
+        arrival = {source: depart_at}
+        changed = True
+        while changed:
+            changed = False
+            for c in range(len(timetable)):
+                u = timetable.sources[c]
+                v = timetable.targets[c]
+                if arrival.get(u, float('inf')) <= timetable.departs[c] \
+                        and timetable.arrives[c] < arrival.get(v, float('inf')):
+                    arrival[v] = timetable.arrives[c]
+                    changed = True
+        return None if target not in arrival else arrival[target]
+
+    def test_earliest_arrival(self):
+        self.assertEqual(find_earliest_arrival('AAA', 'CCC', 7 * 60)['journeys'], [{
+            'departs': '08:00', 'arrives': '10:30',
+            'legs': ['AAA 08:00 → BBB 09:00', 'BBB 10:00 → CCC 10:30'],
+        }])
+        self.assertEqual(find_earliest_arrival('AAA', 'CCC', 9 * 60)['journeys'][0]['arrives'], '15:00')
+        self.assertEqual(find_earliest_arrival('CCC', 'BBB', 6 * 60)['journeys'][0]['arrives'], '07:30')
+        self.assertEqual(find_earliest_arrival('CCC', 'AAA', 0),
+                         'No scheduled journey from CCC to AAA after 00:00.')
+        with override_settings(SCHEDULE_MIN_TRANSFER=90):
+            self.assertEqual(find_earliest_arrival('AAA', 'CCC', 7 * 60)['journeys'][0]['arrives'], '15:00')
+
+    def test_departures_take_the_shortest_parallel_route(self):
+        add_route('CCC', 'AAA', 100)
+        self.assertEqual(find_earliest_arrival('AAA', 'CCC', 11 * 60)['journeys'][0]['arrives'], '13:20')
+
+    def test_profile_lists_every_useful_departure(self):
+        result = find_earliest_arrival('AAA', 'CCC', 0, 23 * 60)
+        self.assertEqual([(j['departs'], j['arrives']) for j in result['journeys']],
+                         [('08:00', '10:30'), ('11:40', '15:00')])
+        # A window ending before 11:40 keeps only the first
+        self.assertEqual(len(find_earliest_arrival('AAA', 'CCC', 0, 11 * 60)['journeys']), 1)
+
+    def test_profile_matches_earliest_arrival_on_random_schedules(self):
+        rng = random.Random(5)
+        codes = [f'R{i}' for i in range(12)]
+        Airport.objects.create(code='R0')
+        for i in range(1, 12):
+            add_next_airport(rng.choice(codes[:i]), 'left' if i % 2 else 'right', codes[i], rng.randint(10, 90))
+        for _ in range(20):
+            add_route(rng.choice(codes), rng.choice(codes), rng.randint(10, 90))
+        for route in Route.objects.filter(origin__code__startswith='R').exclude(duration=0):
+            for _ in range(3):
+                Departure.objects.create(route=route, reverse=rng.random() < 0.5, departs=rng.randint(0, 1440))
+
+        timetable = get_timetable()
+        index = timetable.graph.index
+        for _ in range(30):
+            source, target = (index[code] for code in rng.sample(codes, 2))
+            journeys = timetable.profile(source, target, 0, 1440)
+            for journey in journeys:
+                self.assertEqual(journey.arrives,
+                                 timetable.earliest_arrival(source, target, journey.departs).arrives)
+                self.assertEqual(self.brute_force(timetable, source, target, journey.departs),
+                                 journey.arrives)
+            for depart_at in (0, 300, 700, 1200):
+                found = timetable.earliest_arrival(source, target, depart_at)
+                self.assertEqual(found and found.arrives,
+                                 self.brute_force(timetable, source, target, depart_at))
+
+    def test_timetable_follows_departure_changes(self):
+        timetable = get_timetable()
+        self.assertIs(get_timetable(), timetable)
+        Departure.objects.filter(departs=8 * 60).delete()
+        self.assertIsNot(get_timetable(), timetable)
+        self.assertEqual(find_earliest_arrival('AAA', 'CCC', 7 * 60)['journeys'][0]['departs'], '11:40')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("origin,destination,departs\nCCC,AAA,06:15\nBBB,AAA,25:00\n")
+        self.addCleanup(os.unlink, f.name)
+        call_command('import_departures', f.name, stdout=io.StringIO())
+        self.assertEqual(find_earliest_arrival('CCC', 'AAA', 0)['journeys'][0]['arrives'], '09:35')
+        self.assertEqual(find_earliest_arrival('BBB', 'AAA', 0)['journeys'][0]['arrives'], '02:00 +1d')
+
+    @override_settings(ROUTE_VERSION_CHECK_INTERVAL=0)
+    def test_timetable_follows_departures_edited_elsewhere(self):
+        timetable = get_timetable()
+        # Written without this process's signals, as import_departures in another process
+        Departure.objects.filter(departs=8 * 60).update(departs=6 * 60)
+        self.assertIs(get_timetable(), timetable)
+        versions.bump('schedule')
+        self.assertIsNot(get_timetable(), timetable)
+        self.assertEqual(find_earliest_arrival('AAA', 'CCC', 5 * 60)['journeys'][0]['departs'], '06:00')
+
+    def test_search_page(self):
+        self.client.force_login(get_user_model().objects.create_user('viewer', password='pw'))
+        response = self.client.post(reverse('airport_route') + '?type=earliest_arrival', {
+            'from_airport': 'aaa', 'to_airport': 'ccc', 'depart_at': '07:00', 'latest_departure': '12:00',
+        })
+        self.assertContains(response, 'AAA 08:00 → BBB 09:00<br>BBB 10:00 → CCC 10:30')
+        self.assertContains(response, '11:40')
+
+
+class ReadReplicaTests(RouteTestCase):
+    def test_reads_in_read_only_views_use_the_replica(self):
+        router = ReadReplicaRouter()
+        # Under the test runner the replica mirrors the test database
+        with reading_from_replica():
+            self.assertIsNone(router.db_for_read(Airport))
+        with mock.patch.dict(connections['replica'].settings_dict, NAME='file:replica?mode=ro'):
+            self.assertIsNone(router.db_for_read(Airport))
+            with reading_from_replica():
+                self.assertEqual(router.db_for_read(Airport), 'replica')
+                self.assertEqual(router.db_for_write(Airport), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'airport'))
+
+    def test_cached_structures_are_built_from_the_primary(self):
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_departure('AAA', 'BBB', 9 * 60)
+        # This test case may not query the replica, so a build reading it fails
+        with mock.patch.dict(connections['replica'].settings_dict, NAME='file:replica?mode=ro'):
+            with reading_from_replica():
+                self.assertEqual(len(get_graph()), 2)
+                self.assertEqual(get_chain_index().nth('AAA', 'left', 1), ('BBB', None))
+                self.assertEqual(len(get_timetable().departs), 1)
+
+
+class ExportTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 5)
+        add_next_airport('BBB', 'right', 'CCC', 7.5)
+        add_route('AAA', 'CCC', 30)
+        add_departure('CCC', 'BBB', 9 * 60)
+        self.client.force_login(get_user_model().objects.create_user('viewer', password='pw'))
+        self.routes = [('AAA', 'BBB', 5.0, 'left'), ('BBB', 'CCC', 7.5, 'right'), ('AAA', 'CCC', 30.0, None)]
+
+    def download(self, table, **params):
+        response = self.client.get(reverse('export_network', args=[table]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_rows_are_read_in_keyset_chunks(self):
+        with self.assertNumQueries(2):
+            chunks = list(row_chunks(TABLES['routes'], chunk_size=2))
+        self.assertEqual([row for chunk in chunks for row in chunk], self.routes)
+
+    def test_formats(self):
+        lines = self.download('routes').decode().splitlines()
+        self.assertEqual(json.loads(lines[2]),
+                         {'origin': 'AAA', 'destination': 'CCC', 'duration': 30.0, 'slot': None})
+        self.assertEqual(self.download('routes', format='csv').decode().splitlines(),
+                         ['origin,destination,duration,slot', 'AAA,BBB,5.0,left',
+                          'BBB,CCC,7.5,right', 'AAA,CCC,30.0,'])
+        data = gzip.decompress(self.download('routes', format='columnar', gzip=1))
+        columns, rows = read_columnar(io.BytesIO(data))
+        self.assertEqual([c.name for c in columns], ['origin', 'destination', 'duration', 'slot'])
+        self.assertEqual(list(rows), self.routes)
+        self.assertEqual(self.download('departures', format='csv').decode().splitlines()[1], 'CCC,BBB,540')
+        response = self.client.get(reverse('export_network', args=['users']))
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'routes.frcol.gz')
+            call_command('export_network', path, stdout=io.StringIO())
+            with gzip.open(path) as f:
+                _, rows = read_columnar(f)
+                self.assertEqual(list(rows), self.routes)
+
+
+class AirportStatsTests(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        # A square AAA-BBB-CCC-DDD with two equally short ways round, and EEE alone
+        Airport.objects.create(code='AAA')
+        add_next_airport('AAA', 'left', 'BBB', 1)
+        add_next_airport('BBB', 'left', 'CCC', 2)
+        add_next_airport('AAA', 'right', 'DDD', 2)
+        add_next_airport('DDD', 'left', 'CCC', 1)
+        Airport.objects.create(code='EEE')
+
+    def test_stats(self):
+        stats = {row.code: row for row in compute_stats(get_graph(), workers=1)}
+        self.assertEqual(stats['AAA'][1:4], (3, 2.0, 3.0))
+        self.assertEqual(stats['EEE'][1:], (0, None, None, 0.0, 0.0))
+        self.assertAlmostEqual(stats['AAA'].closeness, 3 / 6 * 3 / 4)
+        # Half of the AAA-CCC and CCC-AAA routes pass through BBB, out of 4 * 3 pairs
+        self.assertAlmostEqual(stats['BBB'].betweenness, 1 / 12)
+
+    def test_pool_matches_a_single_process(self):
+        apply_links(synthetic_network('random', 60, random.Random(3)))
+        graph = get_graph()
+        serial = compute_stats(graph, workers=1)
+        for row, pooled in zip(serial, compute_stats(graph, workers=3)):
+            self.assertEqual(row[:4], pooled[:4])
+            self.assertAlmostEqual(row.betweenness, pooled.betweenness)
+
+    def test_command_fills_the_dashboard(self):
+        call_command('compute_airport_stats', workers=1, stdout=io.StringIO())
+        self.assertEqual(AirportStats.objects.count(), 5)
+        self.client.force_login(get_user_model().objects.create_user('ops', password='pw', is_admin=True))
+        hubs = list(self.client.get(reverse('dashboard')).context['hubs'])
+        self.assertEqual(len(hubs), 5)
+        self.assertEqual(hubs[-1].airport.code, 'EEE')
@@ -0,0 +1,358 @@
+"""
+LRU cache of single-source shortest-path trees.
+
+Each entry holds the full Dijkstra result from one airport, keyed by
+(graph version, start code), so popular origins are searched once per graph
+version. The cache is bounded by the ROUTE_TREE_CACHE_BYTES setting and
+evicts the least recently used trees first.
+
+When the graph changes the cached trees are repaired rather than dropped:
+the old and new graphs are diffed once, and each old tree is repaired the
+next time it is looked up, by propagating distances improved by shorter or
+new links outwards from the changed links and searching again only the
+subtrees hanging off lengthened or removed tree links. Trees not looked up
+before the following edit are dropped, and edits that touch more than
+MAX_REPAIR_CHANGES links clear the cache.
+"""
+import heapq
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from . import instrumentation, route_cache
+
+
+DEFAULT_BUDGET = 64 * 1024 * 1024
+# Changed links above which repairing trees costs more than searching again
+MAX_REPAIR_CHANGES = 1000
+
+INF = float('inf')
+
+# distances/predecessors are indexed by node id; order lists the reachable
+# node ids from nearest to farthest
+ShortestPathTree = namedtuple('ShortestPathTree', ['source', 'distances', 'predecessors', 'order'])
+
+# Differences between two graphs. old_to_new maps old node ids to new ones
+# (-1 for removed airports) and is None when the ids are unchanged; removed
+# lists the old ids of removed airports; changes holds one
+# (old_a, old_b, new_a, new_b, old_weight, new_weight) per changed link,
+# with -1 ids for airports missing on that side and None weights for
+# missing links.
+GraphDiff = namedtuple('GraphDiff', ['old_to_new', 'removed', 'changes'])
+
+
+def tree_size(tree):
+    """Approximate bytes held by a tree's arrays."""
+    return sum(a.itemsize * len(a) for a in (tree.distances, tree.predecessors, tree.order))
+
+
+def compute_tree(graph, source):
+    with instrumentation.timed('search'):
+        distances, predecessors, order = graph.shortest_paths(source)
+    instrumentation.count('settled', len(order))
+    return ShortestPathTree(source, distances, predecessors, array('i', order))
+
+
+def diff_graphs(old, new, limit=MAX_REPAIR_CHANGES):
+    """The GraphDiff from old to new, or None if more than limit links changed."""
+    same_ids = old.codes == new.codes
+    if same_ids and old.offsets == new.offsets and old.targets == new.targets \
+            and old.weights == new.weights:
+        return GraphDiff(None, [], [])
+
+    old_to_new = None
+    removed = []
+    if not same_ids:
+        old_to_new = array('i', [new.index.get(code, -1) for code in old.codes])
+        removed = [o for o, u in enumerate(old_to_new) if u < 0]
+
+    def old_id(u):
+        return u if same_ids else old.index.get(new.codes[u], -1)
+
+    changes = []
+    old_offsets, old_targets, old_weights = old.offsets, old.targets, old.weights
+    new_offsets, new_targets, new_weights = new.offsets, new.targets, new.weights
+    for u in range(len(new)):
+        start, end = new_offsets[u], new_offsets[u + 1]
+        o = old_id(u)
+        before = {}
+        if o >= 0:
+            old_start, old_end = old_offsets[o], old_offsets[o + 1]
+            if same_ids and old_targets[old_start:old_end] == new_targets[start:end] \
+                    and old_weights[old_start:old_end] == new_weights[start:end]:
+                continue
+            for e in range(old_start, old_end):
+                v = old_targets[e] if same_ids else old_to_new[old_targets[e]]
+                if v > u:
+                    before[v] = old_weights[e]
+
+        # Each link is recorded once, from its end with the lower new id
+        for e in range(start, end):
+            v = new_targets[e]
+            if v > u:
+                weight = before.pop(v, None)
+                if weight != new_weights[e]:
+                    changes.append((o, old_id(v), u, v, weight, new_weights[e]))
+        for v, weight in before.items():
+            changes.append((o, old_id(v), u, v, weight, None))
+        if len(changes) > limit:
+            return None
+
+    return GraphDiff(old_to_new, removed, changes)
+
+
+def repair_tree(tree, new, diff):
+    """
+    Turn a tree computed on an older graph into the tree for graph new,
+    given the diff between them. Returns None when the tree's own airport
+    was removed.
+    """
+    old_to_new = diff.old_to_new
+    source = tree.source if old_to_new is None else old_to_new[tree.source]
+    if source < 0:
+        return None
+    distances, predecessors = tree.distances, tree.predecessors
+
+    # Lengthened or removed tree links, and removed airports, cut off the
+    # subtree below them; every other distance is still achievable
+    cut = set()
+    for old_a, old_b, _, _, old_weight, new_weight in diff.changes:
+        if old_weight is None or (new_weight is not None and new_weight <= old_weight):
+            continue
+        if old_b >= 0 and predecessors[old_b] == old_a:
+            cut.add(old_b)
+        elif old_a >= 0 and predecessors[old_a] == old_b:
+            cut.add(old_a)
+    cut.update(o for o in diff.removed if distances[o] < INF)
+
+    improved = [
+        change for change in diff.changes
+        if change[5] is not None and (change[4] is None or change[5] < change[4])
+    ]
+    if old_to_new is None and not cut and not any(
+        distances[a] + weight < distances[b] or distances[b] + weight < distances[a]
+        for _, _, a, b, _, weight in improved
+    ):
+        return tree
+
+    n = len(new)
+    new_distances = array('d', [INF]) * n
+    new_predecessors = array('i', [-1]) * n
+    cut_off = []
+    # Dijkstra settles a node after its predecessor, so one pass in order
+    # finds every node below a cut
+    dropped = bytearray(len(distances))
+    for o in tree.order:
+        p = predecessors[o]
+        if o in cut or (p >= 0 and dropped[p]):
+            dropped[o] = 1
+            cut_off.append(o)
+            continue
+        u = o if old_to_new is None else old_to_new[o]
+        new_distances[u] = distances[o]
+        if p >= 0:
+            new_predecessors[u] = p if old_to_new is None else old_to_new[p]
+
+    offsets, targets, weights = new.offsets, new.targets, new.weights
+    queue = []
+
+    def offer(node, dist, predecessor):
+        if dist < new_distances[node]:
+            new_distances[node] = dist
+            new_predecessors[node] = predecessor
+            heapq.heappush(queue, (dist, node))
+
+    # Cut-off nodes restart from their best neighbor outside the cut
+    for o in cut_off:
+        u = o if old_to_new is None else old_to_new[o]
+        if u < 0:
+            continue
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            offer(u, new_distances[v] + weights[e], v)
+    for _, _, a, b, _, weight in improved:
+        offer(b, new_distances[a] + weight, a)
+        offer(a, new_distances[b] + weight, b)
+
+    while queue:
+        dist, node = heapq.heappop(queue)
+        if dist > new_distances[node]:
+            continue
+        for e in range(offsets[node], offsets[node + 1]):
+            offer(targets[e], dist + weights[e], node)
+
+    order = array('i', sorted(
+        (u for u in range(n) if new_distances[u] < INF), key=new_distances.__getitem__,
+    ))
+    return ShortestPathTree(source, new_distances, new_predecessors, order)
+
+
+class TreeCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trees = OrderedDict()
+        self._version = None
+        self._graph = None
+        # Trees of the graph before self._graph are keyed by _stale_version
+        # until repaired with _diff
+        self._stale_version = None
+        self._diff = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.repairs = 0
+
+    @property
+    def budget(self):
+        return getattr(settings, 'ROUTE_TREE_CACHE_BYTES', DEFAULT_BUDGET)
+
+    def peek(self, graph, *codes):
+        """
+        Return the cached tree rooted at the first of codes that has one,
+        repairing it if it was computed before the last edit, or None
+        without searching. Counts as one hit or one miss.
+        """
+        tree = stale = None
+        with self._lock:
+            self._follow(graph)
+            for code in codes:
+                key = (graph.version, code)
+                tree = self._trees.get(key)
+                if tree is not None:
+                    self._trees.move_to_end(key)
+                    break
+                if graph.version != self._version:
+                    continue
+                stale = self._trees.pop((self._stale_version, code), None)
+                if stale is not None:
+                    self.bytes -= tree_size(stale)
+                    diff = self._diff
+                    break
+        if stale is not None:
+            # Repaired outside the lock; lookups of other trees go on
+            tree = repair_tree(stale, graph, diff)
+            self.repairs += 1
+            if tree is not None:
+                self.put(graph, code, tree)
+        if tree is None:
+            self.misses += 1
+            instrumentation.count('tree_misses')
+            return None
+        self.hits += 1
+        instrumentation.count('tree_hits')
+        return tree
+
+    def get(self, graph, code, store=True):
+        """
+        Return the tree for code, from this cache, then from the route cache
+        when it is shared between processes, running Dijkstra only when
+        neither has it. With store=False a missing tree is computed but not
+        cached anywhere, for one-off scans that would otherwise flush the
+        popular origins.
+        """
+        tree = self.peek(graph, code)
+        if tree is None:
+            if store and route_cache.is_shared():
+                tree = route_cache.cached(
+                    route_cache.result_key(graph, 'tree', code),
+                    lambda: compute_tree(graph, graph.index[code]),
+                )
+            else:
+                tree = compute_tree(graph, graph.index[code])
+            if store:
+                self.put(graph, code, tree)
+        return tree
+
+    def load(self, graph, code):
+        """The tree for code from the shared route cache, or None without searching."""
+        if not route_cache.is_shared():
+            return None
+        tree = route_cache.peek(route_cache.result_key(graph, 'tree', code))
+        if tree is not None:
+            self.put(graph, code, tree)
+        return tree
+
+    def put(self, graph, code, tree):
+        size = tree_size(tree)
+        budget = self.budget
+        if size > budget:
+            return
+        key = (graph.version, code)
+        with self._lock:
+            self._follow(graph)
+            if graph.version != self._version or key in self._trees:
+                return
+            self._trees[key] = tree
+            self.bytes += size
+            while self.bytes > budget:
+                _, evicted = self._trees.popitem(last=False)
+                self.bytes -= tree_size(evicted)
+                self.evictions += 1
+
+    def _follow(self, graph):
+        """
+        Move on to a newer graph (call under the lock). The current trees
+        become stale, to be repaired as they are looked up; stale trees
+        left from the previous edit are dropped.
+        """
+        if self._version is not None and graph.version <= self._version:
+            return
+        previous, previous_version = self._graph, self._version
+        self._version = graph.version
+        self._graph = graph
+        self._stale_version = previous_version
+        self._diff = None
+        for key in [key for key in self._trees if key[0] != previous_version]:
+            self.bytes -= tree_size(self._trees.pop(key))
+        if self._trees:
+            self._diff = diff_graphs(previous, graph)
+            if self._diff is None:
+                self._clear()
+
+    def _clear(self):
+        self._trees.clear()
+        self.bytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._trees),
+            'bytes': self.bytes,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'repairs': self.repairs,
+        }
+
+
+tree_cache = TreeCache()
+
+
+def tree_distance(graph, tree, start, end):
+    """
+    Distance between node ids start and end read from a tree rooted at
+    either of them, or None when unreachable. A tree rooted at end is walked
+    back to end and re-summed from start, so both give the same value.
+    """
+    if start == end:
+        return 0
+    if tree.source == start:
+        dist = tree.distances[end]
+        return None if dist == float('inf') else dist
+
+    if tree.distances[start] == float('inf'):
+        return None
+    dist = 0
+    node = start
+    while node != end:
+        previous = tree.predecessors[node]
+        dist += graph.edge_weight(node, previous)
+        node = previous
+    return dist
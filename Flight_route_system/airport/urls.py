@@ -8,5 +8,13 @@ urlpatterns = [
     path('update/<int:pk>/', views.airport_update, name='airport_update'),
     path('delete/<int:pk>/', views.airport_delete, name='airport_delete'),
     path('add_next/', views.add_next_airport_view, name='add_next_airport'),
+    path('import/', views.import_routes_view, name='import_routes'),
     path('shortest_path/', views.shortest_path_view, name='shortest_path'),
+    path('shortest_path/download/', views.shortest_path_download_view, name='shortest_path_download'),
+    path('async/route/', views.airport_route_async_view, name='airport_route_async'),
+    path('async/shortest_path/', views.shortest_path_async_view, name='shortest_path_async'),
+    path('export/<str:table>/', views.export_view, name='export_network'),
+    path('api/routes/batch/', views.batch_route_view, name='batch_routes'),
+    path('api/stats/', views.route_stats_view, name='route_stats'),
+    path('api/autocomplete/', views.airport_autocomplete_view, name='airport_autocomplete'),
 ]
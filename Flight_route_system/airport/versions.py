@@ -0,0 +1,56 @@
+"""
+Edit counts of the route network shared by every process.
+
+One NetworkVersion row counts edits of the route graph and of the
+timetable. graph_changed and schedule_changed bump it inside the writing
+transaction, so the new count commits together with the edit. Processes
+that did not make the edit (other web workers, management commands)
+compare it with the count their cached structures were built at and
+rebuild when it moved. The row is always read from the primary: a lagging
+replica would hide the edit.
+
+Each process reads the row at most once every ROUTE_VERSION_CHECK_INTERVAL
+seconds, so that is how long other processes can take to see an edit; the
+editing process sees it at once.
+"""
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+
+from .models import NetworkVersion
+
+
+FIELDS = ('graph', 'schedule')
+
+_stamps = (0, 0)
+_checked = None
+
+
+def check_interval():
+    return getattr(settings, 'ROUTE_VERSION_CHECK_INTERVAL', 1)
+
+
+def stamps():
+    """(graph, schedule) edit counts, read from the database once per interval."""
+    global _stamps, _checked
+    now = time.monotonic()
+    if _checked is None or now - _checked >= check_interval():
+        row = NetworkVersion.objects.using(DEFAULT_DB_ALIAS).filter(pk=1).values_list(*FIELDS).first()
+        _stamps, _checked = row or (0, 0), now
+    return _stamps
+
+
+def expire():
+    """Read the counts again on next use, e.g. once an edit has committed."""
+    global _checked
+    _checked = None
+
+
+def bump(field):
+    """Count an edit of the 'graph' or 'schedule' in the current transaction."""
+    versions = NetworkVersion.objects.using(DEFAULT_DB_ALIAS)
+    if not versions.filter(pk=1).update(**{field: F(field) + 1}):
+        versions.get_or_create(pk=1)
+        versions.filter(pk=1).update(**{field: F(field) + 1})
@@ -3,9 +3,41 @@ from django.shortcuts import render
 # Create your views here.
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Airport
-from .forms import AirportForm, AddNextAirportForm, ShortestPathForm,NthNodeForm,DurationForm
-import heapq
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Exists, F, FilteredRelation, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Upper
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from .models import Airport, Route
+from .forms import AirportForm, AddNextAirportForm, ShortestPathForm,NthNodeForm,DurationForm,RouteImportForm,AlternativeRoutesForm,FewestHopsForm,EarliestArrivalForm
+from .importer import RouteImportError, import_routes
+from . import exporter
+from .chains import get_chain_index
+from .components import get_component_index
+from .graph import get_graph, search_stats
+from .instrumentation import timed, view_histograms
+from .matrix import get_matrix
+from .routers import iterate_from_replica, read_replica
+from .routing import fewest_hops_route, k_shortest_routes
+from .schedules import clock, get_timetable, min_transfer
+from . import route_cache
+from .trees import tree_cache, tree_distance
+from .workers import StaleGraph, run_search
+from collections import defaultdict
+import io
+import json
+
+# Direct routes listed per page of the longest_route search
+TOP_ROUTES_PER_PAGE = 10
+# Airports listed per page of airport_list
+AIRPORTS_PER_PAGE = 50
+# Suggestions returned by the code autocomplete
+AUTOCOMPLETE_LIMIT = 10
+# Reachable airports listed per page of shortest_path
+SHORTEST_PATH_PER_PAGE = 100
+# Rows per chunk of a streamed distance table download
+DOWNLOAD_CHUNK_ROWS = 2000
+
 
 # --- Role check decorator ---
 def admin_required(view_func):
@@ -18,10 +50,61 @@ def admin_required(view_func):
 
 # --- CRUD views ---
 @login_required
+@read_replica
 def airport_list(request):
-    query = request.GET.get('q', '')
-    airports = Airport.objects.filter(code__icontains=query) if query else Airport.objects.all()
-    return render(request, 'airports/airport_list.html', {'airports': airports, 'query': query})
+    query = request.GET.get('q', '').strip()
+    after = request.GET.get('after', '')
+    airports = Airport.objects.annotate(code_upper=Upper('code'))
+    if query:
+        # Case-insensitive prefix search as a range on the indexed UPPER(code)
+        prefix = query.upper()
+        airports = airports.filter(code_upper__gte=prefix, code_upper__lt=prefix_successor(prefix))
+    if after:
+        # Keyset pagination: continue right after the last code shown
+        airports = airports.filter(
+            Q(code_upper__gt=after.upper()) | Q(code_upper=after.upper(), code__gt=after)
+        )
+    # Pull the slot routes and the route count in the same query instead of
+    # one lookup per row
+    route_count = (
+        Route.objects.filter(origin=OuterRef('pk')).order_by()
+        .values('origin').annotate(n=Count('pk')).values('n')
+    )
+    airports = list(
+        airports.annotate(
+            left_route=FilteredRelation('routes', condition=Q(routes__slot='left')),
+            right_route=FilteredRelation('routes', condition=Q(routes__slot='right')),
+            route_count=Coalesce(Subquery(route_count), 0),
+        ).order_by('code_upper', 'code').values(
+            'id', 'code', 'route_count',
+            left_code=F('left_route__destination__code'), left_distance=F('left_route__duration'),
+            right_code=F('right_route__destination__code'), right_distance=F('right_route__duration'),
+        )[:AIRPORTS_PER_PAGE + 1]
+    )
+    next_after = None
+    if len(airports) > AIRPORTS_PER_PAGE:
+        airports = airports[:AIRPORTS_PER_PAGE]
+        next_after = airports[-1]['code']
+    return render(request, 'airports/airport_list.html', {
+        'airports': airports,
+        'query': query,
+        'after': after,
+        'next_after': next_after,
+    })
+
+
+def prefix_successor(prefix):
+    """Smallest string greater than every string starting with prefix."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+@login_required
+@read_replica
+def airport_autocomplete_view(request):
+    """Airport codes starting with ?q=, from the sorted in-memory code index."""
+    prefix = request.GET.get('q', '').strip().upper()
+    codes = get_graph().codes_with_prefix(prefix, AUTOCOMPLETE_LIMIT) if prefix else []
+    return JsonResponse({'codes': codes})
 
 
 @login_required
@@ -75,120 +158,372 @@ def add_next_airport_view(request):
     return render(request, 'airports/add_next_airport.html', {'form': form})
 
 
+# --- Bulk import of links ---
+@login_required
+@admin_required
+def import_routes_view(request):
+    summary = None
+    errors = None
+    if request.method == 'POST':
+        form = RouteImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Stream the upload line by line instead of reading it whole
+            lines = io.TextIOWrapper(form.cleaned_data['file'], encoding='utf-8', newline='')
+            try:
+                added, linked = import_routes(lines, form.cleaned_data['format'])
+                summary = f"Imported {linked} links and added {added} airports."
+            except RouteImportError as e:
+                errors = e.errors
+                summary = f"{e.error_count} invalid row(s); nothing was imported."
+    else:
+        form = RouteImportForm()
+    return render(request, 'airports/import_routes.html', {
+        'form': form,
+        'summary': summary,
+        'errors': errors,
+    })
+
+
+
+def page_number(request):
+    """The ?page= number of a paginated view, 1 when missing or invalid."""
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
+
+def shortest_path_form(request):
+    """
+    ShortestPathForm bound to the POSTed search or to the ?start= of a
+    page link, or unbound when the page is first loaded.
+    """
+    if request.method == 'POST':
+        return ShortestPathForm(request.POST)
+    if 'start' in request.GET:
+        return ShortestPathForm(request.GET)
+    return ShortestPathForm()
+
+
+def shortest_path_context(form, result, page):
+    """Template context for one page of shortest_path results."""
+    context = {'form': form, 'result': result, 'page': page}
+    if isinstance(result, dict):
+        # Rendered rows are cached per graph, start and page; the graph key
+        # is the same in every worker, so the fragments can be shared too
+        context['graph_key'] = route_cache.graph_key(get_graph())
+        context['has_next'] = result['offset'] + len(result['airports']) < result['total']
+    return context
+
 
 @login_required
+@read_replica
 def shortest_path_view(request):
     """
     View function to handle finding the shortest paths 
     from a selected airport to all other reachable airports.
     """
     result = None
+    page = page_number(request)
+    form = shortest_path_form(request)
 
-    # ✅ When form is submitted via POST
-    if request.method == 'POST':
-        form = ShortestPathForm(request.POST)
-        if form.is_valid():
-            # Normalize the starting airport code to uppercase
-            start = form.cleaned_data['start'].strip().upper()
+    # ✅ When the form is submitted, or a page link followed
+    if form.is_bound and form.is_valid():
+        # Normalize the starting airport code to uppercase
+        start = form.cleaned_data['start'].strip().upper()
 
-            # Call function to compute shortest paths
-            result = find_shortest_path(start)
-    else:
-        # ✅ When the page is first loaded (GET request)
-        form = ShortestPathForm()
+        # Call function to compute shortest paths, one page at a time
+        result = find_shortest_path(start, (page - 1) * SHORTEST_PATH_PER_PAGE, SHORTEST_PATH_PER_PAGE)
 
     # ✅ Render result (either message or list of airports)
-    return render(request, 'airports/shortest_path.html', {
-        'form': form,
-        'result': result
-    })
+    return render(request, 'airports/shortest_path.html', shortest_path_context(form, result, page))
 
 
-def find_shortest_path(start_code):
+def find_shortest_path(start_code, offset=0, limit=None, cached_only=False):
     """
     Finds the shortest travel duration from the given start airport
     to all other connected airports using Dijkstra’s algorithm.
+    offset and limit select a page of the airports, nearest first.
+    With cached_only=True, returns None instead of running a search.
     """
-    airports = Airport.objects.all()
-    graph = {}
-
-    # ✅ STEP 1: Build a bidirectional graph using airport connections
-    for a in airports:
-        code = a.code.upper()
-        if code not in graph:
-            graph[code] = {}
-
-        # Left connection (if exists)
-        if a.left and a.left_distance:
-            left_code = a.left.code.upper()
-            graph[code][left_code] = a.left_distance
-
-            # Add reverse link (bidirectional)
-            if left_code not in graph:
-                graph[left_code] = {}
-            graph[left_code][code] = a.left_distance
-
-        # Right connection (if exists)
-        if a.right and a.right_distance:
-            right_code = a.right.code.upper()
-            graph[code][right_code] = a.right_distance
-
-            # Add reverse link (bidirectional)
-            if right_code not in graph:
-                graph[right_code] = {}
-            graph[right_code][code] = a.right_distance
+    # ✅ STEP 1: Use the shared bidirectional graph of airport connections
+    graph = get_graph()
 
     # ✅ STEP 2: Validate start airport
     if start_code not in graph:
         return "No nearby airport found."
 
-    # ✅ STEP 3: Initialize Dijkstra’s algorithm
-    queue = [(0, start_code)]      # Priority queue with (distance, airport)
-    distances = {start_code: 0}    # Dictionary to store shortest distances
-    visited = set()                # Set to track visited airports
+    # ✅ STEP 3: Get the Dijkstra tree from the start airport (cached per graph)
+    route_cache.record_origin(start_code)
+    if cached_only:
+        tree = tree_cache.peek(graph, start_code) or tree_cache.load(graph, start_code)
+        if tree is None:
+            return None
+    else:
+        tree = tree_cache.get(graph, start_code)
+
+    # ✅ STEP 4: Skip the start node (no need to show distance to itself)
+    # Dijkstra settles airports in ascending distance, so no sort is needed,
+    # and the start is always settled first
+    total = len(tree.order) - 1
+    end = total if limit is None else min(offset + limit, total)
+    sorted_airports = [
+        (graph.codes[i], tree.distances[i]) for i in tree.order[1 + offset:1 + end]
+    ]
+
+    # ✅ STEP 5: Handle isolated airport
+    if not total:
+        return "No nearby airport found."
+
+    # ✅ STEP 6: Return a structured dictionary for template rendering
+    # This can be used in HTML to display a list of reachable airports with durations.
+    return {
+        'airports': sorted_airports,
+        'start': start_code,
+        'offset': offset,
+        'total': total,
+    }
+
 
-    # ✅ STEP 4: Explore graph using Dijkstra’s logic
-    while queue:
-        dist, node = heapq.heappop(queue)
+@login_required
+@read_replica
+def shortest_path_download_view(request):
+    """
+    The full distance table from ?start= as CSV or, with ?format=json, as
+    compact JSON. Rows are streamed in chunks straight from the cached
+    shortest-path tree, so large tables are never held in memory as text.
+    """
+    start = request.GET.get('start', '').strip().upper()
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'json'):
+        return HttpResponseBadRequest("format must be 'csv' or 'json'")
+    graph = get_graph()
+    if start not in graph:
+        return HttpResponseBadRequest("Invalid airport code.")
+    tree = tree_cache.get(graph, start)
+    codes, distances, order = graph.codes, tree.distances, tree.order
+
+    def chunks():
+        if fmt == 'json':
+            yield '{"start":%s,"airports":[' % json.dumps(start)
+        else:
+            yield 'airport,distance\n'
+        for i in range(1, len(order), DOWNLOAD_CHUNK_ROWS):
+            rows = order[i:i + DOWNLOAD_CHUNK_ROWS]
+            if fmt == 'json':
+                text = ','.join(f'[{json.dumps(codes[n])},{distances[n]!r}]' for n in rows)
+                yield text if i == 1 else ',' + text
+            else:
+                yield ''.join(f'{codes[n]},{distances[n]!r}\n' for n in rows)
+        if fmt == 'json':
+            yield ']}'
+
+    response = StreamingHttpResponse(
+        chunks(), content_type='application/json' if fmt == 'json' else 'text/csv',
+    )
+    response['Content-Disposition'] = f'attachment; filename="distances-{start}.{fmt}"'
+    return response
 
-        # Skip if already visited
-        if node in visited:
-            continue
-        visited.add(node)
 
-        # Explore all connected neighbors
-        for neighbor, d in graph[node].items():
-            new_dist = dist + d
-            # If new distance is shorter, update and push into heap
-            if neighbor not in distances or new_dist < distances[neighbor]:
-                distances[neighbor] = new_dist
-                heapq.heappush(queue, (new_dist, neighbor))
+@login_required
+@read_replica
+def export_view(request, table):
+    """
+    The whole airports, routes or departures table as ?format=ndjson (the
+    default), csv or columnar, gzipped with ?gzip=1. Rows are read in
+    keyset chunks and streamed as they are encoded, see exporter.py.
+    """
+    fmt = request.GET.get('format', 'ndjson')
+    if table not in exporter.TABLES:
+        return HttpResponseBadRequest(f"table must be one of {', '.join(exporter.TABLES)}")
+    if fmt not in exporter.FORMATS:
+        return HttpResponseBadRequest(f"format must be one of {', '.join(exporter.FORMATS)}")
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    chunks = iterate_from_replica(exporter.row_chunks(exporter.TABLES[table]))
+    response = StreamingHttpResponse(
+        exporter.export(table, fmt, compress, chunks=chunks),
+        content_type='application/gzip' if compress else exporter.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{exporter.export_filename(table, fmt, compress)}"'
+    )
+    return response
+
+
+# --- Async (ASGI) variants: cache hits are answered directly and searches
+# run in the worker pool, so the event loop is never blocked by Dijkstra ---
+async def offloaded_search(kind, *args):
+    find = find_shortest_path if kind == 'shortest_path' else find_duration_between
+    result = await sync_to_async(find)(*args, cached_only=True)
+    if result is None:
+        result = await run_search(kind, *args)
+    return result
+
+
+def stale_graph_response():
+    """The network changed under a search twice in a row; ask the client to retry."""
+    response = HttpResponse("The route network is being updated, please retry.",
+                            content_type='text/plain', status=503)
+    response['Retry-After'] = '1'
+    return response
 
-    # ✅ STEP 5: Remove the start node from results (no need to show distance to itself)
-    distances.pop(start_code, None)
 
-    # ✅ STEP 6: Handle isolated airport
-    if not distances:
-        return "No nearby airport found."
+@login_required
+@read_replica
+async def shortest_path_async_view(request):
+    result = None
+    page = page_number(request)
+    form = shortest_path_form(request)
+    if form.is_bound and form.is_valid():
+        start = form.cleaned_data['start'].strip().upper()
+        try:
+            result = await offloaded_search(
+                'shortest_path', start, (page - 1) * SHORTEST_PATH_PER_PAGE, SHORTEST_PATH_PER_PAGE,
+            )
+        except StaleGraph:
+            return stale_graph_response()
 
-    # ✅ STEP 7: Sort airports by distance (ascending order)
-    sorted_airports = sorted(distances.items(), key=lambda x: x[1])
+    context = await sync_to_async(shortest_path_context)(form, result, page)
+    return await sync_to_async(render)(request, 'airports/shortest_path.html', context)
+
+
+@login_required
+@read_replica
+async def airport_route_async_view(request):
+    search_type = request.GET.get('type', 'duration_between')
+    if search_type != 'duration_between':
+        # nth_node and longest_route are index lookups, not graph searches
+        return await sync_to_async(airport_route_view)(request)
+
+    result = None
+    if request.method == 'POST':
+        form = DurationForm(request.POST)
+        if form.is_valid():
+            from_airport = form.cleaned_data['from_airport'].strip().upper()
+            to_airport = form.cleaned_data['to_airport'].strip().upper()
+            try:
+                result = await offloaded_search('duration_between', from_airport, to_airport)
+            except StaleGraph:
+                return stale_graph_response()
+    else:
+        form = DurationForm()
+
+    return await sync_to_async(render)(request, 'airports/route_search.html', {
+        'form': form,
+        'search_type': search_type,
+        'result': result,
+        'top_routes': None,
+    })
+
+
+@login_required
+@require_POST
+@read_replica
+def batch_route_view(request):
+    """
+    JSON API for many route lookups in one request.
+
+    The body is either {"pairs": [["FROM", "TO"], ...]} or
+    {"origins": ["FROM", ...]}. Pairs are grouped by origin so each origin
+    is searched once, and results are streamed back as NDJSON, one line per
+    pair or per origin.
+    """
+    try:
+        payload = json.loads(request.body)
+        if 'pairs' in payload:
+            pairs = [(str(a).strip().upper(), str(b).strip().upper()) for a, b in payload['pairs']]
+            origins = None
+        else:
+            origins = [str(a).strip().upper() for a in payload['origins']]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse(
+            {'error': 'Expected {"pairs": [[from, to], ...]} or {"origins": [from, ...]}.'},
+            status=400,
+        )
+
+    # Every line of one response is answered from the same graph
+    graph = get_graph()
+    if origins is not None:
+        lines = batch_origins(graph, origins)
+    else:
+        lines = batch_pairs(graph, pairs)
+    return StreamingHttpResponse(
+        (json.dumps(line) + '\n' for line in lines),
+        content_type='application/x-ndjson',
+    )
+
+
+def batch_pairs(graph, pairs):
+    """Yield one result per (from, to) pair, searching each origin once."""
+    by_origin = defaultdict(list)
+    for i, (start, end) in enumerate(pairs):
+        by_origin[start].append((i, end))
+
+    for start, targets in by_origin.items():
+        if start not in graph:
+            for i, end in targets:
+                yield {'index': i, 'from': start, 'to': end, 'error': 'Invalid airport code.'}
+            continue
+
+        source = graph.index[start]
+        if len(targets) == 1:
+            # A lone pair is cheaper as a point-to-point search
+            i, end = targets[0]
+            if end not in graph:
+                yield {'index': i, 'from': start, 'to': end, 'error': 'Invalid airport code.'}
+                continue
+            search = graph.bidirectional_search(source, graph.index[end])
+            search_stats.record(search)
+            yield {'index': i, 'from': start, 'to': end, 'duration': search.distance}
+            continue
+
+        distances = tree_cache.get(graph, start, store=False).distances
+        for i, end in targets:
+            if end not in graph:
+                yield {'index': i, 'from': start, 'to': end, 'error': 'Invalid airport code.'}
+                continue
+            dist = distances[graph.index[end]]
+            yield {'index': i, 'from': start, 'to': end,
+                   'duration': None if dist == float('inf') else dist}
+
+
+def batch_origins(graph, origins):
+    """Yield the durations to every reachable airport, one line per origin."""
+    for start in origins:
+        if start not in graph:
+            yield {'from': start, 'error': 'Invalid airport code.'}
+            continue
+        tree = tree_cache.get(graph, start, store=False)
+        yield {
+            'from': start,
+            'durations': {
+                graph.codes[i]: tree.distances[i] for i in tree.order if i != tree.source
+            },
+        }
 
-    # ✅ STEP 8: Return a structured dictionary for template rendering
-    # This can be used in HTML to display a list of reachable airports with durations.
-    return {
-        'airports': sorted_airports,
-        'start': start_code
-    }
+
+@login_required
+@admin_required
+def route_stats_view(request):
+    """Search, cache and per-view request metrics of this worker process, for monitoring."""
+    return JsonResponse({
+        'search': search_stats.as_dict(),
+        'tree_cache': tree_cache.stats(),
+        'route_cache': route_cache.stats.as_dict(),
+        'views': view_histograms.as_dict(),
+    })
 
 
 @login_required
+@read_replica
 def airport_route_view(request):
     # Get the type of search user selected from the query string
     # Default search type is 'duration_between'
     search_type = request.GET.get('type', 'duration_between')
     result = None
     form = None
+    top_routes = None
 
     # ========== CASE 1: Find Nth Node ==========
     if search_type == 'nth_node':
@@ -217,16 +552,74 @@ def airport_route_view(request):
         else:
             form = DurationForm()
 
-    # ========== CASE 3: Find Longest Route ==========
+    # ========== CASE 3: Alternative Routes ==========
+    elif search_type == 'alternatives':
+        if request.method == 'POST':
+            form = AlternativeRoutesForm(request.POST)
+            if form.is_valid():
+                from_airport = form.cleaned_data['from_airport'].strip().upper()
+                to_airport = form.cleaned_data['to_airport'].strip().upper()
+                # Up to k loopless routes, optionally limited in hops
+                result = find_alternative_routes(
+                    from_airport, to_airport,
+                    form.cleaned_data['k'], form.cleaned_data['max_hops'],
+                )
+        else:
+            form = AlternativeRoutesForm()
+
+    # ========== CASE 4: Fewest Hops ==========
+    elif search_type == 'fewest_hops':
+        if request.method == 'POST':
+            form = FewestHopsForm(request.POST)
+            if form.is_valid():
+                from_airport = form.cleaned_data['from_airport'].strip().upper()
+                to_airport = form.cleaned_data['to_airport'].strip().upper()
+                result = find_fewest_hops(from_airport, to_airport, form.cleaned_data['max_hops'])
+        else:
+            form = FewestHopsForm()
+
+    # ========== CASE 5: Earliest Arrival on the Schedule ==========
+    elif search_type == 'earliest_arrival':
+        if request.method == 'POST':
+            form = EarliestArrivalForm(request.POST)
+            if form.is_valid():
+                from_airport = form.cleaned_data['from_airport'].strip().upper()
+                to_airport = form.cleaned_data['to_airport'].strip().upper()
+                latest = form.cleaned_data['latest_departure']
+                result = find_earliest_arrival(
+                    from_airport, to_airport, minutes_of(form.cleaned_data['depart_at']),
+                    minutes_of(latest) if latest else None,
+                )
+        else:
+            form = EarliestArrivalForm()
+
+    # ========== CASE 6: Find Longest Route ==========
     elif search_type == 'longest_route':
         # Directly call the longest route function
         result = find_longest_route()
 
+        # Page through the longest and shortest direct routes
+        page = page_number(request)
+        offset = (page - 1) * TOP_ROUTES_PER_PAGE
+        # One extra row tells whether there is a next page
+        longest = top_direct_routes(TOP_ROUTES_PER_PAGE + 1, offset, longest=True)
+        shortest = top_direct_routes(TOP_ROUTES_PER_PAGE + 1, offset, longest=False)
+        top_routes = {
+            'sections': [
+                ('Longest', longest[:TOP_ROUTES_PER_PAGE]),
+                ('Shortest', shortest[:TOP_ROUTES_PER_PAGE]),
+            ],
+            'page': page,
+            'offset': offset,
+            'has_next': len(longest) > TOP_ROUTES_PER_PAGE,
+        }
+
     # Render the template with the form, search type, and result
     return render(request, 'airports/route_search.html', {
         'form': form,
         'search_type': search_type,
-        'result': result
+        'result': result,
+        'top_routes': top_routes,
     })
 
 
@@ -234,96 +627,201 @@ def airport_route_view(request):
 
 def find_nth_node(start_code, direction, n):
     """Find the nth left or right connected airport from a given starting airport."""
+    # Jump along the precomputed left/right chains instead of querying each step
     try:
-        # Get the starting airport object
-        airport = Airport.objects.get(code__iexact=start_code)
-    except Airport.DoesNotExist:
+        code, missing_step = get_chain_index().nth(start_code, direction, n)
+    except KeyError:
         return f"Airport '{start_code}' not found."
 
-    current = airport
-    # Move n times in the given direction (left/right)
-    for i in range(n):
-        next_airport = getattr(current, direction, None)
-        if not next_airport:
-            return f"No {direction} node found at step {i+1} from {start_code}."
-        current = next_airport
+    if code is None:
+        return f"No {direction} node found at step {missing_step} from {start_code}."
+    return f"The {n}th {direction} node from {start_code} is {code}."
 
-    return f"The {n}th {direction} node from {start_code} is {current.code}."
+
+def top_direct_routes(limit, offset=0, longest=True):
+    """
+    Direct routes ordered by duration, as (from, to, duration) tuples.
+
+    One ORDER BY ... LIMIT on the indexed duration column, so the cost
+    depends on offset + limit, not on the number of routes. Ties go to the
+    older route. Of several routes between the same airports only the
+    shortest counts, as in the route graph.
+    """
+    shorter = Route.objects.filter(
+        Q(origin=OuterRef('origin'), destination=OuterRef('destination'))
+        | Q(origin=OuterRef('destination'), destination=OuterRef('origin')),
+        Q(duration__lt=OuterRef('duration')) | Q(duration=OuterRef('duration'), pk__lt=OuterRef('pk')),
+        duration__gt=0,
+    )
+    return list(
+        Route.objects
+        .exclude(duration=0)
+        .exclude(Exists(shorter))
+        .order_by('-duration' if longest else 'duration', 'pk')
+        .values_list('origin__code', 'destination__code', 'duration')[offset:offset + limit]
+    )
 
 
 def find_longest_route():
     """Find the longest available direct route (based on distance/duration)."""
-    airports = Airport.objects.all()
-    longest = None
-    max_distance = 0
-
-    # Loop through all airports and compare left and right route distances
-    for a in airports:
-        # Check left route
-        if a.left_distance and a.left_distance > max_distance:
-            max_distance = a.left_distance
-            longest = (a.code, a.left.code, a.left_distance)
-        # Check right route
-        if a.right_distance and a.right_distance > max_distance:
-            max_distance = a.right_distance
-            longest = (a.code, a.right.code, a.right_distance)
+    longest = top_direct_routes(1)
 
     # Return result message
     if longest:
-        return f"The longest route is between {longest[0]} and {longest[1]} with duration {longest[2]}."
+        code, other, distance = longest[0]
+        return f"The longest route is between {code} and {other} with duration {distance}."
     return "No route data available."
 
 
-def find_duration_between(start_code, end_code):
-    """Find the shortest duration between two airports using Dijkstra’s algorithm."""
-    airports = Airport.objects.all()
-    graph = {}
+def find_duration_between(start_code, end_code, cached_only=False):
+    """
+    Find the shortest duration between two airports using bidirectional Dijkstra.
+    With cached_only=True, returns None instead of running a search.
+    """
+    # Use the shared graph of left and right routes
+    graph = get_graph()
 
-    # Build graph connections with both left and right routes
-    for a in airports:
-        code = a.code.upper()
-        if code not in graph:
-            graph[code] = {}
+    # Validate start and end codes
+    if start_code not in graph or end_code not in graph:
+        return "Invalid airport code."
 
-        # Add bidirectional connection for left route
-        if a.left and a.left_distance:
-            graph[code][a.left.code.upper()] = a.left_distance
-            graph[a.left.code.upper()] = graph.get(a.left.code.upper(), {})
-            graph[a.left.code.upper()][code] = a.left_distance
+    # Airports in different parts of the network can be rejected without a search
+    if not get_component_index().connected(start_code, end_code):
+        return f"No route found between {start_code} and {end_code}."
 
-        # Add bidirectional connection for right route
-        if a.right and a.right_distance:
-            graph[code][a.right.code.upper()] = a.right_distance
-            graph[a.right.code.upper()] = graph.get(a.right.code.upper(), {})
-            graph[a.right.code.upper()][code] = a.right_distance
+    # Read the answer straight from the precomputed matrix when it is current
+    matrix = get_matrix()
+    if matrix is not None and start_code != end_code:
+        dist = matrix.distance(start_code, end_code)
+        if dist == float('inf'):
+            return f"No route found between {start_code} and {end_code}."
+        return f"Shortest duration from {start_code} to {end_code} is {dist}."
 
-    # Validate start and end codes
+    start, end = graph.index[start_code], graph.index[end_code]
+
+    # A cached tree from either airport answers the query without a search
+    tree = tree_cache.peek(graph, start_code, end_code)
+    if tree is not None:
+        dist = tree_distance(graph, tree, start, end)
+        if dist is None:
+            return f"No route found between {start_code} and {end_code}."
+        return f"Shortest duration from {start_code} to {end_code} is {dist}."
+
+    # Another worker may already have answered this pair
+    route_cache.record_origin(start_code)
+    key = route_cache.result_key(graph, 'duration', start_code, end_code)
+    if cached_only:
+        return route_cache.peek(key)
+
+    def search_duration():
+        # Apply bidirectional Dijkstra, searching from both airports at once
+        with timed('search'):
+            search = graph.bidirectional_search(start, end)
+        search_stats.record(search)
+        if search.distance is not None:
+            return f"Shortest duration from {start_code} to {end_code} is {search.distance}."
+
+        # If no path found between the airports
+        return f"No route found between {start_code} and {end_code}."
+
+    return route_cache.cached(key, search_duration)
+
+
+def route_rows(graph, routes):
+    """Template rows for routing.Route results: codes, duration and hops."""
+    return [
+        {'codes': [graph.codes[i] for i in route.path], 'distance': route.distance, 'hops': route.hops}
+        for route in routes
+    ]
+
+
+def hop_limit_text(max_hops):
+    return f" within {max_hops} hops" if max_hops else ""
+
+
+def find_alternative_routes(start_code, end_code, k, max_hops=None):
+    """
+    Find up to k loopless routes between two airports, shortest first,
+    each with its airport sequence.
+    """
+    graph = get_graph()
     if start_code not in graph or end_code not in graph:
         return "Invalid airport code."
+    if start_code == end_code:
+        return "Start and destination are the same airport."
+
+    # Exact distances to the destination guide every search towards it
+    potential = tree_cache.get(graph, end_code).distances
+    with timed('search'):
+        routes = k_shortest_routes(graph, graph.index[start_code], graph.index[end_code],
+                                   k, potential, max_hops)
+    if not routes:
+        return f"No route found between {start_code} and {end_code}{hop_limit_text(max_hops)}."
+    return {
+        'routes': route_rows(graph, routes),
+        'start': start_code,
+        'end': end_code,
+    }
 
-    # Apply Dijkstra’s shortest path algorithm
-    queue = [(0, start_code)]      # Priority queue with (distance, airport)
-    distances = {start_code: 0}    # Store shortest known distances
-    visited = set()                # Track visited airports
 
-    while queue:
-        dist, node = heapq.heappop(queue)
+def find_fewest_hops(start_code, end_code, max_hops=None):
+    """Find the route with the fewest stops between two airports."""
+    graph = get_graph()
+    if start_code not in graph or end_code not in graph:
+        return "Invalid airport code."
+    if start_code == end_code:
+        return "Start and destination are the same airport."
 
-        # If we reach the destination, return total duration
-        if node == end_code:
-            return f"Shortest duration from {start_code} to {end_code} is {dist}."
+    route = fewest_hops_route(graph, graph.index[start_code], graph.index[end_code], max_hops)
+    if route is None:
+        return f"No route found between {start_code} and {end_code}{hop_limit_text(max_hops)}."
+    return {
+        'routes': route_rows(graph, [route]),
+        'start': start_code,
+        'end': end_code,
+    }
 
-        # Skip already visited nodes
-        if node in visited:
-            continue
-        visited.add(node)
 
-        # Explore neighbors and update distances
-        for neighbor, d in graph[node].items():
-            new_dist = dist + d
-            if neighbor not in distances or new_dist < distances[neighbor]:
-                distances[neighbor] = new_dist
-                heapq.heappush(queue, (new_dist, neighbor))
+def minutes_of(time):
+    return time.hour * 60 + time.minute
+
 
-    # If no path found between the airports
-    return f"No route found between {start_code} and {end_code}."
+def journey_rows(timetable, journeys):
+    """Template rows for schedules.Journey results: times and one line per leg."""
+    rows = []
+    for journey in journeys:
+        legs = []
+        for c in journey.legs:
+            code, other, departs, arrives = timetable.leg(c)
+            legs.append(f"{code} {clock(departs)} → {other} {clock(arrives)}")
+        rows.append({'departs': clock(journey.departs), 'arrives': clock(journey.arrives), 'legs': legs})
+    return rows
+
+
+def find_earliest_arrival(start_code, end_code, depart_at, latest_departure=None):
+    """
+    Find the scheduled journey arriving first when leaving start at
+    depart_at (minutes after midnight). With latest_departure, find the
+    best journey for every departure up to then in one profile search.
+    """
+    timetable = get_timetable()
+    graph = timetable.graph
+    if start_code not in graph or end_code not in graph:
+        return "Invalid airport code."
+    if start_code == end_code:
+        return "Start and destination are the same airport."
+
+    start, end = graph.index[start_code], graph.index[end_code]
+    with timed('search'):
+        if latest_departure is None:
+            journey = timetable.earliest_arrival(start, end, depart_at, min_transfer())
+            journeys = [journey] if journey else []
+        else:
+            journeys = timetable.profile(start, end, depart_at, latest_departure, min_transfer())
+    if not journeys:
+        return f"No scheduled journey from {start_code} to {end_code} after {clock(depart_at)}."
+    return {
+        'journeys': journey_rows(timetable, journeys),
+        'start': start_code,
+        'end': end_code,
+    }
@@ -0,0 +1,117 @@
+"""
+Process pool for route searches issued by the async views.
+
+Each pool process keeps its own warm copy of the route graph (and its own
+tree cache) and checks it against the graph source sent with every task
+(see graph_source), rebuilding only when the parent has seen an edit. A
+process that still disagrees after rebuilding refuses the task with
+StaleGraph rather than answer from another graph.
+Identical searches that arrive while one is already running share its
+result instead of queueing another computation.
+
+With ROUTE_WORKER_PROCESSES = 0 searches run on Django's sync thread
+instead, which is what the tests and the development server use.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+_lock = threading.Lock()
+_executor = None
+_inflight = {}
+
+
+class StaleGraph(Exception):
+    """The pool process could not load the graph the search was issued on."""
+
+
+def _init_worker():
+    """Set up Django in a fresh pool process and load the graph."""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    from .graph import get_graph
+    get_graph()
+
+
+def _run_search(kind, args, source):
+    """Run one search against the graph loaded from source."""
+    from .graph import graph_source, invalidate_graph
+    from . import views
+
+    if source != graph_source():
+        # The parent may have read the edit count more recently
+        invalidate_graph()
+        if source != graph_source():
+            raise StaleGraph(f"Graph source {graph_source()!r}, expected {source!r}")
+
+    if kind == 'shortest_path':
+        return views.find_shortest_path(*args)
+    if kind == 'duration_between':
+        return views.find_duration_between(*args)
+    raise ValueError(f"Unknown search '{kind}'")
+
+
+def pool_size():
+    size = getattr(settings, 'ROUTE_WORKER_PROCESSES', None)
+    if size is None:
+        return os.cpu_count() or 1
+    return size
+
+
+def get_executor():
+    """The shared process pool, or None when searches run in-process."""
+    global _executor
+    if _executor is None and pool_size() > 0:
+        with _lock:
+            if _executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+                _executor = ProcessPoolExecutor(
+                    max_workers=pool_size(),
+                    mp_context=context,
+                    initializer=_init_worker,
+                )
+    return _executor
+
+
+async def run_search(kind, *args):
+    """
+    Run a search off the event loop. Concurrent calls with the same
+    arguments on the same graph await a single computation. A search the
+    pool process could not run on this process's graph is retried once
+    with the edit count read again, then StaleGraph is raised.
+    """
+    from .graph import graph_source
+    from . import versions
+
+    try:
+        return await _shared_search(kind, args, await sync_to_async(graph_source)())
+    except StaleGraph:
+        versions.expire()
+        return await _shared_search(kind, args, await sync_to_async(graph_source)())
+
+
+async def _shared_search(kind, args, source):
+    key = (kind, args, source)
+    future = _inflight.get(key)
+    if future is None:
+        executor = get_executor()
+        if executor is None:
+            future = asyncio.ensure_future(sync_to_async(_run_search)(kind, args, source))
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(executor, _run_search, kind, args, source)
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    # One client disconnecting must not cancel the search for the others
+    return await asyncio.shield(future)
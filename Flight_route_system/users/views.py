@@ -6,8 +6,12 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from .forms import UserRegisterForm, AdminRegisterForm
+from airport.components import get_component_index
+from airport.models import AirportStats
 
 
+# Airports listed under Hubs on the admin dashboard
+TOP_HUBS = 10
 
 
 def home_redirect(request):
@@ -52,7 +56,13 @@ def login_view(request):
 @login_required
 def dashboard_view(request):
     if request.user.is_admin:
-        return render(request, 'users/admin_dashboard.html')
+        # Fragmentation of the route network, from the component index, and
+        # the top hubs from the last compute_airport_stats run
+        hubs = AirportStats.objects.select_related('airport').order_by('-betweenness')[:TOP_HUBS]
+        return render(request, 'users/admin_dashboard.html', {
+            'network': get_component_index().stats(),
+            'hubs': hubs,
+        })
     return render(request, 'users/user_dashboard.html')
 
 @login_required